@@ -4,58 +4,304 @@
 
 """Charmed operator for the 5G SIMAPP service."""
 
+import hashlib
+import json
 import logging
+import os
+import re
+import time
+from contextlib import nullcontext
+from functools import cached_property
 from ipaddress import IPv4Address
+from pathlib import Path
+from socket import gaierror, gethostbyname, gethostname
 from subprocess import check_output
-from typing import Optional
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
 
-from charms.observability_libs.v1.kubernetes_service_patch import KubernetesServicePatch
-from lightkube.models.core_v1 import ServicePort
-from ops.charm import ActionEvent, CharmBase, ConfigChangedEvent, PebbleReadyEvent
+import yaml
+from ops.charm import (
+    ActionEvent,
+    CharmBase,
+    CharmEvents,
+    ConfigChangedEvent,
+    PebbleCheckEvent,
+    PebbleReadyEvent,
+    RelationEvent,
+)
+from ops.framework import EventBase, EventSource, PreCommitEvent, StoredState
 from ops.main import main
-from ops.model import ActiveStatus, BlockedStatus, WaitingStatus
-from ops.pebble import Layer
+from ops.model import ActiveStatus, BlockedStatus, Relation, WaitingStatus
+from ops.pebble import APIError, CheckLevel, CheckStatus
+from ops.pebble import ConnectionError as PebbleConnectionError
+from ops.pebble import ExecError, Layer, PathError
+
+from charm_metrics import CharmMetrics
+from config_delta import config_snapshot, delta_config, diff_snapshots
+from config_payload import PayloadError, base64_chunks, decompress_chunks
+from config_template import load_template, options_digest, render_template, template_options
+from config_validator import ConfigValidationError, validate_config
+from kubernetes_resource_patch import KubernetesResourcePatch, resources_for
+from kubernetes_service_patch import KubernetesServicePatch
+from metrics_endpoint import MetricsEndpointProvider
+from pebble_cache import PebbleQueryCache
+from sharding import Shard, shard_config, unit_shard
+from simapp_config import compact_config, load_config, render_config, subscriber_count
+from snapshot_store import SnapshotError, SnapshotStore
+from streaming_push import ChunkedReader, push_stream, read_chunks
+from subscriber_generator import DETERMINISTIC, Population, PopulationError, generate_config
+from tracing import Tracer, otlp_http_endpoint, post_trace, traced_handler, write_trace_file
 
 logger = logging.getLogger(__name__)
 
 BASE_CONFIG_PATH = "/simapp/config"
 CONFIG_FILE_NAME = "simapp.yaml"
+DEFAULT_CONFIG_FILE_PATH = "src/files/default_config.yaml"
+CHARM_METRICS_FILE_NAME = "charm-metrics.prom"
+CHARM_METRICS_EXPORTER_FILE_PATH = "src/files/charm_metrics_exporter.sh"
+CHARM_METRICS_EXPORTER_PATH = "/simapp/bin/charm-metrics-exporter"
+SNAPSHOTS_DIRECTORY_NAME = "snapshots"
+PROMETHEUS_PORT = 9089
+CHARM_METRICS_PORT = 9090
+CONFIG_EXPORTER_PORT = 8080
+# A ready check is reported down after this many consecutive failures, one per period
+CHECK_PERIOD_SECONDS = 10
+CHECK_THRESHOLD = 3
+# Service fields Pebble serialises as Go durations
+PEBBLE_DURATION_FIELDS = ("backoff-delay", "backoff-limit", "kill-delay")
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(h|ms|us|µs|ns|m|s)")
+DURATION_UNITS = {"h": 3600, "m": 60, "s": 1, "ms": 1e-3, "us": 1e-6, "µs": 1e-6, "ns": 1e-9}
+RESOURCE_OPTIONS = ("cpu-request", "cpu-limit", "memory-request", "memory-limit")
+PEERS_RELATION_NAME = "simapp-peers"
+# Peer unit data key holding the size of the config the unit applied
+CONFIG_COUNTS_KEY = "config-counts"
+
+
+class ReconcileEvent(EventBase):
+    """Event deferred while the workload can't be reconciled yet."""
+
+
+class SIMAPPCharmEvents(CharmEvents):
+    """Events emitted by the 5G SIMAPP operator."""
+
+    reconcile = EventSource(ReconcileEvent)
 
 
 class SIMAPPOperatorCharm(CharmBase):
     """Main class to describe juju event handling for the 5G SIMAPP operator."""
 
+    on = SIMAPPCharmEvents()
+    _stored = StoredState()
+
     def __init__(self, *args):
         super().__init__(*args)
+        self._dispatch_start = time.monotonic()
+        self.tracer = Tracer(
+            "simapp-charm",
+            {"juju.unit": self.unit.name, "juju.model": self.model.name, "juju.hook": _hook()},
+        )
+        self._dispatch_span = self.tracer.start(f"dispatch {_hook()}")
+        self.tracer.activate(self._dispatch_span)
+        self._stored.set_default(
+            config_digest="",
+            layer_digest="",
+            restart_pending=False,
+            reconcile_pending=False,
+            coalesced_reconciles=0,
+            metrics={},
+            config_snapshot={},
+            config_counts={},
+            resources_digest="",
+            charm_metrics_exporter=None,
+            checks_settle_time=0.0,
+        )
+        self._metrics = CharmMetrics(self._stored.metrics)
+        self._publish_metrics = False
         self._container_name = self._service_name = "simapp"
-        self._container = self.unit.get_container(self._container_name)
+        self._container = PebbleQueryCache(
+            self,
+            self.unit.get_container(self._container_name),
+            refresh_events=[
+                self.on.config_changed,
+                self.on.configure_network_action,
+                self.on.generate_subscribers_action,
+                self.on.rollback_action,
+                self.on.simapp_pebble_ready,
+                self.on.simapp_pebble_check_failed,
+                self.on.simapp_pebble_check_recovered,
+                self.on.reconcile,
+                self.on.simapp_peers_relation_joined,
+                self.on.simapp_peers_relation_departed,
+                self.on.update_status,
+            ],
+            tracer=self.tracer,
+        )
+        self._resource_patcher = KubernetesResourcePatch(
+            self, self._container_name, trace=self.tracer.client_span
+        )
         self.framework.observe(self.on.config_changed, self._on_config_changed)
         self.framework.observe(self.on.configure_network_action, self._on_configure_network_action)
+        self.framework.observe(
+            self.on.generate_subscribers_action, self._on_generate_subscribers_action
+        )
+        self.framework.observe(self.on.rollback_action, self._on_rollback_action)
         self.framework.observe(self.on.simapp_pebble_ready, self._on_simapp_pebble_ready)
+        self.framework.observe(self.on.reconcile, self._on_reconcile)
+        self.framework.observe(self.on.simapp_peers_relation_joined, self._on_peers_changed)
+        self.framework.observe(self.on.simapp_peers_relation_departed, self._on_peers_changed)
+        self.framework.observe(
+            self.on.simapp_peers_relation_changed, self._on_peers_relation_changed
+        )
+        self.framework.observe(self.on.upgrade_charm, self._on_resources_outdated)
+        self.framework.observe(self.on.leader_elected, self._on_resources_outdated)
+        self.framework.observe(self.on.update_status, self._on_update_status)
+        self.framework.observe(self.on.simapp_pebble_check_failed, self._on_simapp_check_changed)
+        self.framework.observe(
+            self.on.simapp_pebble_check_recovered, self._on_simapp_check_changed
+        )
+        self.framework.observe(self.on.tracing_relation_joined, self._on_tracing_relation_joined)
+        self.framework.observe(self.framework.on.pre_commit, self._on_pre_commit)
+        self.framework.observe(self.framework.on.commit, self._on_commit)
+        self._metrics_endpoint = MetricsEndpointProvider(
+            self, jobs=self._scrape_jobs, refresh_event=self.on.simapp_pebble_ready
+        )
         self._service_patcher = KubernetesServicePatch(
             charm=self,
             ports=[
-                ServicePort(name="prometheus-exporter", port=9089),
-                ServicePort(name="config-exporter", port=8080),
+                {"name": "prometheus-exporter", "port": PROMETHEUS_PORT},
+                {"name": "charm-metrics-exporter", "port": CHARM_METRICS_PORT},
+                {"name": "config-exporter", "port": CONFIG_EXPORTER_PORT},
             ],
+            server_side_apply=True,
+            asynchronous=True,
+            trace=self.tracer.client_span,
         )
 
+    @traced_handler
     def _on_config_changed(self, event: ConfigChangedEvent) -> None:
+        self._reconcile()
+
+    @traced_handler
+    def _on_simapp_pebble_ready(self, event: PebbleReadyEvent) -> None:
+        self._reconcile()
+
+    @traced_handler
+    def _on_peers_changed(self, event: RelationEvent) -> None:
+        """Rebalances subscriber shards when units join or leave."""
+        if self._shard_subscribers:
+            self._reconcile()
+
+    @traced_handler
+    def _on_peers_relation_changed(self, event: RelationEvent) -> None:
+        """Resizes the workload containers when a unit shares new config counts."""
+        if self.unit.is_leader():
+            self._patch_resources()
+
+    @traced_handler
+    def _on_resources_outdated(self, event: EventBase) -> None:
+        """Patches the workload resources again after an upgrade or a change of leader.
+
+        Juju may reset the StatefulSet's pod template when the charm is upgraded, and a new
+        leader's digest may predate resources patched since by another leader.
+        """
+        self._stored.resources_digest = ""
+        self._patch_resources()
+
+    @traced_handler
+    def _on_pre_commit(self, event: PreCommitEvent) -> None:
+        """Records the dispatch duration and publishes charm metrics if the workload changed.
+
+        Metrics are written as a Prometheus textfile next to the simapp config, which the
+        charm metrics exporter serves to Prometheus. To avoid a
+        Pebble round trip on every hook, they are only published by dispatches that already
+        pushed a config or replanned; other dispatches accumulate until the next publication.
+        Publication is best effort: the workload may have gone away during the dispatch, and
+        failing the dispatch would discard the state it recorded about the workload.
+        """
+        self._metrics.observe(
+            "simapp_charm_hook_duration_seconds",
+            time.monotonic() - self._dispatch_start,
+            hook=_hook(),
+        )
+        self._metrics.set("simapp_charm_coalesced_reconciles_total", self.coalesced_reconciles)
+        publish = self._publish_metrics and self._container.can_connect()
+        for query, hits in self._container.hits.items():
+            self._metrics.inc("simapp_charm_pebble_cache_hits_total", hits, query=query)
+        for query, misses in self._container.misses.items():
+            self._metrics.inc("simapp_charm_pebble_cache_misses_total", misses, query=query)
+        if not publish:
+            return
+        try:
+            self._container.push(
+                path=f"{BASE_CONFIG_PATH}/{CHARM_METRICS_FILE_NAME}",
+                source=self._metrics.render(),
+            )
+        except (PebbleConnectionError, APIError, PathError) as e:
+            logger.warning("Could not publish charm metrics: %s", e)
+
+    def _on_commit(self, event: EventBase) -> None:
+        """Ends the dispatch trace and exports it to the trace file and the tracing collector.
+
+        Export failures are logged, they never fail the dispatch. The framework only commits
+        dispatches that succeeded, so the traces of failing dispatches are never exported.
+        """
+        self.tracer.end(self._dispatch_span)
+        document = self.tracer.to_otlp()
+        if trace_file := self.model.config.get("tracing-file"):
+            try:
+                write_trace_file(trace_file, document)
+            except OSError as e:
+                logger.warning("Could not write trace file %s: %s", trace_file, e)
+        relation = self.model.get_relation("tracing")
+        if relation and relation.app:
+            endpoint = otlp_http_endpoint(relation.data[relation.app].get("receivers"))
+            if endpoint:
+                try:
+                    post_trace(endpoint, document)
+                except OSError as e:
+                    logger.warning("Could not export trace to %s: %s", endpoint, e)
+
+    @traced_handler
+    def _on_tracing_relation_joined(self, event: RelationEvent) -> None:
+        """Requests an OTLP/HTTP receiver from the tracing collector."""
+        if self.unit.is_leader():
+            event.relation.data[self.app]["receivers"] = json.dumps(["otlp_http"])
+
+    @traced_handler
+    def _on_reconcile(self, event: ReconcileEvent) -> None:
+        """Runs a deferred reconcile, unless a more recent one already succeeded."""
+        if not self._stored.reconcile_pending:
+            self._stored.coalesced_reconciles += 1
+            logger.info("Dropping deferred reconcile, workload was reconciled since")
+            return
         if not self._container.can_connect():
             self.unit.status = WaitingStatus("Waiting for container to be ready")
             event.defer()
             return
-        if self._use_default_config:
-            self._write_default_config()
-            self._on_simapp_pebble_ready(event)
+        self._reconcile()
 
-    def _on_simapp_pebble_ready(
-        self, event: [PebbleReadyEvent, ConfigChangedEvent, ActionEvent]
-    ) -> None:
+    def _reconcile(self) -> None:
+        """Converges the workload on the desired config file and pebble layer.
+
+        This is the single entry point for every trigger. When the container isn't reachable,
+        at most one reconcile is deferred; further triggers are coalesced into it instead of
+        being deferred themselves and replayed on every subsequent dispatch.
+        """
         if not self._container.can_connect():
             self.unit.status = WaitingStatus("Waiting for container to be ready")
-            event.defer()
+            if self._stored.reconcile_pending:
+                self._stored.coalesced_reconciles += 1
+                logger.info("Reconcile already deferred, coalescing trigger")
+            else:
+                self._stored.reconcile_pending = True
+                self.on.reconcile.emit()
             return
+        self._stored.reconcile_pending = False
+        if self._use_default_config:
+            try:
+                self._write_default_config()
+            except ConfigValidationError as e:
+                self.unit.status = BlockedStatus(f"Invalid config: {e.message}")
+                return
         if not self._config_file_is_written:
             if self._use_default_config:
                 self.unit.status = WaitingStatus("Waiting for config file to be written")
@@ -64,20 +310,272 @@ class SIMAPPOperatorCharm(CharmBase):
                     "Use `juju scp` to copy the config file to the unit and run the `configure-network` action"  # noqa: E501, W505
                 )
             return
-        self._container.add_layer("simapp", self._pebble_layer, combine=True)
-        self._container.replan()
+        self._apply_pebble_layer()
+        self._set_readiness_status()
+        self._patch_resources()
+
+    @traced_handler
+    def _on_update_status(self, event: EventBase) -> None:
+        """Refreshes the unit status from the workload's health checks.
+
+        Charm metrics are also published, so that the ones served to Prometheus are never older
+        than the update-status interval.
+        """
+        if not self._container.can_connect() or not self._stored.layer_digest:
+            return
+        self._publish_metrics = True
+        if isinstance(self.unit.status, BlockedStatus):
+            return
+        self._set_readiness_status()
+
+    @traced_handler
+    def _on_simapp_check_changed(self, event: PebbleCheckEvent) -> None:
+        """Refreshes the unit status when one of simapp's health checks fails or recovers."""
+        if not self._container.can_connect() or not self._stored.layer_digest:
+            return
+        if isinstance(self.unit.status, BlockedStatus):
+            return
+        self._set_readiness_status()
+
+    def _set_readiness_status(self) -> None:
+        """Sets ActiveStatus only if simapp is running and its ready checks are up.
+
+        Checks keep the status they had before simapp was (re)started until they fail
+        `CHECK_THRESHOLD` times in a row, so they are only trusted once that long has passed
+        since simapp was last replanned or restarted. Until then, the unit waits and is
+        promoted by the next update-status or check event.
+        """
+        if not self._container.get_service(self._service_name).is_running():
+            self.unit.status = WaitingStatus("Waiting for simapp service to run")
+            return
+        down_checks = [
+            name
+            for name, check in self._container.get_checks(level=CheckLevel.READY).items()
+            if check.status != CheckStatus.UP
+        ]
+        if down_checks:
+            self.unit.status = WaitingStatus(
+                f"Waiting for simapp to be ready: {', '.join(sorted(down_checks))} down"
+            )
+            return
+        if time.time() < self._stored.checks_settle_time:
+            self.unit.status = WaitingStatus("Waiting for simapp health checks to run")
+            return
         self.unit.status = ActiveStatus()
 
+    @property
+    def coalesced_reconciles(self) -> int:
+        """Number of redundant reconcile runs avoided by coalescing triggers."""
+        return self._stored.coalesced_reconciles
+
+    def _apply_pebble_layer(self) -> None:
+        """Applies the pebble layer, restarting simapp only when something changed.
+
+        The layer is only added and replanned when its digest differs from the last applied
+        one, or when a service in the current plan differs from the desired one (e.g. after a
+        container restart). A replan only restarts the services whose definition changed, so
+        simapp is also restarted if a new config file was pushed since it last started and the
+        replan left it running.
+        """
+        self._detect_charm_metrics_exporter()
+        layer = self._pebble_layer
+        layer_digest = _digest(layer.to_yaml())
+        changed_services = self._changed_services(layer)
+        replan = layer_digest != self._stored.layer_digest or bool(changed_services)
+        if replan:
+            if self._stored.charm_metrics_exporter:
+                self._push_charm_metrics_exporter()
+            self._container.add_layer("simapp", layer, combine=True)
+            self._container.replan()
+            self._stored.layer_digest = layer_digest
+            self._metrics.inc("simapp_charm_replans_total")
+            self._publish_metrics = True
+            logger.info("Pebble layer applied")
+        restart = self._stored.restart_pending and self._service_name not in changed_services
+        if restart:
+            self._container.restart(self._service_name)
+            self._metrics.inc("simapp_charm_restarts_total")
+            self._publish_metrics = True
+            logger.info("Service restarted to load new config file")
+        elif not replan:
+            logger.info("Pebble layer and config file unchanged, skipping replan")
+        if restart or self._service_name in changed_services:
+            self._stored.checks_settle_time = time.time() + CHECK_PERIOD_SECONDS * CHECK_THRESHOLD
+        self._stored.restart_pending = False
+
     def _write_default_config(self) -> None:
-        with open("src/files/default_config.yaml", "r") as f:
-            content = f.read()
-        self._container.push(source=content, path=f"{BASE_CONFIG_PATH}/{CONFIG_FILE_NAME}")
+        """Renders the default config model and streams it to the workload.
+
+        The default config template is rendered with the charm config options that override
+        it. Rendering is skipped altogether when neither the template, the options nor the
+        shard changed since the last push.
+
+        IMSI ranges are expanded while rendering and the rendered chunks are uploaded as they
+        are produced, so the expanded config is never held in memory.
+
+        Only the subscribers, device groups and network slices that were added or modified
+        since the last push are rendered, so that simapp doesn't provision the whole population
+        again. Removed ones are only logged: simapp never deprovisions them. Changes to any
+        other part of the config trigger a full resync.
+
+        Raises:
+            ConfigValidationError: if the default config is invalid, in which case nothing is
+                pushed.
+        """
+        template = load_template(str(self.charm_dir / DEFAULT_CONFIG_FILE_PATH))
+        options = template_options(self.model.config)
+        shard_index, shard_count = self._shard
+        config_digest = options_digest(template, options, f"{shard_index}/{shard_count}")
+        if config_digest == self._stored.config_digest and self._config_file_is_written:
+            logger.info("Default config file unchanged, skipping push")
+            return
+        config = render_template(template, options)
+        validate_config(config)
+        if shard_count > 1:
+            config = shard_config(config, shard_index, shard_count)
+            validate_config(config)
+            logger.info("Rendering subscriber shard %d of %d", shard_index + 1, shard_count)
+        config, _ = self._compact_config(config)
+        snapshot = config_snapshot(config)
+        previous_snapshot = self._stored.config_snapshot if self._config_file_is_written else None
+        delta = diff_snapshots(previous_snapshot, snapshot)
+        if delta.is_empty:
+            logger.info("Default config has no provisioning changes, skipping push")
+            self._stored.config_digest = config_digest
+            return
+        logger.info("Provisioning config delta: %s", delta.summary())
+        if delta.full_resync:
+            self._push_config(render_config(config), source="default-config")
+        else:
+            self._push_config(render_config(delta_config(config, delta)))
+            # The delta isn't a complete config, so the full config is rendered a second time
+            # to be recorded, unless snapshots are disabled
+            if self._snapshot_store:
+                self._save_snapshot(render_config(config), source="default-config")
+        self._record_config_metrics(config)
+        self._stored.config_digest = config_digest
+        self._stored.config_snapshot = snapshot
+        self._stored.restart_pending = True
         logger.info("Default config file written")
 
+    def _push_config(
+        self, chunks: Iterable[Union[str, bytes]], source: Optional[str] = None
+    ) -> int:
+        """Streams a config file to the workload and records push metrics.
+
+        Given a source, the file is recorded as a new revision of the snapshot store while it is
+        streamed. Recording is best effort: failures are logged and never block the push.
+
+        Args:
+            chunks: Chunks of the config file.
+            source: Where the config file comes from, recorded with its revision. The file
+                isn't recorded if None, e.g. when it is only a delta of the config.
+
+        Returns:
+            int: Number of bytes sent to the workload.
+        """
+        push_start = time.monotonic()
+        snapshot_store = self._snapshot_store if source else None
+        try:
+            with snapshot_store.recording(source) if snapshot_store else nullcontext() as recorder:
+                pushed_bytes = push_stream(
+                    container=self._container,
+                    path=f"{BASE_CONFIG_PATH}/{CONFIG_FILE_NAME}",
+                    chunks=recorder.tee(chunks) if recorder else chunks,
+                    compress=self._compress_config_push,
+                )
+        except SnapshotError as e:
+            logger.warning("Could not record config file snapshot: %s", e.message)
+        self._metrics.observe(
+            "simapp_charm_config_push_duration_seconds", time.monotonic() - push_start
+        )
+        self._metrics.set("simapp_charm_config_push_bytes", pushed_bytes)
+        self._metrics.inc("simapp_charm_config_pushes_total")
+        return pushed_bytes
+
     @property
     def _use_default_config(self) -> bool:
         return bool(self.model.config["use-default-config"])
 
+    @property
+    def _compress_config_push(self) -> bool:
+        return bool(self.model.config["compress-config-push"])
+
+    @property
+    def _snapshot_store(self) -> Optional[SnapshotStore]:
+        """Returns the snapshot store, None if disabled or if the storage isn't attached."""
+        history = int(self.model.config.get("snapshot-history", 0))
+        storage_root = self._storage_root
+        if not history or not storage_root:
+            return None
+        return SnapshotStore(storage_root / SNAPSHOTS_DIRECTORY_NAME, history)
+
+    @property
+    def _storage_root(self) -> Optional[Path]:
+        """Returns where the `simapp-volume` storage is mounted in the charm container."""
+        storages = self.model.storages["simapp-volume"]
+        return storages[0].location.resolve() if storages else None
+
+    @property
+    def _shard_subscribers(self) -> bool:
+        return bool(self.model.config["shard-subscribers"])
+
+    @property
+    def _shard(self) -> Shard:
+        """Returns the index of this unit's shard and the number of shards."""
+        peers_relation = self.model.get_relation(PEERS_RELATION_NAME)
+        if not self._shard_subscribers or not peers_relation:
+            return 0, 1
+        return unit_shard(self.unit.name, (unit.name for unit in peers_relation.units))
+
+    def _changed_services(self, layer: Layer) -> List[str]:
+        """Returns the services of `layer` that the current plan doesn't run as described."""
+        planned_services = self._container.get_plan().services
+        return [
+            name
+            for name, service in layer.services.items()
+            if name not in planned_services
+            or _normalize_durations(planned_services[name].to_dict())
+            != _normalize_durations(service.to_dict())
+        ]
+
+    def _detect_charm_metrics_exporter(self) -> None:
+        """Checks whether the workload image has the `nc` the charm metrics exporter needs.
+
+        The check runs once per workload container, before simapp is first planned in it. The
+        exporter and its scrape job are only added when `nc` is there.
+        """
+        planned = self._service_name in self._container.get_plan().services
+        if planned and self._stored.charm_metrics_exporter is not None:
+            return
+        try:
+            self._container.exec(["/bin/sh", "-c", "command -v nc"]).wait()
+            available = True
+        except (ExecError, APIError) as e:
+            logger.warning("Charm metrics won't be served, `nc` isn't usable in simapp: %s", e)
+            available = False
+        if available != self._stored.charm_metrics_exporter:
+            self._stored.charm_metrics_exporter = available
+            self._metrics_endpoint.update_scrape_job_spec(self._scrape_jobs)
+
+    @property
+    def _scrape_jobs(self) -> List[dict]:
+        """Returns the scrape jobs of simapp's exporter and, if it runs, the charm's exporter."""
+        jobs = [{"job_name": "simapp", "static_configs": [{"targets": [f"*:{PROMETHEUS_PORT}"]}]}]
+        if self._stored.charm_metrics_exporter:
+            jobs.append(
+                {
+                    "job_name": "simapp-charm",
+                    "static_configs": [{"targets": [f"*:{CHARM_METRICS_PORT}"]}],
+                }
+            )
+        return jobs
+
+    def _push_charm_metrics_exporter(self) -> None:
+        """Pushes the exporter serving the charm metrics textfile to the workload."""
+        with open(self.charm_dir / CHARM_METRICS_EXPORTER_FILE_PATH) as f:
+            self._container.push(CHARM_METRICS_EXPORTER_PATH, f, permissions=0o755, make_dirs=True)
+
     @property
     def _config_file_is_written(self) -> bool:
         if not self._container.exists(f"{BASE_CONFIG_PATH}/{CONFIG_FILE_NAME}"):
@@ -86,14 +584,363 @@ class SIMAPPOperatorCharm(CharmBase):
         logger.info("Config file is written")
         return True
 
+    def _compact_config(self, config: dict) -> Tuple[dict, dict]:
+        """Coalesces the device group IMSIs of an ingested config into sorted ranges.
+
+        simapp only reads explicit `imsis` lists, so the file it reads keeps them expanded:
+        compaction applies to the charm's config model, which is then rendered, hashed and
+        compared as ranges.
+
+        Args:
+            config: The config model, as loaded from YAML.
+
+        Returns:
+            Tuple[dict, dict]: The compacted config and the action results describing it.
+        """
+        config, compaction = compact_config(config)
+        self._metrics.set("simapp_charm_config_imsi_compaction_ratio", compaction.ratio)
+        logger.info(
+            "Compacted %d IMSI entries into %d ranges (ratio %.1f)",
+            compaction.entries,
+            compaction.ranges,
+            compaction.ratio,
+        )
+        return config, {
+            "imsi-ranges": compaction.ranges,
+            "imsi-compaction-ratio": round(compaction.ratio, 1),
+        }
+
+    def _record_config_metrics(self, config: dict, subscribers: Optional[int] = None) -> None:
+        configuration = config.get("configuration") or {}
+        if subscribers is None:
+            subscribers = subscriber_count(config)
+        device_groups = len(configuration.get("device-groups") or [])
+        self._metrics.set("simapp_charm_config_subscribers", subscribers)
+        self._metrics.set("simapp_charm_config_device_groups", device_groups)
+        self._stored.config_counts = {"subscribers": subscribers, "device-groups": device_groups}
+
+    def _patch_resources(self) -> None:
+        """Right-sizes the workload containers for the largest config applied by a unit.
+
+        Every unit shares the size of its applied config with its peers, since units may
+        provision different shards while their pods share the StatefulSet's pod template.
+        Resources come from the `*-request` and `*-limit` options or from the largest config.
+        The leader only patches the StatefulSet when they change, since patching it restarts
+        the pods.
+        """
+        peers_relation = self.model.get_relation(PEERS_RELATION_NAME)
+        if peers_relation and self._stored.config_counts:
+            config_counts = json.dumps(dict(self._stored.config_counts), sort_keys=True)
+            unit_data = peers_relation.data[self.unit]
+            if unit_data.get(CONFIG_COUNTS_KEY) != config_counts:
+                unit_data[CONFIG_COUNTS_KEY] = config_counts
+        if not self.unit.is_leader():
+            return
+        units_config_counts = self._units_config_counts(peers_relation)
+        if not units_config_counts:
+            return
+        resources = resources_for(
+            subscribers=max(counts["subscribers"] for counts in units_config_counts),
+            device_groups=max(counts["device-groups"] for counts in units_config_counts),
+            overrides={option: self.model.config.get(option) for option in RESOURCE_OPTIONS},
+        )
+        resources_digest = _digest(json.dumps(resources, sort_keys=True))
+        if resources_digest == self._stored.resources_digest:
+            return
+        if self._resource_patcher.apply(resources):
+            self._stored.resources_digest = resources_digest
+
+    def _units_config_counts(self, peers_relation: Optional[Relation]) -> List[dict]:
+        """Returns the sizes of the configs applied by this unit and the peers that shared one."""
+        units_config_counts = (
+            [dict(self._stored.config_counts)] if self._stored.config_counts else []
+        )
+        if peers_relation:
+            units_config_counts.extend(
+                json.loads(peers_relation.data[unit][CONFIG_COUNTS_KEY])
+                for unit in peers_relation.units
+                if CONFIG_COUNTS_KEY in peers_relation.data[unit]
+            )
+        return units_config_counts
+
+    def _validate_config_file(self) -> dict:
+        """Parses the config file written to the workload once and validates it.
+
+        Returns:
+            dict: The parsed config.
+
+        Raises:
+            ConfigValidationError: if the config file is invalid.
+        """
+        with self._container.pull(f"{BASE_CONFIG_PATH}/{CONFIG_FILE_NAME}") as config_file:
+            try:
+                config = load_config(config_file)
+            except yaml.YAMLError as e:
+                raise ConfigValidationError(f"Config file is not valid YAML: {e}")
+        validate_config(config)
+        return config
+
+    @traced_handler
     def _on_configure_network_action(self, event: ActionEvent) -> None:
+        """Applies the config file given inline, read from storage or already in the workload.
+
+        Args:
+            event: Juju action event
+        """
         if not self._container.can_connect():
             event.fail(message="Container is not ready")
             return
-        if not self._config_file_is_written:
-            event.fail(message="Config file is not written")
+        payload, path = event.params.get("payload"), event.params.get("path")
+        if payload and path:
+            event.fail(message="Only one of `payload` and `path` can be set")
+            return
+        if (payload or path) and self._use_default_config:
+            event.fail(message="Unset `use-default-config` to apply a custom config")
+            return
+        if self._use_default_config:
+            # The config file may only hold the last delta of the default config, so it is
+            # neither parsed nor recorded: the default config is applied again instead
+            self._stored.restart_pending = True
+            self._reconcile()
+            event.set_results({"subscribers": self._stored.config_counts.get("subscribers", 0)})
+            return
+        results = {}
+        try:
+            if payload or path:
+                config, results = self._apply_config_source(payload=payload, path=path)
+            elif not self._config_file_is_written:
+                event.fail(message="Config file is not written")
+                return
+            else:
+                config = self._validate_config_file()
+                self._snapshot_config_file()
+            config, compaction_results = self._compact_config(config)
+        except PayloadError as e:
+            event.fail(message=f"Invalid payload: {e.message}")
             return
-        self._on_simapp_pebble_ready(event)
+        except ConfigValidationError as e:
+            self.unit.status = BlockedStatus(f"Invalid config: {e.message}")
+            event.fail(message=f"Invalid config: {e.message}")
+            return
+        self._record_config_metrics(config)
+        self._stored.restart_pending = True
+        self._reconcile()
+        event.set_results(
+            {**results, **compaction_results, "subscribers": subscriber_count(config)}
+        )
+
+    def _apply_config_source(
+        self, payload: Optional[str] = None, path: Optional[str] = None
+    ) -> Tuple[dict, dict]:
+        """Decodes and validates a config payload or storage file, then pushes it.
+
+        The source is decoded twice: once to validate it and once while it is pushed, so that
+        an invalid config never replaces the one in the workload and the decoded file is never
+        held in memory.
+
+        Args:
+            payload: base64-encoded config, optionally gzip or zstd-compressed.
+            path: Path of a config file, optionally compressed, relative to the storage.
+
+        Returns:
+            Tuple[dict, dict]: The parsed config and the action results.
+
+        Raises:
+            PayloadError: if the source can't be read or decoded.
+            ConfigValidationError: if the config is invalid.
+        """
+
+        def decoded_chunks() -> Iterator[bytes]:
+            if payload:
+                return decompress_chunks(base64_chunks(payload))
+            return decompress_chunks(self._read_storage_file(str(path)))
+
+        decode_start = time.monotonic()
+        reader = ChunkedReader(decoded_chunks())
+        try:
+            config = load_config(reader)
+        except yaml.YAMLError as e:
+            raise ConfigValidationError(f"Config file is not valid YAML: {e}")
+        validate_config(config)
+        decode_seconds = time.monotonic() - decode_start
+        push_start = time.monotonic()
+        pushed_bytes = self._push_config(decoded_chunks(), source="configure-network")
+        push_seconds = time.monotonic() - push_start
+        self._stored.config_digest = ""
+        self._stored.config_snapshot = {}
+        logger.info("Config file applied from %s", "payload" if payload else path)
+        return config, {
+            "config-bytes": reader.bytes_read,
+            "pushed-bytes": pushed_bytes,
+            "decode-seconds": round(decode_seconds, 3),
+            "push-seconds": round(push_seconds, 3),
+        }
+
+    def _read_storage_file(self, path: str) -> Iterator[bytes]:
+        """Yields the content of a file of the `simapp-volume` storage in chunks.
+
+        Args:
+            path: Path of the file, relative to the storage.
+
+        Raises:
+            PayloadError: if the file is outside of the storage or can't be read.
+        """
+        root = self._storage_root
+        if not root:
+            raise PayloadError("`simapp-volume` storage is not attached")
+        file_path = (root / path).resolve()
+        if root not in file_path.parents:
+            raise PayloadError(f"`{path}` is outside of the `simapp-volume` storage")
+        try:
+            file = open(file_path, "rb")
+        except OSError as e:
+            raise PayloadError(f"Can't read `{path}`: {e.strerror}")
+        with file:
+            yield from read_chunks(file)
+
+    def _snapshot_config_file(self) -> None:
+        """Records the config file copied to the workload by the operator in the snapshot store.
+
+        The file is read from the storage, which is mounted in the charm container too.
+        """
+        if not self._storage_root:
+            return
+        try:
+            with open(self._storage_root / CONFIG_FILE_NAME, "rb") as f:
+                self._save_snapshot(read_chunks(f), source="configure-network")
+        except OSError as e:
+            logger.warning("Could not record config file snapshot: %s", e)
+
+    def _save_snapshot(self, chunks: Iterable[Union[str, bytes]], source: str) -> None:
+        """Records a config file in the snapshot store, if enabled.
+
+        Failures are logged, a config file that can't be recorded can still be applied.
+
+        Args:
+            chunks: Chunks of the config file.
+            source: Where the config file comes from, recorded with its revision.
+        """
+        snapshot_store = self._snapshot_store
+        if not snapshot_store:
+            return
+        try:
+            snapshot_store.save(chunks, source=source)
+        except SnapshotError as e:
+            logger.warning("Could not record config file snapshot: %s", e.message)
+
+    @traced_handler
+    def _on_rollback_action(self, event: ActionEvent) -> None:
+        """Restores a revision of the config file from the snapshot store and applies it.
+
+        The stored blob is decompressed in the storage and swapped in place of the config file,
+        so nothing is uploaded or rendered. The restored file is only read back from the storage
+        to record its size, like the other configs applied.
+
+        Args:
+            event: Juju action event
+        """
+        if not self._container.can_connect():
+            event.fail(message="Container is not ready")
+            return
+        if self._use_default_config:
+            event.fail(message="Unset `use-default-config` to roll back the config")
+            return
+        snapshot_store = self._snapshot_store
+        if not snapshot_store:
+            event.fail(message="Snapshots need the `simapp-volume` storage and `snapshot-history`")
+            return
+        rollback_start = time.monotonic()
+        try:
+            restored = snapshot_store.rollback(
+                event.params.get("revision"), self._storage_root / CONFIG_FILE_NAME
+            )
+            revision = snapshot_store.revisions()[-1].revision
+        except SnapshotError as e:
+            event.fail(message=e.message)
+            return
+        rollback_seconds = time.monotonic() - rollback_start
+        # The file was replaced through the storage, behind Pebble's back
+        self._container.invalidate(f"{BASE_CONFIG_PATH}/{CONFIG_FILE_NAME}")
+        self._stored.config_digest = ""
+        self._stored.config_snapshot = {}
+        self._record_restored_config_metrics()
+        self._stored.restart_pending = True
+        self._reconcile()
+        logger.info("Config file rolled back to revision %d", restored.revision)
+        event.set_results(
+            {
+                "restored-revision": restored.revision,
+                "revision": revision,
+                "config-bytes": restored.size,
+                "rollback-seconds": round(rollback_seconds, 3),
+            }
+        )
+
+    def _record_restored_config_metrics(self) -> None:
+        """Records the size of a config file restored in the storage."""
+        try:
+            with open(self._storage_root / CONFIG_FILE_NAME, "rb") as f:
+                config = load_config(f)
+        except (OSError, yaml.YAMLError) as e:
+            logger.warning("Could not read restored config file: %s", e)
+            return
+        self._record_config_metrics(config)
+
+    @traced_handler
+    def _on_generate_subscribers_action(self, event: ActionEvent) -> None:
+        """Generates a synthetic subscriber population and applies it.
+
+        The population is rendered from the default config template and streamed to the
+        workload as it is generated.
+
+        Args:
+            event: Juju action event
+        """
+        if not self._container.can_connect():
+            event.fail(message="Container is not ready")
+            return
+        if self._use_default_config:
+            event.fail(message="Unset `use-default-config` to apply a custom config")
+            return
+        try:
+            template = render_template(
+                load_template(str(self.charm_dir / DEFAULT_CONFIG_FILE_PATH)),
+                template_options(self.model.config),
+            )
+            population = Population(
+                start_imsi=event.params.get(
+                    "start-imsi", template["configuration"]["subscribers"][0]["ueId-start"]
+                ),
+                count=event.params["count"],
+                batch_size=event.params.get("batch-size", 1000),
+                device_groups=event.params.get("device-groups", 1),
+                network_slices=event.params.get("network-slices", 1),
+                credentials=event.params.get("credentials", DETERMINISTIC),
+                seed=event.params.get("seed", "simapp"),
+            )
+            config = generate_config(template, population)
+        except PopulationError as e:
+            event.fail(message=f"Invalid population: {e.message}")
+            return
+        except ConfigValidationError as e:
+            event.fail(message=f"Invalid config: {e.message}")
+            return
+        push_start = time.monotonic()
+        pushed_bytes = self._push_config(render_config(config), source="generate-subscribers")
+        push_seconds = time.monotonic() - push_start
+        self._stored.config_digest = ""
+        self._stored.config_snapshot = {}
+        self._record_config_metrics(config, subscribers=population.count)
+        self._stored.restart_pending = True
+        self._reconcile()
+        event.set_results(
+            {
+                "subscribers": population.count,
+                "subscriber-ranges": population.batches,
+                "pushed-bytes": pushed_bytes,
+                "push-seconds": round(push_seconds, 3),
+            }
+        )
 
     @property
     def _pebble_layer(self) -> Layer:
@@ -102,16 +949,45 @@ class SIMAPPOperatorCharm(CharmBase):
         Returns:
             Layer: Pebble Layer
         """
+        services = {
+            "simapp": {
+                "override": "replace",
+                "startup": "enabled",
+                "command": "/simapp/bin/simapp",
+                "environment": self._environment_variables,
+                # simapp exits when webui can't be reached: back off slowly so that an
+                # unavailable webui isn't hammered with provisioning attempts.
+                "backoff-delay": "5s",
+                "backoff-factor": 2,
+                "backoff-limit": "2m",
+            },
+        }
+        if self._stored.charm_metrics_exporter:
+            services["charm-metrics-exporter"] = {
+                "override": "replace",
+                "startup": "enabled",
+                "command": f"/bin/sh {CHARM_METRICS_EXPORTER_PATH} {CHARM_METRICS_PORT} "
+                f"{BASE_CONFIG_PATH}/{CHARM_METRICS_FILE_NAME}",
+            }
         return Layer(
             {
                 "summary": "simapp layer",
                 "description": "pebble config layer for simapp",
-                "services": {
-                    "simapp": {
+                "services": services,
+                "checks": {
+                    "config-exporter": {
                         "override": "replace",
-                        "startup": "enabled",
-                        "command": "/simapp/bin/simapp",
-                        "environment": self._environment_variables,
+                        "level": "ready",
+                        "period": f"{CHECK_PERIOD_SECONDS}s",
+                        "threshold": CHECK_THRESHOLD,
+                        "tcp": {"port": CONFIG_EXPORTER_PORT},
+                    },
+                    "prometheus-exporter": {
+                        "override": "replace",
+                        "level": "ready",
+                        "period": f"{CHECK_PERIOD_SECONDS}s",
+                        "threshold": CHECK_THRESHOLD,
+                        "http": {"url": f"http://localhost:{PROMETHEUS_PORT}/metrics"},
                     },
                 },
             }
@@ -123,10 +999,58 @@ class SIMAPPOperatorCharm(CharmBase):
             "POD_IP": str(self._pod_ip),
         }
 
-    @property
+    @cached_property
     def _pod_ip(self) -> Optional[IPv4Address]:
-        """Get the IP address of the Kubernetes pod."""
-        return IPv4Address(check_output(["unit-get", "private-address"]).decode().strip())
+        """Get the IP address of the Kubernetes pod.
+
+        The charm container shares the pod's network namespace, so the pod hostname resolves to
+        the pod IP in-process. `unit-get` is only forked when that resolution fails. The result
+        is memoized for the duration of the dispatch.
+        """
+        try:
+            pod_ip = IPv4Address(gethostbyname(gethostname()))
+            if not pod_ip.is_loopback:
+                return pod_ip
+            logger.info("Pod hostname resolves to loopback address %s", pod_ip)
+        except (gaierror, ValueError) as e:
+            logger.info("Could not resolve pod hostname: %s", e)
+        command = ["unit-get", "private-address"]
+        with self.tracer.client_span("subprocess", **{"process.command": " ".join(command)}):
+            output = check_output(command)
+        return IPv4Address(output.decode().strip())
+
+
+def _normalize_durations(service: dict) -> dict:
+    """Returns a Pebble service with its durations in seconds.
+
+    Pebble returns durations in Go's format, e.g. `2m0s` for a layer's `2m`, so they are only
+    comparable once parsed.
+    """
+    return {
+        key: _duration_seconds(value) if key in PEBBLE_DURATION_FIELDS else value
+        for key, value in service.items()
+    }
+
+
+def _duration_seconds(duration: str) -> float:
+    """Parses a Go duration, e.g. `1m30s` or `500ms`, into seconds.
+
+    Returns the duration unchanged if it can't be parsed, so that it is still compared as is.
+    """
+    parts = DURATION_PART.findall(duration)
+    if not parts or "".join(value + unit for value, unit in parts) != duration:
+        return duration  # type: ignore[return-value]
+    return sum(float(value) * DURATION_UNITS[unit] for value, unit in parts)
+
+
+def _hook() -> str:
+    """Returns the name of the hook, action or event being dispatched."""
+    return os.path.basename(os.environ.get("JUJU_DISPATCH_PATH", "unknown"))
+
+
+def _digest(content: str) -> str:
+    """Returns the SHA-256 hex digest of a string."""
+    return hashlib.sha256(content.encode()).hexdigest()
 
 
 if __name__ == "__main__":
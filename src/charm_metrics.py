@@ -0,0 +1,105 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Charm-side metrics in the Prometheus text exposition format.
+
+A charm has no long-running process to serve metrics from, so samples are persisted in the
+charm's stored state between dispatches and rendered as a Prometheus textfile that the charm
+writes to the workload volume, where an exporter running next to the workload serves it.
+"""
+
+from typing import Dict, MutableMapping, Tuple
+
+COUNTER = "counter"
+GAUGE = "gauge"
+SUMMARY = "summary"
+
+# Metric name: (type, help)
+METRICS: Dict[str, Tuple[str, str]] = {
+    "simapp_charm_hook_duration_seconds": (SUMMARY, "Duration of charm dispatches."),
+    "simapp_charm_config_push_bytes": (GAUGE, "Size of the last config pushed to simapp."),
+    "simapp_charm_config_push_duration_seconds": (SUMMARY, "Duration of config pushes."),
+    "simapp_charm_config_pushes_total": (COUNTER, "Number of config pushes."),
+    "simapp_charm_replans_total": (COUNTER, "Number of Pebble replans."),
+    "simapp_charm_restarts_total": (COUNTER, "Number of simapp restarts."),
+    "simapp_charm_coalesced_reconciles_total": (
+        COUNTER,
+        "Number of redundant reconciles avoided by coalescing deferred triggers.",
+    ),
+    "simapp_charm_pebble_cache_hits_total": (
+        COUNTER,
+        "Number of Pebble queries answered from the charm's cache.",
+    ),
+    "simapp_charm_pebble_cache_misses_total": (
+        COUNTER,
+        "Number of Pebble queries sent to the workload container.",
+    ),
+    "simapp_charm_config_subscribers": (GAUGE, "Number of subscribers in the applied config."),
+    "simapp_charm_config_device_groups": (
+        GAUGE,
+        "Number of device groups in the applied config.",
+    ),
+    "simapp_charm_config_imsi_compaction_ratio": (
+        GAUGE,
+        "Number of device group IMSI entries coalesced into each IMSI range on ingest.",
+    ),
+}
+
+
+class CharmMetrics:
+    """Records charm-side metrics into a persistent mapping of samples."""
+
+    def __init__(self, samples: MutableMapping[str, float]):
+        """Constructor for CharmMetrics.
+
+        Args:
+            samples: Mapping of sample keys to values, e.g. a dict kept in `StoredState`.
+        """
+        self._samples = samples
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """Increments a counter."""
+        key = _sample_key(name, labels)
+        self._samples[key] = self._samples.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """Sets a gauge."""
+        self._samples[_sample_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Records an observation of a summary."""
+        self.inc(f"{name}_count", 1, **labels)
+        self.inc(f"{name}_sum", value, **labels)
+
+    def render(self) -> str:
+        """Renders every sample in the Prometheus text exposition format.
+
+        Returns:
+            str: Exposition text.
+        """
+        lines = []
+        for name, (metric_type, description) in METRICS.items():
+            samples = sorted(
+                (key, value) for key, value in self._samples.items() if _metric_name(key) == name
+            )
+            if not samples:
+                continue
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(f"{key} {value}" for key, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+def _sample_key(name: str, labels: Dict[str, str]) -> str:
+    if not labels:
+        return name
+    label_pairs = ",".join(f'{label}="{value}"' for label, value in sorted(labels.items()))
+    return f"{name}{{{label_pairs}}}"
+
+
+def _metric_name(sample_key: str) -> str:
+    name = sample_key.split("{", 1)[0]
+    for suffix in ("_count", "_sum"):
+        if name.endswith(suffix) and name[: -len(suffix)] in METRICS:
+            return name[: -len(suffix)]
+    return name
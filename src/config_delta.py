@@ -0,0 +1,152 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Structured diffs between revisions of a simapp config.
+
+A snapshot keeps one digest per subscriber range, device group and network slice, plus a
+digest of everything else (the "schema": provisioning endpoint, logger, info...). Comparing the
+snapshot of the last applied config with the one of a new config tells which entities were
+added, removed or modified, so that only those need to be provisioned again. Any change outside
+of the entity lists requires a full resync.
+"""
+
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Mapping, Optional, Set
+
+SNAPSHOT_VERSION = 1
+
+# Config section: function returning the identity of an entity of that section
+ENTITY_SECTIONS: Dict[str, Callable[[Mapping[str, Any]], str]] = {
+    "subscribers": lambda subscriber: f"{subscriber['ueId-start']}-{subscriber['ueId-end']}",
+    "device-groups": lambda device_group: device_group["name"],
+    "network-slices": lambda network_slice: network_slice["name"],
+}
+
+
+@dataclass
+class SectionDelta:
+    """Identities of the entities that changed in a config section."""
+
+    added: Set[str] = field(default_factory=set)
+    removed: Set[str] = field(default_factory=set)
+    modified: Set[str] = field(default_factory=set)
+
+    @property
+    def to_provision(self) -> Set[str]:
+        """Entities that have to be provisioned again."""
+        return self.added | self.modified
+
+
+@dataclass
+class ConfigDelta:
+    """Difference between two config snapshots."""
+
+    full_resync: bool
+    sections: Dict[str, SectionDelta] = field(default_factory=dict)
+
+    @property
+    def is_empty(self) -> bool:
+        """Whether nothing has to be provisioned."""
+        return not self.full_resync and not any(
+            section.to_provision for section in self.sections.values()
+        )
+
+    def summary(self) -> str:
+        """Returns a human readable summary of the delta."""
+        if self.full_resync:
+            return "full resync"
+        return ", ".join(
+            f"{name}: +{len(section.added)} ~{len(section.modified)} -{len(section.removed)}"
+            for name, section in self.sections.items()
+        )
+
+
+def config_snapshot(config: Mapping[str, Any]) -> dict:
+    """Returns a compact snapshot of a config.
+
+    Args:
+        config: Config model.
+
+    Returns:
+        dict: Snapshot made of JSON-serializable digests.
+    """
+    configuration = config.get("configuration") or {}
+    schema = {
+        **config,
+        "configuration": {
+            key: value for key, value in configuration.items() if key not in ENTITY_SECTIONS
+        },
+    }
+    snapshot: dict = {"version": SNAPSHOT_VERSION, "schema": _digest(schema)}
+    for section, identity in ENTITY_SECTIONS.items():
+        snapshot[section] = {
+            identity(entity): _digest(entity) for entity in configuration.get(section) or []
+        }
+    return snapshot
+
+
+def diff_snapshots(
+    previous: Optional[Mapping[str, Any]], current: Mapping[str, Any]
+) -> ConfigDelta:
+    """Compares the snapshot of the last applied config with the one of a new config.
+
+    Args:
+        previous: Snapshot of the last applied config, if any.
+        current: Snapshot of the new config.
+
+    Returns:
+        ConfigDelta: What changed between both revisions.
+    """
+    if (
+        not previous
+        or previous.get("version") != current["version"]
+        or previous.get("schema") != current["schema"]
+    ):
+        return ConfigDelta(full_resync=True)
+    delta = ConfigDelta(full_resync=False)
+    for section in ENTITY_SECTIONS:
+        before, after = previous.get(section) or {}, current[section]
+        delta.sections[section] = SectionDelta(
+            added=set(after) - set(before),
+            removed=set(before) - set(after),
+            modified={key for key in set(after) & set(before) if after[key] != before[key]},
+        )
+    return delta
+
+
+def delta_config(config: Mapping[str, Any], delta: ConfigDelta) -> dict:
+    """Returns the config restricted to the entities that have to be provisioned.
+
+    Args:
+        config: Config model.
+        delta: Delta between the last applied config and `config`.
+
+    The device groups referenced by the network slices of the delta are kept even if they
+    didn't change, so that the delta is a valid config on its own: simapp reads it as its whole
+    config, e.g. when it restarts.
+
+    Returns:
+        dict: Config model provisioning only the delta, or the whole config on a full resync.
+    """
+    if delta.full_resync:
+        return dict(config)
+    configuration = dict(config["configuration"])
+    to_provision = {
+        section: set(delta.sections[section].to_provision) for section in ENTITY_SECTIONS
+    }
+    for network_slice in configuration.get("network-slices") or []:
+        if network_slice["name"] in to_provision["network-slices"]:
+            to_provision["device-groups"].update(network_slice.get("site-device-group") or [])
+    for section, identity in ENTITY_SECTIONS.items():
+        configuration[section] = [
+            entity
+            for entity in configuration.get(section) or []
+            if identity(entity) in to_provision[section]
+        ]
+    return {**config, "configuration": configuration}
+
+
+def _digest(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
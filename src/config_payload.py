@@ -0,0 +1,126 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Streaming decoding of config payloads given to the `configure-network` action.
+
+Payloads are base64-encoded and may be gzip or zstd-compressed; files read from storage may be
+compressed as well. The compression is detected from the magic bytes at the start of the
+stream, and both base64 and decompression work chunk by chunk, so a payload is never held in
+memory in its decoded form.
+"""
+
+import base64
+import binascii
+import zlib
+from typing import Iterable, Iterator
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# Size of the compressed slices fed to the zstd decompressor
+ZSTD_INPUT_SIZE = 4096
+
+
+class PayloadError(Exception):
+    """Raised when a config payload can't be decoded."""
+
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+
+def base64_chunks(payload: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Decodes a base64 payload chunk by chunk.
+
+    Args:
+        payload: base64 text. Whitespace, e.g. the line breaks added by `base64`, is ignored.
+        chunk_size: Approximate size of the decoded chunks.
+
+    Yields:
+        bytes: Decoded chunks.
+
+    Raises:
+        PayloadError: if the payload is not valid base64.
+    """
+    encoded = "".join(payload.split())
+    step = max(chunk_size // 3, 1) * 4
+    for start in range(0, len(encoded), step):
+        end = start + step
+        try:
+            yield base64.b64decode(encoded[start:end], validate=True)
+        except binascii.Error:
+            raise PayloadError("Payload is not valid base64")
+
+
+def decompress_chunks(
+    chunks: Iterable[bytes], chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """Decompresses a gzip or zstd stream, or passes an uncompressed one through.
+
+    Args:
+        chunks: Chunks of the possibly compressed stream.
+        chunk_size: Maximum size of the decompressed chunks.
+
+    Yields:
+        bytes: Decompressed chunks.
+
+    Raises:
+        PayloadError: if the stream is corrupted or truncated.
+    """
+    chunks = iter(chunks)
+    head = b""
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= len(ZSTD_MAGIC):
+            break
+    stream = _prepend(head, chunks)
+    if head.startswith(GZIP_MAGIC):
+        yield from _gunzip(stream, chunk_size)
+    elif head.startswith(ZSTD_MAGIC):
+        yield from _unzstd(stream, chunk_size)
+    else:
+        yield from stream
+
+
+def _prepend(head: bytes, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    if head:
+        yield head
+    yield from chunks
+
+
+def _gunzip(chunks: Iterable[bytes], chunk_size: int) -> Iterator[bytes]:
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    try:
+        for chunk in chunks:
+            while chunk and not decompressor.eof:
+                if decompressed := decompressor.decompress(chunk, chunk_size):
+                    yield decompressed
+                chunk = decompressor.unconsumed_tail
+        if remainder := decompressor.flush():
+            yield remainder
+    except zlib.error as e:
+        raise PayloadError(f"Payload is not valid gzip: {e}")
+    if not decompressor.eof:
+        raise PayloadError("Payload is truncated")
+
+
+def _unzstd(chunks: Iterable[bytes], chunk_size: int) -> Iterator[bytes]:
+    try:
+        import zstandard
+    except ImportError:
+        raise PayloadError("zstd payloads require the `zstandard` package")
+    # Unlike zlib, zstandard can't cap the output of a call, so the input is fed in small slices
+    # to keep each call's output small, and the output is split into chunks of `chunk_size`
+    decompressor = zstandard.ZstdDecompressor().decompressobj(write_size=chunk_size)
+    try:
+        for chunk in chunks:
+            for start in range(0, len(chunk), ZSTD_INPUT_SIZE):
+                decompressed = decompressor.decompress(
+                    chunk[start : start + ZSTD_INPUT_SIZE]  # noqa: E203
+                )
+                for offset in range(0, len(decompressed), chunk_size):
+                    yield decompressed[offset : offset + chunk_size]  # noqa: E203
+    except zstandard.ZstdError as e:
+        raise PayloadError(f"Payload is not valid zstd: {e}")
+    if not decompressor.eof:
+        raise PayloadError("Payload is truncated")
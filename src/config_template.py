@@ -0,0 +1,217 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Rendering of the simapp config model from a template and charm config options.
+
+The template is a complete config model, such as the shipped default config. Charm config
+options override the parts of it that describe the network: PLMN, gNodeBs, slice, UPF and webui
+endpoints and subscriber ranges. Options that are not set keep the template's values.
+
+A template is parsed ("compiled") once per version of the file and identified by a digest of
+its content, so that the charm can tell whether the template and options changed since the last
+render without rendering anything.
+"""
+
+import hashlib
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Iterator, List, Mapping, Optional, Tuple
+
+from config_validator import ConfigValidationError
+from simapp_config import IMSI_RANGES_KEY, load_config
+
+# Charm config options feeding the template
+TEMPLATE_OPTIONS = (
+    "mcc",
+    "mnc",
+    "gnodebs",
+    "sst",
+    "sd",
+    "upf-hostname",
+    "upf-port",
+    "webui-hostname",
+    "webui-port",
+    "subscriber-ranges",
+)
+
+
+@dataclass(frozen=True)
+class ConfigTemplate:
+    """A parsed config template."""
+
+    model: Mapping[str, Any]
+    digest: str
+
+
+def load_template(path: str) -> ConfigTemplate:
+    """Parses a config template, once per version of the file and process.
+
+    Args:
+        path: Path to the template.
+
+    Returns:
+        ConfigTemplate: The parsed template and the digest of its content.
+    """
+    stat = os.stat(path)
+    return _compile_template(path, stat.st_mtime_ns, stat.st_size)
+
+
+def template_options(config: Mapping[str, Any]) -> dict:
+    """Returns the charm config options feeding the template that are set.
+
+    Args:
+        config: Charm config.
+
+    Returns:
+        dict: Values of the template options, keyed by option name.
+    """
+    return {
+        option: config[option]
+        for option in TEMPLATE_OPTIONS
+        if config.get(option) not in (None, "")
+    }
+
+
+def render_template(template: ConfigTemplate, options: Mapping[str, Any]) -> dict:
+    """Returns the config model of a template with charm config options applied.
+
+    The template is never modified, only the sections being overridden are copied.
+
+    Args:
+        template: Parsed template.
+        options: Template options, as returned by `template_options`.
+
+    Returns:
+        dict: The config model.
+
+    Raises:
+        ConfigValidationError: if an option is invalid.
+    """
+    configuration = dict(template.model.get("configuration") or {})
+    network_slices = [
+        _render_network_slice(network_slice, options)
+        for network_slice in configuration.get("network-slices") or []
+    ]
+    configuration["network-slices"] = network_slices
+    if "webui-hostname" in options or "webui-port" in options:
+        endpoint = dict(configuration.get("sub-provision-endpt") or {})
+        endpoint["addr"] = options.get("webui-hostname", endpoint.get("addr"))
+        endpoint["port"] = options.get("webui-port", endpoint.get("port"))
+        configuration["sub-provision-endpt"] = endpoint
+    subscribers = configuration.get("subscribers") or []
+    if "subscriber-ranges" in options:
+        ranges = list(_parse_ranges(options["subscriber-ranges"]))
+        if not subscribers:
+            raise ConfigValidationError("Template has no subscriber to take credentials from")
+        subscribers = [
+            {**subscribers[0], "ueId-start": start, "ueId-end": end} for start, end in ranges
+        ]
+        configuration["device-groups"] = _assign_ranges(
+            configuration.get("device-groups") or [], ranges
+        )
+    if "mcc" in options or "mnc" in options:
+        plmn = _plmn(network_slices)
+        subscribers = [
+            {**subscriber, "plmnId": f"{plmn['mcc']}{plmn['mnc']}"} for subscriber in subscribers
+        ]
+    configuration["subscribers"] = subscribers
+    return {**template.model, "configuration": configuration}
+
+
+def options_digest(
+    template: ConfigTemplate, options: Mapping[str, Any], shard: Optional[str]
+) -> str:
+    """Returns a digest identifying the output of rendering a template with options.
+
+    Args:
+        template: Parsed template.
+        options: Template options.
+        shard: Description of the shard being rendered, if any.
+
+    Returns:
+        str: Digest that changes whenever the rendered config would change.
+    """
+    key = repr((template.digest, sorted(options.items()), shard))
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+@lru_cache(maxsize=8)
+def _compile_template(path: str, mtime_ns: int, size: int) -> ConfigTemplate:
+    with open(path, "rb") as f:
+        content = f.read()
+    return ConfigTemplate(model=load_config(content), digest=hashlib.sha256(content).hexdigest())
+
+
+def _render_network_slice(network_slice: Mapping[str, Any], options: Mapping[str, Any]) -> dict:
+    network_slice = dict(network_slice)
+    site_info = dict(network_slice.get("site-info") or {})
+    if "mcc" in options or "mnc" in options:
+        plmn = dict(site_info.get("plmn") or {})
+        plmn["mcc"] = str(options.get("mcc", plmn.get("mcc")))
+        plmn["mnc"] = str(options.get("mnc", plmn.get("mnc")))
+        site_info["plmn"] = plmn
+    if "gnodebs" in options:
+        site_info["gNodeBs"] = _parse_gnodebs(options["gnodebs"])
+    if "upf-hostname" in options or "upf-port" in options:
+        upf = dict(site_info.get("upf") or {})
+        upf["upf-name"] = options.get("upf-hostname", upf.get("upf-name"))
+        upf["upf-port"] = options.get("upf-port", upf.get("upf-port"))
+        site_info["upf"] = upf
+    network_slice["site-info"] = site_info
+    if "sst" in options or "sd" in options:
+        slice_id = dict(network_slice.get("slice-id") or {})
+        slice_id["sst"] = options.get("sst", slice_id.get("sst"))
+        slice_id["sd"] = str(options.get("sd", slice_id.get("sd")))
+        network_slice["slice-id"] = slice_id
+    return network_slice
+
+
+def _plmn(network_slices: List[Mapping[str, Any]]) -> Mapping[str, str]:
+    if not network_slices:
+        raise ConfigValidationError("Template has no network slice to set the PLMN of")
+    return network_slices[0]["site-info"]["plmn"]
+
+
+def _parse_gnodebs(value: str) -> List[dict]:
+    """Parses comma-separated `name:tac` pairs."""
+    gnodebs = []
+    for gnodeb in value.split(","):
+        name, _, tac = gnodeb.strip().partition(":")
+        if not name or not tac.isdigit():
+            raise ConfigValidationError(f"Invalid gNodeB `{gnodeb.strip()}`, expected name:tac")
+        gnodebs.append({"name": name, "tac": int(tac)})
+    return gnodebs
+
+
+def _parse_ranges(value: str) -> Iterator[Tuple[str, str]]:
+    """Parses comma-separated `start-end` IMSI ranges."""
+    for imsi_range in value.split(","):
+        start, _, end = imsi_range.strip().partition("-")
+        if not (start.isdigit() and end.isdigit()) or int(start) > int(end):
+            raise ConfigValidationError(
+                f"Invalid subscriber range `{imsi_range.strip()}`, expected start-end"
+            )
+        yield start, end
+
+
+def _assign_ranges(
+    device_groups: List[Mapping[str, Any]], ranges: List[Tuple[str, str]]
+) -> List[dict]:
+    """Gives each device group the subscriber range at its position.
+
+    Ranges beyond the number of device groups go to the last device group.
+    """
+    if not device_groups:
+        return []
+    assigned: List[List[Tuple[str, str]]] = [[] for _ in device_groups]
+    for index, imsi_range in enumerate(ranges):
+        assigned[min(index, len(device_groups) - 1)].append(imsi_range)
+    rendered = []
+    for device_group, group_ranges in zip(device_groups, assigned):
+        device_group = {key: value for key, value in device_group.items() if key != "imsis"}
+        device_group[IMSI_RANGES_KEY] = [
+            {"start": start, "end": end} for start, end in group_ranges
+        ]
+        rendered.append(device_group)
+    return rendered
@@ -0,0 +1,149 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Validation of simapp configs before they are applied.
+
+Besides checking the structure of the config, subscriber ranges and device group IMSIs are
+turned into sorted interval indexes so that overlapping subscriber ranges and IMSIs belonging to
+more than one device group are found in O(n log n), even for million-subscriber configs.
+"""
+
+from typing import Any, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from simapp_config import IMSI_RANGES_KEY
+
+SUBSCRIBER_REQUIRED_KEYS = ("ueId-start", "ueId-end", "plmnId", "key", "opc", "sequenceNumber")
+
+# (first IMSI, last IMSI, owner) where the owner describes where the interval comes from
+Interval = Tuple[int, int, str]
+
+
+class ConfigValidationError(Exception):
+    """Raised when a simapp config is invalid."""
+
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+
+def validate_config(config: Any) -> None:
+    """Validates a simapp config.
+
+    Args:
+        config: The config, as loaded from YAML.
+
+    Raises:
+        ConfigValidationError: if the config is invalid.
+    """
+    _check(isinstance(config, Mapping), "Config must be a mapping")
+    configuration = config.get("configuration")
+    _check(isinstance(configuration, Mapping), "Missing `configuration` section")
+    _validate_provision_endpoint(configuration.get("sub-provision-endpt"))
+    subscribers = _list(configuration, "subscribers")
+    device_groups = _list(configuration, "device-groups")
+    network_slices = _list(configuration, "network-slices")
+
+    overlap = _find_overlap(_subscriber_intervals(subscribers))
+    if overlap:
+        (start, end, _), (other_start, other_end, _) = overlap
+        raise ConfigValidationError(
+            f"Overlapping subscriber ranges: {start}-{end} and {other_start}-{other_end}"
+        )
+
+    device_group_names = _device_group_names(device_groups)
+    overlap = _find_overlap(_device_group_intervals(device_groups))
+    if overlap:
+        (start, end, group), (other_start, other_end, other_group) = overlap
+        imsi = max(start, other_start)
+        raise ConfigValidationError(
+            f"IMSI {imsi} is in device groups `{group}` and `{other_group}`"
+        )
+
+    for network_slice in network_slices:
+        _check(isinstance(network_slice, Mapping), "Network slices must be mappings")
+        name = network_slice.get("name")
+        _check(isinstance(name, str), "Network slice is missing a `name`")
+        for device_group in network_slice.get("site-device-group") or []:
+            _check(
+                device_group in device_group_names,
+                f"Network slice `{name}` references unknown device group `{device_group}`",
+            )
+
+
+def _check(condition: bool, message: str) -> None:
+    if not condition:
+        raise ConfigValidationError(message)
+
+
+def _list(configuration: Mapping, key: str) -> list:
+    value = configuration.get(key) or []
+    _check(isinstance(value, list), f"`{key}` must be a list")
+    return value
+
+
+def _imsi(value: Any, description: str) -> int:
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    _check(
+        isinstance(value, str) and value.isdigit(),
+        f"{description} must be a string of digits, got `{value}`",
+    )
+    return int(value)
+
+
+def _validate_provision_endpoint(endpoint: Any) -> None:
+    _check(isinstance(endpoint, Mapping), "Missing `sub-provision-endpt` section")
+    _check(isinstance(endpoint.get("addr"), str), "`sub-provision-endpt` is missing `addr`")
+    _check(isinstance(endpoint.get("port"), int), "`sub-provision-endpt` is missing `port`")
+
+
+def _subscriber_intervals(subscribers: Iterable[Any]) -> Iterator[Interval]:
+    for subscriber in subscribers:
+        _check(isinstance(subscriber, Mapping), "Subscribers must be mappings")
+        for key in SUBSCRIBER_REQUIRED_KEYS:
+            _check(key in subscriber, f"Subscriber is missing `{key}`")
+        start = _imsi(subscriber["ueId-start"], "Subscriber `ueId-start`")
+        end = _imsi(subscriber["ueId-end"], "Subscriber `ueId-end`")
+        _check(start <= end, f"Subscriber range {start}-{end} ends before it starts")
+        yield start, end, "subscribers"
+
+
+def _device_group_names(device_groups: Iterable[Any]) -> set:
+    names = set()
+    for device_group in device_groups:
+        _check(isinstance(device_group, Mapping), "Device groups must be mappings")
+        name = device_group.get("name")
+        _check(isinstance(name, str), "Device group is missing a `name`")
+        _check(name not in names, f"Duplicate device group `{name}`")
+        names.add(name)
+    return names
+
+
+def _device_group_intervals(device_groups: Iterable[Mapping]) -> Iterator[Interval]:
+    for device_group in device_groups:
+        name = device_group["name"]
+        for imsi in device_group.get("imsis") or []:
+            value = _imsi(imsi, f"IMSI of device group `{name}`")
+            yield value, value, name
+        for imsi_range in device_group.get(IMSI_RANGES_KEY) or []:
+            _check(isinstance(imsi_range, Mapping), f"Invalid IMSI range in `{name}`")
+            start = _imsi(imsi_range.get("start"), f"IMSI range start of `{name}`")
+            end = _imsi(imsi_range.get("end"), f"IMSI range end of `{name}`")
+            _check(start <= end, f"IMSI range {start}-{end} of `{name}` ends before it starts")
+            yield start, end, name
+
+
+def _find_overlap(intervals: Iterable[Interval]) -> Optional[Tuple[Interval, Interval]]:
+    """Returns the first pair of overlapping intervals, if any.
+
+    Intervals are sorted by start, after which any overlap must involve the interval reaching
+    furthest among the ones already seen.
+    """
+    furthest: Optional[Interval] = None
+    sorted_intervals: List[Interval] = sorted(intervals)
+    for interval in sorted_intervals:
+        if furthest is not None and interval[0] <= furthest[1]:
+            return furthest, interval
+        if furthest is None or interval[1] > furthest[1]:
+            furthest = interval
+    return None
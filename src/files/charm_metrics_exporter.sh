@@ -0,0 +1,33 @@
+#!/bin/sh
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+#
+# Serves the charm metrics textfile over HTTP so that Prometheus can scrape it.
+# The charm has no long-running process, so it writes its metrics to a textfile on
+# the workload volume and this exporter runs next to simapp as a Pebble service.
+# The charm only runs it when the image has `nc`.
+#
+# Usage: charm_metrics_exporter.sh <port> <textfile>
+
+port="$1"
+textfile="$2"
+
+# OpenBSD netcat takes the port to listen on as an argument, busybox and traditional
+# netcat with -p
+if nc -h 2>&1 | grep -q OpenBSD; then
+    listen="-l $port"
+else
+    listen="-l -p $port"
+fi
+
+while true; do
+    body="$(cat "$textfile" 2>/dev/null)"
+    length="$(printf '%s\n' "$body" | wc -c)"
+    {
+        printf 'HTTP/1.0 200 OK\r\n'
+        printf 'Content-Type: text/plain; version=0.0.4\r\n'
+        printf 'Content-Length: %s\r\n' "$length"
+        printf 'Connection: close\r\n\r\n'
+        printf '%s\n' "$body"
+    } | nc $listen >/dev/null  # word splitting of $listen is intended
+done
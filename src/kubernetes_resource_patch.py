@@ -0,0 +1,166 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Right-sizing of the workload container's compute resources.
+
+Juju creates the application's StatefulSet without resource requests or limits for the
+workload containers. `KubernetesResourcePatch` sets them on a container of the pod template,
+alongside the Service patched by `KubernetesServicePatch`.
+
+Changing the pod template makes Kubernetes restart the pod, so the resources are only patched
+when they differ from the ones of the live StatefulSet. `resources_for` derives them from the
+size of the config simapp provisions; options can override any of them.
+
+Like the service patch, lightkube is only imported when the patch is applied.
+"""
+
+import json
+import logging
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, Mapping, Optional
+
+from ops.charm import CharmBase
+from ops.framework import Object
+
+logger = logging.getLogger(__name__)
+
+MEBIBYTE = 1024 * 1024
+
+# Conservative linear sizing model, to be overridden with options once a deployment is profiled
+BASE_MEMORY = 128 * MEBIBYTE
+MEMORY_PER_SUBSCRIBER = 2 * 1024
+MEMORY_PER_DEVICE_GROUP = 64 * 1024
+MEMORY_LIMIT_FACTOR = 2
+BASE_CPU_MILLICORES = 100
+CPU_MILLICORES_PER_100K_SUBSCRIBERS = 100
+CPU_LIMIT_FACTOR = 4
+
+# Resource requirements, e.g. {"requests": {"cpu": "100m"}, "limits": {"memory": "256Mi"}}
+ResourceRequirements = Dict[str, Dict[str, str]]
+
+
+def resources_for(
+    subscribers: int, device_groups: int, overrides: Optional[Mapping[str, str]] = None
+) -> ResourceRequirements:
+    """Returns the resources of a simapp container provisioning a config of a given size.
+
+    Args:
+        subscribers: Number of subscribers in the config.
+        device_groups: Number of device groups in the config.
+        overrides: Quantities taking precedence over the sizing model, keyed by `cpu-request`,
+            `cpu-limit`, `memory-request` or `memory-limit`. Empty values are ignored.
+
+    Returns:
+        ResourceRequirements: Requests and limits of the container.
+    """
+    memory = BASE_MEMORY + subscribers * MEMORY_PER_SUBSCRIBER
+    memory += device_groups * MEMORY_PER_DEVICE_GROUP
+    memory_mebibytes = -(-memory // MEBIBYTE)
+    cpu_millicores = BASE_CPU_MILLICORES
+    cpu_millicores += -(-subscribers * CPU_MILLICORES_PER_100K_SUBSCRIBERS // 100000)
+    resources = {
+        "requests": {"cpu": f"{cpu_millicores}m", "memory": f"{memory_mebibytes}Mi"},
+        "limits": {
+            "cpu": f"{cpu_millicores * CPU_LIMIT_FACTOR}m",
+            "memory": f"{memory_mebibytes * MEMORY_LIMIT_FACTOR}Mi",
+        },
+    }
+    for option, quantity in (overrides or {}).items():
+        if quantity:
+            resource, _, kind = option.partition("-")
+            resources[f"{kind}s"][resource] = quantity
+    return resources
+
+
+class KubernetesResourcePatch(Object):
+    """Patches the resources of a container of the application's StatefulSet."""
+
+    def __init__(
+        self,
+        charm: CharmBase,
+        container_name: str,
+        trace: Optional[Callable[..., ContextManager[Any]]] = None,
+    ):
+        """Constructor for KubernetesResourcePatch.
+
+        Args:
+            charm: the charm that is instantiating the patch.
+            container_name: name of the workload container to patch.
+            trace: function called with a span name and attributes, returning a context
+                manager wrapped around the Kubernetes request.
+        """
+        super().__init__(charm, "kubernetes-resource-patch")
+        self.charm = charm
+        self.container_name = container_name
+        self._trace = trace or (lambda name, **attributes: nullcontext())
+
+    def apply(self, resources: ResourceRequirements) -> bool:
+        """Sets the requests and limits of the container with a strategic merge patch.
+
+        The StatefulSet isn't patched if its container already has these resources, e.g. when
+        they were applied by a previous leader.
+
+        Args:
+            resources: Requests and limits of the container.
+
+        Returns:
+            bool: Whether the container has the resources.
+        """
+        from lightkube import ApiError, Client
+        from lightkube.core import exceptions
+        from lightkube.resources.apps_v1 import StatefulSet
+        from lightkube.types import PatchType
+        from lightkube.utils.quantity import equals_canonically
+
+        patch = {
+            "spec": {
+                "template": {
+                    "spec": {"containers": [{"name": self.container_name, "resources": resources}]}
+                }
+            }
+        }
+        attributes = {
+            "k8s.statefulset.name": self.charm.app.name,
+            "http.request.body.size": len(json.dumps(patch)),
+        }
+        try:
+            client = Client()
+            with self._trace("kubernetes.get", **{"k8s.statefulset.name": self.charm.app.name}):
+                statefulset = client.get(
+                    StatefulSet, self.charm.app.name, namespace=self.charm.model.name
+                )
+            live_resources = self._container_resources(statefulset)
+            if all(
+                equals_canonically(getattr(live_resources, kind, None), resources.get(kind))
+                for kind in ("requests", "limits")
+            ):
+                logger.info(
+                    "Kubernetes resources of container '%s' already set", self.container_name
+                )
+                return True
+            with self._trace("kubernetes.patch", **attributes):
+                client.patch(
+                    StatefulSet,
+                    self.charm.app.name,
+                    patch,
+                    namespace=self.charm.model.name,
+                    patch_type=PatchType.STRATEGIC,
+                )
+        except exceptions.ConfigError as e:
+            logger.warning("Error creating k8s client: %s", e)
+            return False
+        except ApiError as e:
+            if e.status.code == 403:
+                logger.error("Kubernetes resource patch failed: `juju trust` this application.")
+            else:
+                logger.error("Kubernetes resource patch failed: %s", str(e))
+            return False
+        logger.info("Kubernetes resources of container '%s' patched", self.container_name)
+        return True
+
+    def _container_resources(self, statefulset: Any) -> Any:
+        """Returns the resources of the container in a StatefulSet's pod template, if any."""
+        for container in statefulset.spec.template.spec.containers:
+            if container.name == self.container_name:
+                return container.resources
+        return None
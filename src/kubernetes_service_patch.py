@@ -0,0 +1,671 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Patching of the Kubernetes Service created by Juju for the simapp sidecar charm.
+
+This is a charm-local fork of the `charms.observability_libs.v1.kubernetes_service_patch`
+Charmhub library, at library patch 5, which the charm no longer vendors. It lives outside of
+`lib/` so that `charmcraft fetch-lib` never overwrites it and its changes don't claim upstream
+patch versions. On top of the upstream
+library, it adds server-side apply, lazy lightkube imports, an asynchronous mode with bounded,
+retried requests, and tracing hooks.
+
+When sidecar charms are deployed, Juju creates a service named after the application in the
+namespace (named after the Juju model). This service by default contains a "placeholder" port,
+which is 65536/TCP. Any modifications to it are overwritten during a charm upgrade, so the patch
+is applied on the parent charm's `install` and `upgrade_charm` events.
+
+The constructor takes a reference to the parent charm, and a list of
+[`lightkube`](https://github.com/gtsystem/lightkube) ServicePorts that each define a port for the
+service. Optionally, a name of the service (in case service name needs to be patched as well),
+labels, selectors, and annotations can be provided as keyword arguments.
+
+To initialise the patch:
+
+For `ClusterIP` services:
+
+```python
+# ...
+from kubernetes_service_patch import KubernetesServicePatch
+from lightkube.models.core_v1 import ServicePort
+
+class SomeCharm(CharmBase):
+  def __init__(self, *args):
+    # ...
+    port = ServicePort(443, name=f"{self.app.name}")
+    self.service_patcher = KubernetesServicePatch(self, [port])
+    # ...
+```
+
+For `LoadBalancer`/`NodePort` services:
+
+```python
+# ...
+from kubernetes_service_patch import KubernetesServicePatch
+from lightkube.models.core_v1 import ServicePort
+
+class SomeCharm(CharmBase):
+  def __init__(self, *args):
+    # ...
+    port = ServicePort(443, name=f"{self.app.name}", targetPort=443, nodePort=30666)
+    self.service_patcher = KubernetesServicePatch(
+        self, [port], "LoadBalancer"
+    )
+    # ...
+```
+
+Port protocols can also be specified. Valid protocols are `"TCP"`, `"UDP"`, and `"SCTP"`
+
+```python
+# ...
+from kubernetes_service_patch import KubernetesServicePatch
+from lightkube.models.core_v1 import ServicePort
+
+class SomeCharm(CharmBase):
+  def __init__(self, *args):
+    # ...
+    tcp = ServicePort(443, name=f"{self.app.name}-tcp", protocol="TCP")
+    udp = ServicePort(443, name=f"{self.app.name}-udp", protocol="UDP")
+    sctp = ServicePort(443, name=f"{self.app.name}-sctp", protocol="SCTP")
+    self.service_patcher = KubernetesServicePatch(self, [tcp, udp, sctp])
+    # ...
+```
+
+Bound with custom events by providing `refresh_event` argument:
+For example, you would like to have a configurable port in your charm and want to apply
+service patch every time charm config is changed.
+
+```python
+from kubernetes_service_patch import KubernetesServicePatch
+from lightkube.models.core_v1 import ServicePort
+
+class SomeCharm(CharmBase):
+  def __init__(self, *args):
+    # ...
+    port = ServicePort(int(self.config["charm-config-port"]), name=f"{self.app.name}")
+    self.service_patcher = KubernetesServicePatch(
+        self,
+        [port],
+        refresh_event=self.on.config_changed
+    )
+    # ...
+```
+
+To reduce the number of round trips to the Kubernetes API, the service can be sent in a single
+idempotent server-side apply request instead of being fetched, compared and patched. A single
+lightkube client and the namespace are reused for the whole dispatch in either mode.
+
+```python
+self.service_patcher = KubernetesServicePatch(self, [port], server_side_apply=True)
+```
+
+lightkube is only imported, and the service only built, when the patch is applied or checked, so
+that dispatches for other events don't pay for it; likewise, asyncio is only imported by the
+asynchronous mode. To keep the charm itself free of lightkube
+imports, ports can be given as mappings of `ServicePort` fields:
+
+```python
+self.service_patcher = KubernetesServicePatch(self, [{"name": "http", "port": 80}])
+```
+
+On slow or busy clusters, the patch can run on lightkube's `AsyncClient` instead. Independent
+requests are then sent concurrently, every request is bounded by a timeout and retried with
+jittered exponential backoff on transient errors, and a recreated service is waited for with a
+watch rather than by polling:
+
+```python
+self.service_patcher = KubernetesServicePatch(
+    self, [port], asynchronous=True, timeout=10.0, retries=3
+)
+```
+
+To profile the patch, a `trace` callable can be given. It is called with a span name, e.g.
+`kubernetes.apply`, and the name of the service, and must return a context manager, which
+wraps every Kubernetes request (including its retries):
+
+```python
+self.service_patcher = KubernetesServicePatch(self, [port], trace=self.tracer.client_span)
+```
+
+Additionally, you may wish to use mocks in your charm's unit testing to ensure that the library
+does not try to make any API calls, or open any files during testing that are unlikely to be
+present, and could break your tests. The easiest way to do this is during your test `setUp`:
+
+```python
+# ...
+
+@patch("charm.KubernetesServicePatch", lambda x, y: None)
+def setUp(self, *unused):
+    self.harness = Harness(SomeCharm)
+    # ...
+```
+"""
+
+import logging
+import random
+from contextlib import aclosing, nullcontext
+from functools import cached_property
+from types import MethodType
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    ContextManager,
+    List,
+    Literal,
+    Mapping,
+    Optional,
+    TypeVar,
+    Union,
+)
+
+from ops.charm import CharmBase
+from ops.framework import BoundEvent, Object
+
+if TYPE_CHECKING:
+    from lightkube import AsyncClient, Client
+    from lightkube.models.core_v1 import ServicePort
+    from lightkube.resources.core_v1 import Service
+
+logger = logging.getLogger(__name__)
+
+ServiceType = Literal["ClusterIP", "LoadBalancer"]
+
+# Status codes of API errors worth retrying
+TRANSIENT_STATUS_CODES = (429, 500, 502, 503, 504)
+# Upper bound of the first retry delay, in seconds, doubled on every attempt
+RETRY_BACKOFF = 0.5
+
+T = TypeVar("T")
+
+
+class KubernetesServicePatch(Object):
+    """A utility for patching the Kubernetes service set up by Juju."""
+
+    def __init__(
+        self,
+        charm: CharmBase,
+        ports: List[Union["ServicePort", Mapping[str, Any]]],
+        service_name: Optional[str] = None,
+        service_type: ServiceType = "ClusterIP",
+        additional_labels: Optional[dict] = None,
+        additional_selectors: Optional[dict] = None,
+        additional_annotations: Optional[dict] = None,
+        *,
+        refresh_event: Optional[Union[BoundEvent, List[BoundEvent]]] = None,
+        server_side_apply: bool = False,
+        asynchronous: bool = False,
+        timeout: float = 10.0,
+        retries: int = 3,
+        trace: Optional[Callable[..., ContextManager[Any]]] = None,
+    ):
+        """Constructor for KubernetesServicePatch.
+
+        Args:
+            charm: the charm that is instantiating the library.
+            ports: a list of ServicePorts, or of mappings of ServicePort fields
+            service_name: allows setting custom name to the patched service. If none given,
+                application name will be used.
+            service_type: desired type of K8s service. Default value is in line with ServiceSpec's
+                default value.
+            additional_labels: Labels to be added to the kubernetes service (by default only
+                "app.kubernetes.io/name" is set to the service name)
+            additional_selectors: Selectors to be added to the kubernetes service (by default only
+                "app.kubernetes.io/name" is set to the service name)
+            additional_annotations: Annotations to be added to the kubernetes service.
+            refresh_event: an optional bound event or list of bound events which
+                will be observed to re-apply the patch (e.g. on port change).
+                The `install` and `upgrade-charm` events would be observed regardless.
+            server_side_apply: send the desired service in a single server-side apply request
+                instead of fetching, comparing and patching it. Ports owned by other field
+                managers (e.g. Juju's placeholder port) are left untouched.
+            asynchronous: patch with lightkube's AsyncClient, sending independent requests
+                concurrently.
+            timeout: seconds each request, and the wait for a recreated service, may take in
+                asynchronous mode.
+            retries: number of times a request failing with a transient error is retried in
+                asynchronous mode.
+            trace: function called with a span name and a `k8s.service.name` keyword argument,
+                returning a context manager wrapped around every Kubernetes request.
+        """
+        super().__init__(charm, "kubernetes-service-patch")
+        self.charm = charm
+        self.server_side_apply = server_side_apply
+        self.asynchronous = asynchronous
+        self.timeout = timeout
+        self.retries = retries
+        self._trace = trace or _no_trace
+        self.service_name = service_name if service_name else self._app
+        self._service_args = (
+            ports,
+            service_name,
+            service_type,
+            additional_labels,
+            additional_selectors,
+            additional_annotations,
+        )
+
+        # Make mypy type checking happy that self._patch is a method
+        assert isinstance(self._patch, MethodType)
+        # Ensure this patch is applied during the 'install' and 'upgrade-charm' events
+        self.framework.observe(charm.on.install, self._patch)
+        self.framework.observe(charm.on.upgrade_charm, self._patch)
+
+        # apply user defined events
+        if refresh_event:
+            if not isinstance(refresh_event, list):
+                refresh_event = [refresh_event]
+
+            for evt in refresh_event:
+                self.framework.observe(evt, self._patch)
+
+    @cached_property
+    def service(self) -> "Service":
+        """Desired service, built the first time the patch is applied or checked.
+
+        Returns:
+            Service: A valid representation of a Kubernetes Service with the correct ports.
+        """
+        return self._service_object(*self._service_args)
+
+    def _service_object(
+        self,
+        ports: List[Union["ServicePort", Mapping[str, Any]]],
+        service_name: Optional[str] = None,
+        service_type: ServiceType = "ClusterIP",
+        additional_labels: Optional[dict] = None,
+        additional_selectors: Optional[dict] = None,
+        additional_annotations: Optional[dict] = None,
+    ) -> "Service":
+        """Creates a valid Service representation.
+
+        Args:
+            ports: a list of ServicePorts, or of mappings of ServicePort fields
+            service_name: allows setting custom name to the patched service. If none given,
+                application name will be used.
+            service_type: desired type of K8s service. Default value is in line with ServiceSpec's
+                default value.
+            additional_labels: Labels to be added to the kubernetes service (by default only
+                "app.kubernetes.io/name" is set to the service name)
+            additional_selectors: Selectors to be added to the kubernetes service (by default only
+                "app.kubernetes.io/name" is set to the service name)
+            additional_annotations: Annotations to be added to the kubernetes service.
+
+        Returns:
+            Service: A valid representation of a Kubernetes Service with the correct ports.
+        """
+        from lightkube.models.core_v1 import ServicePort, ServiceSpec
+        from lightkube.models.meta_v1 import ObjectMeta
+        from lightkube.resources.core_v1 import Service
+
+        if not service_name:
+            service_name = self._app
+        labels = {"app.kubernetes.io/name": self._app}
+        if additional_labels:
+            labels.update(additional_labels)
+        selector = {"app.kubernetes.io/name": self._app}
+        if additional_selectors:
+            selector.update(additional_selectors)
+        return Service(
+            apiVersion="v1",
+            kind="Service",
+            metadata=ObjectMeta(
+                namespace=self._namespace,
+                name=service_name,
+                labels=labels,
+                annotations=additional_annotations,  # type: ignore[arg-type]
+            ),
+            spec=ServiceSpec(
+                selector=selector,
+                ports=[
+                    ServicePort.from_dict(port) if isinstance(port, Mapping) else port
+                    for port in ports
+                ],
+                type=service_type,
+            ),
+        )
+
+    def _patch(self, _) -> None:
+        """Patch the Kubernetes service created by Juju to map the correct port.
+
+        Raises:
+            PatchFailed: if patching fails due to lack of permissions, or otherwise.
+        """
+        from lightkube import ApiError
+        from lightkube.core import exceptions
+        from lightkube.resources.core_v1 import Service
+        from lightkube.types import PatchType
+
+        if self.asynchronous:
+            import asyncio
+
+            asyncio.run(self._patch_async())
+            return
+
+        try:
+            client = self._client
+        except exceptions.ConfigError as e:
+            logger.warning("Error creating k8s client: %s", e)
+            return
+
+        try:
+            if self.server_side_apply:
+                self._apply(client)
+            else:
+                if self._is_patched(client):
+                    return
+                if self.service_name != self._app:
+                    self._delete_and_create_service(client)
+                with self._trace("kubernetes.patch", **{"k8s.service.name": self.service_name}):
+                    client.patch(
+                        Service, self.service_name, self.service, patch_type=PatchType.MERGE
+                    )
+        except ApiError as e:
+            if e.status.code == 403:
+                logger.error("Kubernetes service patch failed: `juju trust` this application.")
+            else:
+                logger.error("Kubernetes service patch failed: %s", str(e))
+        else:
+            logger.info("Kubernetes service '%s' patched successfully", self._app)
+
+    async def _patch_async(self) -> None:
+        """Patch the Kubernetes service with an AsyncClient, with bounded and retried requests."""
+        import asyncio
+
+        from httpx2 import HTTPError, Timeout
+        from lightkube import ApiError, AsyncClient
+        from lightkube.core import exceptions
+
+        try:
+            client = AsyncClient(timeout=Timeout(self.timeout))
+        except exceptions.ConfigError as e:
+            logger.warning("Error creating k8s client: %s", e)
+            return
+
+        try:
+            if self.server_side_apply:
+                await self._apply_async(client)
+            elif not await self._merge_async(client):
+                return
+        except ApiError as e:
+            if e.status.code == 403:
+                logger.error("Kubernetes service patch failed: `juju trust` this application.")
+            else:
+                logger.error("Kubernetes service patch failed: %s", str(e))
+        except (asyncio.TimeoutError, HTTPError) as e:
+            logger.error("Kubernetes service patch failed: %s", repr(e))
+        else:
+            logger.info("Kubernetes service '%s' patched successfully", self._app)
+        finally:
+            await client.close()
+
+    async def _apply_async(self, client: "AsyncClient") -> None:
+        """Applies the service, deleting the service created by Juju concurrently if renamed."""
+        calls = [
+            self._retry(
+                "apply",
+                self.service_name,
+                lambda: client.apply(self.service, field_manager=self._app, force=True),
+            )
+        ]
+        if self.service_name != self._app:
+            calls.append(
+                self._retry("delete", self._app, lambda: self._delete_async(client, self._app))
+            )
+        await self._gather(*calls)
+        if self.service_name != self._app:
+            await self._wait_for_service(client, self.service_name)
+
+    async def _merge_async(self, client: "AsyncClient") -> bool:
+        """Fetches, compares and patches the service, recreating it under its custom name.
+
+        Returns:
+            bool: Whether the service was patched, False if it already was or can't be found.
+        """
+        from lightkube.resources.core_v1 import Service
+        from lightkube.types import PatchType
+
+        renamed = self.service_name != self._app
+        get_service = self._retry(
+            "get",
+            self.service_name,
+            lambda: self._get_async(client, self.service_name, missing_ok=renamed),
+        )
+        if renamed:
+            service, juju_service = await self._gather(
+                get_service,
+                self._retry("get", self._app, lambda: self._get_async(client, self._app, True)),
+            )
+        else:
+            service, juju_service = await get_service, None
+        if service is not None and self._ports_match(service):
+            return False
+        if service is None:
+            if juju_service is None:
+                logger.error("Kubernetes service patch failed: service '%s' not found", self._app)
+                return False
+            juju_service.metadata.name = self.service_name
+            juju_service.metadata.resourceVersion = juju_service.metadata.uid = None
+            await self._gather(
+                self._retry("delete", self._app, lambda: self._delete_async(client, self._app)),
+                self._retry(
+                    "create", self.service_name, lambda: self._create_async(client, juju_service)
+                ),
+            )
+            await self._wait_for_service(client, self.service_name)
+        await self._retry(
+            "patch",
+            self.service_name,
+            lambda: client.patch(
+                Service,
+                self.service_name,
+                self.service,
+                namespace=self._namespace,
+                patch_type=PatchType.MERGE,
+            ),
+        )
+        return True
+
+    async def _get_async(
+        self, client: "AsyncClient", name: str, missing_ok: bool
+    ) -> Optional["Service"]:
+        from lightkube import ApiError
+        from lightkube.resources.core_v1 import Service
+
+        try:
+            return await client.get(Service, name, namespace=self._namespace)
+        except ApiError as e:
+            if e.status.code == 404 and missing_ok:
+                return None
+            raise
+
+    async def _delete_async(self, client: "AsyncClient", name: str) -> None:
+        """Deletes a service, tolerating it being gone, e.g. when a timed out delete is retried."""
+        from lightkube import ApiError
+        from lightkube.resources.core_v1 import Service
+
+        try:
+            await client.delete(Service, name, namespace=self._namespace)
+        except ApiError as e:
+            if e.status.code != 404:
+                raise
+
+    async def _create_async(self, client: "AsyncClient", service: "Service") -> None:
+        """Creates a service, tolerating it existing, e.g. when a timed out create is retried."""
+        from lightkube import ApiError
+
+        try:
+            await client.create(service)
+        except ApiError as e:
+            if e.status.code != 409:
+                raise
+
+    async def _wait_for_service(self, client: "AsyncClient", name: str) -> None:
+        """Watches the service until it is seen, for at most `timeout` seconds."""
+        import asyncio
+
+        from lightkube.resources.core_v1 import Service
+
+        async def watch() -> None:
+            events = client.watch(
+                Service, namespace=self._namespace, fields={"metadata.name": name}
+            )
+            async with aclosing(events):
+                async for event, _ in events:
+                    if event in ("ADDED", "MODIFIED"):
+                        return
+
+        with self._trace("kubernetes.watch", **{"k8s.service.name": name}):
+            await asyncio.wait_for(watch(), self.timeout)
+
+    async def _retry(self, request: str, name: str, call: Callable[[], Awaitable[T]]) -> T:
+        """Awaits a request with a timeout, retrying it with jittered backoff on transient errors.
+
+        Args:
+            request: name of the request, e.g. `apply`, used to trace it.
+            name: name of the service the request is about.
+            call: function sending the request.
+
+        Returns:
+            The result of the request.
+        """
+        import asyncio
+
+        with self._trace(f"kubernetes.{request}", **{"k8s.service.name": name}):
+            for attempt in range(self.retries):
+                try:
+                    return await asyncio.wait_for(call(), self.timeout)
+                except Exception as e:
+                    if not _is_transient(e):
+                        raise
+                    delay = random.uniform(0, RETRY_BACKOFF * 2**attempt)
+                    logger.debug("Retrying Kubernetes request in %.2fs after %r", delay, e)
+                    await asyncio.sleep(delay)
+            return await asyncio.wait_for(call(), self.timeout)
+
+    @staticmethod
+    async def _gather(*calls: Awaitable[Any]) -> List[Any]:
+        """Awaits calls concurrently, raising the first error once they all completed."""
+        import asyncio
+
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
+
+    def _apply(self, client: "Client") -> None:
+        """Creates or updates the service in a single server-side apply request.
+
+        When a custom service name is used, the service created by Juju is deleted afterwards.
+        """
+        from lightkube import ApiError
+        from lightkube.resources.core_v1 import Service
+
+        with self._trace("kubernetes.apply", **{"k8s.service.name": self.service_name}):
+            client.apply(self.service, field_manager=self._app, force=True)
+        if self.service_name != self._app:
+            try:
+                with self._trace("kubernetes.delete", **{"k8s.service.name": self._app}):
+                    client.delete(Service, self._app, namespace=self._namespace)
+            except ApiError as e:
+                if e.status.code != 404:
+                    raise
+
+    def _delete_and_create_service(self, client: "Client"):
+        from lightkube.resources.core_v1 import Service
+
+        with self._trace("kubernetes.get", **{"k8s.service.name": self._app}):
+            service = client.get(Service, self._app, namespace=self._namespace)
+        service.metadata.name = self.service_name  # type: ignore[attr-defined]
+        service.metadata.resourceVersion = service.metadata.uid = None  # type: ignore[attr-defined]   # noqa: E501
+        with self._trace("kubernetes.delete", **{"k8s.service.name": self._app}):
+            client.delete(Service, self._app, namespace=self._namespace)
+        with self._trace("kubernetes.create", **{"k8s.service.name": self.service_name}):
+            client.create(service)
+
+    def is_patched(self) -> bool:
+        """Reports if the service patch has been applied.
+
+        Returns:
+            bool: A boolean indicating if the service patch has been applied.
+        """
+        return self._is_patched(self._client)
+
+    def _is_patched(self, client: "Client") -> bool:
+        from lightkube import ApiError
+        from lightkube.resources.core_v1 import Service
+
+        # Get the relevant service from the cluster
+        try:
+            with self._trace("kubernetes.get", **{"k8s.service.name": self.service_name}):
+                service = client.get(Service, name=self.service_name, namespace=self._namespace)
+        except ApiError as e:
+            if e.status.code == 404 and self.service_name != self._app:
+                return False
+            else:
+                logger.error("Kubernetes service get failed: %s", str(e))
+                raise
+
+        return self._ports_match(service)
+
+    def _ports_match(self, service: "Service") -> bool:
+        """Reports whether the ports of a fetched service are the expected ones."""
+        # Construct a list of expected ports, should the patch be applied
+        expected_ports = [(p.port, p.targetPort) for p in self.service.spec.ports]
+        # Construct a list in the same manner, using the fetched service
+        fetched_ports = [
+            (p.port, p.targetPort) for p in service.spec.ports  # type: ignore[attr-defined]
+        ]  # noqa: E501
+        if self.server_side_apply:
+            # Server-side apply merges ports, so ports owned by other managers may remain
+            return all(port in fetched_ports for port in expected_ports)
+        return expected_ports == fetched_ports
+
+    @cached_property
+    def _client(self) -> "Client":
+        """Lightkube client shared by every call made during this dispatch.
+
+        Returns:
+            Client: A lightkube client.
+        """
+        from lightkube import Client
+
+        return Client()
+
+    @property
+    def _app(self) -> str:
+        """Name of the current Juju application.
+
+        Returns:
+            str: A string containing the name of the current Juju application.
+        """
+        return self.charm.app.name
+
+    @cached_property
+    def _namespace(self) -> str:
+        """The Kubernetes namespace we're running in, read once per dispatch.
+
+        Returns:
+            str: A string containing the name of the current Kubernetes namespace.
+        """
+        with open("/var/run/secrets/kubernetes.io/serviceaccount/namespace", "r") as f:
+            return f.read().strip()
+
+
+def _no_trace(name: str, **attributes: Any) -> ContextManager[None]:
+    """Default `trace` function, tracing nothing."""
+    return nullcontext()
+
+
+def _is_transient(error: BaseException) -> bool:
+    """Reports whether a failed request is worth retrying."""
+    import asyncio
+
+    from httpx2 import TransportError
+    from lightkube import ApiError
+
+    if isinstance(error, ApiError):
+        return error.status.code in TRANSIENT_STATUS_CODES
+    return isinstance(error, (asyncio.TimeoutError, TransportError))
@@ -0,0 +1,145 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Provider side of the `prometheus_scrape` interface.
+
+This is a minimal charm-local implementation of the relation data that the
+`charms.prometheus_k8s.v0.prometheus_scrape` Charmhub library publishes for a metrics provider.
+It isn't a copy of that library and doesn't forward alert rules:
+
+- the leader publishes the scrape jobs and the Juju topology of the application in the
+  application data bag, as `scrape_jobs` and `scrape_metadata`;
+- each unit publishes the address Prometheus scrapes it on in its unit data bag, as
+  `prometheus_scrape_unit_address` and `prometheus_scrape_unit_name`.
+
+The hosts of `static_configs` targets are a wildcard (`*`), which Prometheus replaces with the
+address of each unit.
+"""
+
+import ipaddress
+import json
+import socket
+from typing import Any, Dict, List, Optional, Union
+
+from ops.charm import CharmBase
+from ops.framework import BoundEvent, EventBase, Object
+
+DEFAULT_RELATION_NAME = "metrics-endpoint"
+DEFAULT_JOB = {"metrics_path": "/metrics", "static_configs": [{"targets": ["*:80"]}]}
+# Keys of a Prometheus `scrape_config` that Prometheus accepts from related charms
+ALLOWED_KEYS = {
+    "job_name",
+    "metrics_path",
+    "static_configs",
+    "scrape_interval",
+    "scrape_timeout",
+    "proxy_url",
+    "relabel_configs",
+    "metric_relabel_configs",
+    "sample_limit",
+    "label_limit",
+    "label_name_length_limit",
+    "label_value_length_limit",
+    "scheme",
+    "basic_auth",
+    "tls_config",
+    "authorization",
+    "params",
+}
+
+
+class MetricsEndpointProvider(Object):
+    """Asks the related Prometheus applications to scrape the units of the charm."""
+
+    def __init__(
+        self,
+        charm: CharmBase,
+        jobs: List[Dict[str, Any]],
+        relation_name: str = DEFAULT_RELATION_NAME,
+        refresh_event: Optional[Union[BoundEvent, List[BoundEvent]]] = None,
+    ):
+        """Constructor for MetricsEndpointProvider.
+
+        Args:
+            charm: the charm that is instantiating the provider.
+            jobs: scrape jobs, as Prometheus `scrape_config` mappings. Keys Prometheus doesn't
+                accept from related charms are dropped.
+            relation_name: name of the `prometheus_scrape` relation.
+            refresh_event: events on which the unit address is published again, e.g. the
+                workload container's `pebble_ready`.
+        """
+        super().__init__(charm, relation_name)
+        self._charm = charm
+        self._relation_name = relation_name
+        self._jobs = _sanitize_jobs(jobs)
+        if refresh_event is None:
+            refresh_event = []
+        elif not isinstance(refresh_event, list):
+            refresh_event = [refresh_event]
+        events = self._charm.on[relation_name]
+        self.framework.observe(events.relation_joined, self._on_refresh)
+        self.framework.observe(self._charm.on.leader_elected, self._on_refresh)
+        self.framework.observe(self._charm.on.upgrade_charm, self._on_refresh)
+        for event in refresh_event:
+            self.framework.observe(event, self._on_refresh)
+
+    def _on_refresh(self, event: EventBase) -> None:
+        self.set_scrape_job_spec()
+
+    def update_scrape_job_spec(self, jobs: List[Dict[str, Any]]) -> None:
+        """Replaces the scrape jobs and publishes them.
+
+        Args:
+            jobs: scrape jobs, as Prometheus `scrape_config` mappings.
+        """
+        self._jobs = _sanitize_jobs(jobs)
+        self.set_scrape_job_spec()
+
+    def set_scrape_job_spec(self) -> None:
+        """Publishes the unit address and, on the leader, the scrape jobs and metadata."""
+        relations = self._charm.model.relations[self._relation_name]
+        for relation in relations:
+            relation.data[self._charm.unit].update(
+                {
+                    "prometheus_scrape_unit_address": self._unit_address(relation),
+                    "prometheus_scrape_unit_name": self._charm.unit.name,
+                }
+            )
+        if not self._charm.unit.is_leader():
+            return
+        for relation in relations:
+            relation.data[self._charm.app].update(
+                {
+                    "scrape_jobs": json.dumps(self._jobs or [DEFAULT_JOB]),
+                    "scrape_metadata": json.dumps(self._scrape_metadata),
+                }
+            )
+
+    def _unit_address(self, relation: Any) -> str:
+        """Returns the unit's address on the relation's network, its FQDN if it has none."""
+        binding = self._charm.model.get_binding(relation)
+        address = str(binding.network.bind_address) if binding else ""
+        try:
+            ipaddress.ip_address(address)
+        except ValueError:
+            return socket.getfqdn()
+        return address
+
+    @property
+    def _scrape_metadata(self) -> Dict[str, str]:
+        """Returns the Juju topology Prometheus labels the scraped metrics with."""
+        return {
+            "model": self._charm.model.name,
+            "model_uuid": self._charm.model.uuid,
+            "application": self._charm.app.name,
+            "unit": self._charm.unit.name,
+            "charm_name": self._charm.meta.name,
+        }
+
+
+def _sanitize_jobs(jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Returns the jobs restricted to the keys Prometheus accepts, with default values."""
+    return [
+        {**DEFAULT_JOB, **{key: value for key, value in job.items() if key in ALLOWED_KEYS}}
+        for job in jobs
+    ]
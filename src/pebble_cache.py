@@ -0,0 +1,177 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Event-scoped cache of Pebble queries.
+
+Every `Container` query is a round trip to the Pebble API, and a single event handler often
+asks the same questions several times, e.g. whether the container can be connected to and
+whether the config file exists. `PebbleQueryCache` answers repeated queries from memory:
+
+- connectivity (`can_connect`),
+- file existence (`exists`),
+- the current plan (`get_plan`).
+
+Writes made through the cache (`push`, `remove_path`, `exec`, `add_layer`, `replan`)
+invalidate the answers they may change, files changed by other means are invalidated with
+`invalidate`, and the cache is cleared whenever one of the observed events starts, so that
+state changed between events is never served stale.
+Service and check statuses and file contents are always queried.
+
+Given a tracer, every call sent to Pebble is recorded as a span, with the size of pushed files.
+"""
+
+from collections import Counter
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, Hashable, List, Optional, Tuple
+
+from ops.charm import CharmBase
+from ops.framework import BoundEvent, EventBase, Object
+from ops.model import Container
+from ops.pebble import CheckLevel, Plan, ServiceInfo
+
+from tracing import Tracer
+
+# Queries answered from files, invalidated by writes to the files
+FILE_QUERIES = ("exists",)
+
+
+class PebbleQueryCache(Object):
+    """Caches the Pebble queries made on a container while an event is handled."""
+
+    def __init__(
+        self,
+        charm: CharmBase,
+        container: Container,
+        refresh_events: List[BoundEvent],
+        tracer: Optional[Tracer] = None,
+    ):
+        """Constructor for PebbleQueryCache.
+
+        Args:
+            charm: the charm that is instantiating the cache.
+            container: container whose queries are cached.
+            refresh_events: events at the start of which the cache is cleared. The cache must
+                be created before the charm observes them, so that it is cleared first.
+            tracer: tracer recording the calls sent to Pebble, if any.
+        """
+        super().__init__(charm, f"pebble-query-cache-{container.name}")
+        self.container = container
+        self.tracer = tracer
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        self._answers: Dict[Tuple[str, Hashable], Any] = {}
+        for event in refresh_events:
+            self.framework.observe(event, self._on_refresh)
+
+    def _on_refresh(self, event: EventBase) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        """Forgets every cached answer."""
+        self._answers.clear()
+
+    def invalidate(self, path: str) -> None:
+        """Invalidates the file queries about a path, its parents and its children.
+
+        Writes made through the cache invalidate their paths; this is for files changed by
+        other means, e.g. through a storage mounted in both the charm and workload containers.
+        """
+        path = path.rstrip("/")
+        self._answers = {
+            (query, argument): answer
+            for (query, argument), answer in self._answers.items()
+            if query not in FILE_QUERIES or not _related_paths(str(argument), path)
+        }
+
+    def can_connect(self) -> bool:
+        """Returns whether the container's Pebble API can be reached."""
+        return self._query("can_connect", None, self.container.can_connect)
+
+    def exists(self, path: str) -> bool:
+        """Returns whether a path exists in the container."""
+        return self._query("exists", path, lambda: self.container.exists(path))
+
+    def get_plan(self) -> Plan:
+        """Returns the container's current plan."""
+        return self._query("get_plan", None, self.container.get_plan)
+
+    def push(self, path: str, source: Any, **kwargs: Any) -> None:
+        """Pushes a file to the container, see `Container.push`."""
+        self.invalidate(path)
+        with self._span("push", path=path) as span:
+            self.container.push(path, source, **kwargs)
+            size = len(source) if isinstance(source, (str, bytes)) else None
+            size = getattr(source, "bytes_read", size)
+            if span and size is not None:
+                span.set("pebble.push.bytes", size)
+
+    def remove_path(self, path: str, recursive: bool = False) -> None:
+        """Removes a path from the container, see `Container.remove_path`."""
+        self.invalidate(path)
+        with self._span("remove_path", path=path):
+            self.container.remove_path(path, recursive=recursive)
+
+    def exec(self, command: List[str], **kwargs: Any) -> Any:
+        """Runs a command in the container, see `Container.exec`.
+
+        The command may change any file, so every file query is invalidated.
+        """
+        self._answers = {
+            key: answer for key, answer in self._answers.items() if key[0] not in FILE_QUERIES
+        }
+        with self._span("exec", command=" ".join(command)):
+            return self.container.exec(command, **kwargs)
+
+    def add_layer(self, label: str, layer: Any, *, combine: bool = False) -> None:
+        """Adds a layer to the container's plan, see `Container.add_layer`."""
+        self._answers.pop(("get_plan", None), None)
+        with self._span("add_layer", label=label):
+            self.container.add_layer(label, layer, combine=combine)
+
+    def replan(self) -> None:
+        """Replans the container's services, see `Container.replan`."""
+        self._answers.pop(("get_plan", None), None)
+        with self._span("replan"):
+            self.container.replan()
+
+    def restart(self, *service_names: str) -> None:
+        """Restarts services of the container, see `Container.restart`."""
+        with self._span("restart", services=",".join(service_names)):
+            self.container.restart(*service_names)
+
+    def get_service(self, service_name: str) -> ServiceInfo:
+        """Returns the status of a service, see `Container.get_service`. Never cached."""
+        with self._span("get_service", service=service_name):
+            return self.container.get_service(service_name)
+
+    def get_checks(self, *check_names: str, level: Optional[CheckLevel] = None) -> Any:
+        """Returns the status of health checks, see `Container.get_checks`. Never cached."""
+        with self._span("get_checks"):
+            return self.container.get_checks(*check_names, level=level)
+
+    def pull(self, path: str, **kwargs: Any) -> Any:
+        """Opens a file of the container for reading, see `Container.pull`. Never cached."""
+        with self._span("pull", path=path):
+            return self.container.pull(path, **kwargs)
+
+    def _query(self, query: str, argument: Hashable, call: Callable[[], Any]) -> Any:
+        key = (query, argument)
+        if key in self._answers:
+            self.hits[query] += 1
+            return self._answers[key]
+        self.misses[query] += 1
+        attributes = {"path": argument} if argument is not None else {}
+        with self._span(query, **attributes):
+            answer = self._answers[key] = call()
+        return answer
+
+    def _span(self, call: str, **attributes: Any) -> ContextManager[Any]:
+        if not self.tracer:
+            return nullcontext()
+        return self.tracer.client_span(f"pebble.{call}", **attributes)
+
+
+def _related_paths(path: str, other: str) -> bool:
+    """Returns whether two paths are equal or one is a parent of the other."""
+    path = path.rstrip("/")
+    return path == other or other.startswith(f"{path}/") or path.startswith(f"{other}/")
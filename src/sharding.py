@@ -0,0 +1,221 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Deterministic partitioning of a simapp config across peer units.
+
+Every unit computes the same partition from the sorted list of unit names, so no coordination
+is needed beyond knowing who the peers are. Each shard is a valid config on its own:
+
+- network slices are assigned together with the device groups they reference, since a slice
+  can only be provisioned with its device groups; device groups shared by several slices keep
+  those slices together. These groups are assigned whole, since webui replaces a device group's
+  IMSI list on every update, and balanced across shards by number of IMSIs;
+- subscribers are provisioned by the shard owning the device group their IMSIs belong to,
+  cutting ranges at device group boundaries;
+- subscribers outside of any device group are split so that each shard provisions a
+  contiguous, near-equal share of them.
+"""
+
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from simapp_config import IMSI_RANGES_KEY, compact_imsis
+
+Shard = Tuple[int, int]
+
+# (first IMSI, last IMSI, index of the owning shard)
+OwnedInterval = Tuple[int, int, int]
+# (first IMSI, last IMSI, subscriber the IMSIs come from)
+SubscriberPiece = Tuple[int, int, Mapping[str, Any]]
+
+
+def unit_shard(unit_name: str, peer_unit_names: Iterable[str]) -> Shard:
+    """Returns the shard a unit is responsible for.
+
+    Args:
+        unit_name: Name of the unit, e.g. `simapp/1`.
+        peer_unit_names: Names of the other units of the application.
+
+    Returns:
+        Tuple[int, int]: Index of the unit's shard and total number of shards.
+    """
+    unit_names = sorted({unit_name, *peer_unit_names}, key=_unit_number)
+    return unit_names.index(unit_name), len(unit_names)
+
+
+def shard_config(config: Mapping[str, Any], index: int, count: int) -> dict:
+    """Returns the part of a config provisioned by a shard.
+
+    Args:
+        config: Complete config model, which must be valid.
+        index: Index of the shard.
+        count: Total number of shards.
+
+    Returns:
+        dict: Config model restricted to the shard.
+    """
+    configuration = dict(config["configuration"])
+    if count > 1:
+        device_groups = configuration.get("device-groups") or []
+        network_slices = configuration.get("network-slices") or []
+        device_group_imsis = {
+            device_group["name"]: compact_imsis(
+                device_group.get("imsis") or [], device_group.get(IMSI_RANGES_KEY) or []
+            )
+            for device_group in device_groups
+        }
+        owners = _assign_shards(device_group_imsis, network_slices, count)
+        configuration["device-groups"] = [
+            device_group
+            for device_group in device_groups
+            if owners[("device-group", device_group["name"])] == index
+        ]
+        configuration["network-slices"] = [
+            network_slice
+            for network_slice in network_slices
+            if owners[("network-slice", network_slice["name"])] == index
+        ]
+        owned_intervals = sorted(
+            (int(imsi_range["start"]), int(imsi_range["end"]), owners[("device-group", name)])
+            for name, imsi_ranges in device_group_imsis.items()
+            for imsi_range in imsi_ranges
+        )
+        configuration["subscribers"] = list(
+            _shard_subscribers(
+                configuration.get("subscribers") or [], owned_intervals, index, count
+            )
+        )
+    return {**config, "configuration": configuration}
+
+
+def _unit_number(unit_name: str) -> int:
+    return int(unit_name.rsplit("/", 1)[1])
+
+
+def _assign_shards(
+    device_group_imsis: Mapping[str, List[Mapping[str, str]]],
+    network_slices: List[Mapping],
+    count: int,
+) -> Dict[Tuple[str, str], int]:
+    """Assigns each device group and network slice to a shard.
+
+    Network slices and the device groups they reference are grouped together, then the groups
+    are assigned, largest first, to the shard with the fewest IMSIs so far.
+
+    Returns:
+        Dict[Tuple[str, str], int]: Shard index of each `("device-group", name)` and
+            `("network-slice", name)`.
+    """
+    parents: Dict[Tuple[str, str], Tuple[str, str]] = {
+        ("device-group", name): ("device-group", name) for name in device_group_imsis
+    }
+
+    def root(key: Tuple[str, str]) -> Tuple[str, str]:
+        while parents[key] != key:
+            parents[key] = parents[parents[key]]
+            key = parents[key]
+        return key
+
+    for network_slice in network_slices:
+        slice_key = ("network-slice", network_slice["name"])
+        parents[slice_key] = slice_key
+        for name in network_slice.get("site-device-group") or []:
+            parents[root(("device-group", name))] = root(slice_key)
+    groups: Dict[Tuple[str, str], List[Tuple[str, str]]] = {}
+    for key in parents:
+        groups.setdefault(root(key), []).append(key)
+    weights = {
+        group_root: sum(
+            int(imsi_range["end"]) - int(imsi_range["start"]) + 1
+            for kind, name in members
+            if kind == "device-group"
+            for imsi_range in device_group_imsis[name]
+        )
+        for group_root, members in groups.items()
+    }
+    loads = [0] * count
+    owners = {}
+    for group_root in sorted(groups, key=lambda key: (-weights[key], min(groups[key]))):
+        shard = min(range(count), key=lambda index: (loads[index], index))
+        loads[shard] += weights[group_root]
+        owners.update((key, shard) for key in groups[group_root])
+    return owners
+
+
+def _subscriber_bounds(subscriber: Mapping[str, Any]) -> Tuple[int, int]:
+    return int(subscriber["ueId-start"]), int(subscriber["ueId-end"])
+
+
+def _shard_subscribers(
+    subscribers: List[Mapping], owned_intervals: List[OwnedInterval], index: int, count: int
+) -> Iterator[dict]:
+    """Yields the subscriber ranges of a shard, cutting ranges at shard boundaries."""
+    pieces: List[SubscriberPiece] = []
+    unowned: List[SubscriberPiece] = []
+    for start, end, owner, subscriber in _cut_subscribers(subscribers, owned_intervals):
+        if owner is None:
+            unowned.append((start, end, subscriber))
+        elif owner == index:
+            pieces.append((start, end, subscriber))
+    pieces.extend(_contiguous_share(unowned, index, count))
+    yield from _merge_pieces(sorted(pieces, key=lambda piece: piece[0]))
+
+
+def _cut_subscribers(
+    subscribers: List[Mapping], owned_intervals: List[OwnedInterval]
+) -> Iterator[Tuple[int, int, Optional[int], Mapping[str, Any]]]:
+    """Cuts sorted subscriber ranges at the boundaries of the device group IMSI intervals.
+
+    Yields:
+        Tuple[int, int, Optional[int], Mapping]: First and last IMSI of each piece, the shard
+            owning the device group the piece belongs to or None, and its subscriber.
+    """
+    interval_ends = [end for _, end, _ in owned_intervals]
+    for subscriber in sorted(subscribers, key=_subscriber_bounds):
+        start, end = _subscriber_bounds(subscriber)
+        position = bisect_left(interval_ends, start)
+        while start <= end:
+            if position < len(owned_intervals) and owned_intervals[position][0] <= start:
+                _, interval_end, owner = owned_intervals[position]
+                last = min(end, interval_end)
+                yield start, last, owner, subscriber
+                position += 1
+            else:
+                next_start = (
+                    owned_intervals[position][0] if position < len(owned_intervals) else end + 1
+                )
+                last = min(end, next_start - 1)
+                yield start, last, None, subscriber
+            start = last + 1
+
+
+def _contiguous_share(
+    pieces: List[SubscriberPiece], index: int, count: int
+) -> Iterator[SubscriberPiece]:
+    """Yields a shard's contiguous, near-equal share of sorted subscriber pieces."""
+    total = sum(end - start + 1 for start, end, _ in pieces)
+    shard_start, shard_end = index * total // count, (index + 1) * total // count
+    position = 0
+    for start, end, subscriber in pieces:
+        size = end - start + 1
+        first, last = max(shard_start, position), min(shard_end, position + size)
+        if first < last:
+            yield start + first - position, start + last - position - 1, subscriber
+        position += size
+
+
+def _merge_pieces(pieces: Iterable[SubscriberPiece]) -> Iterator[dict]:
+    """Turns sorted pieces into subscriber ranges, joining adjacent pieces of a subscriber."""
+    merged: List[List[Any]] = []
+    for start, end, subscriber in pieces:
+        if merged and merged[-1][2] is subscriber and merged[-1][1] + 1 == start:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end, subscriber])
+    for start, end, subscriber in merged:
+        width = len(str(subscriber["ueId-start"]))
+        yield {
+            **subscriber,
+            "ueId-start": str(start).zfill(width),
+            "ueId-end": str(end).zfill(width),
+        }
@@ -0,0 +1,369 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Compact config model for simapp and streaming rendering of `simapp.yaml`.
+
+Device groups in the charm's config model may declare their IMSIs as ranges:
+
+```yaml
+device-groups:
+- name: 5g-gnbsim-user-group1
+  imsi-ranges:
+  - start: "208930100007487"
+    end: "208930100007500"
+```
+
+simapp only understands explicit `imsis` lists, so the ranges are expanded lazily while the
+config is rendered. Rendering emits YAML events one at a time and yields the text in chunks,
+meaning neither the expanded IMSI list nor the rendered file is ever held in memory.
+
+Configs written by operators list thousands of consecutive IMSIs explicitly. On ingest,
+`compact_config` sorts them and coalesces consecutive IMSIs into ranges, giving every config
+a canonical form: the same device group always has the same digest, whatever the order of its
+IMSIs, and the charm hashes and renders a handful of ranges instead of every IMSI.
+"""
+
+from dataclasses import dataclass
+from typing import IO, Any, Dict, Iterable, Iterator, List, Mapping, Tuple, Union
+
+import yaml
+from yaml.events import (
+    DocumentEndEvent,
+    DocumentStartEvent,
+    Event,
+    MappingEndEvent,
+    MappingStartEvent,
+    ScalarEvent,
+    SequenceEndEvent,
+    SequenceStartEvent,
+    StreamEndEvent,
+    StreamStartEvent,
+)
+from yaml.nodes import ScalarNode
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # pragma: no cover
+    from yaml import SafeDumper  # type: ignore[assignment]
+    from yaml import SafeLoader  # type: ignore[assignment]
+
+IMSI_RANGES_KEY = "imsi-ranges"
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_STR_TAG = "tag:yaml.org,2002:str"
+# Returned by `next` on exhausted iterators, since lists may hold None
+_END = object()
+
+
+def load_config(stream: Union[str, bytes, IO]) -> Any:
+    """Parses a config, using libyaml when it is available.
+
+    Args:
+        stream: YAML document or open file.
+
+    Returns:
+        The parsed config.
+    """
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def expand_imsi_range(start: str, end: str) -> Iterator[str]:
+    """Yields every IMSI between `start` and `end`, both included.
+
+    Leading zeros are preserved using the width of `start`.
+
+    Args:
+        start: First IMSI of the range.
+        end: Last IMSI of the range.
+
+    Yields:
+        str: IMSIs in ascending order.
+    """
+    width = len(start)
+    for imsi in range(int(start), int(end) + 1):
+        yield str(imsi).zfill(width)
+
+
+def device_group_imsis(device_group: Mapping[str, Any]) -> Iterator[str]:
+    """Yields the explicit IMSIs of a device group followed by its expanded IMSI ranges.
+
+    Args:
+        device_group: A device group from the config model.
+
+    Yields:
+        str: IMSIs belonging to the device group.
+    """
+    yield from device_group.get("imsis") or []
+    for imsi_range in device_group.get(IMSI_RANGES_KEY) or []:
+        yield from expand_imsi_range(str(imsi_range["start"]), str(imsi_range["end"]))
+
+
+@dataclass(frozen=True)
+class ImsiCompaction:
+    """Outcome of compacting the device group IMSIs of a config."""
+
+    entries: int
+    ranges: int
+
+    @property
+    def ratio(self) -> float:
+        """Number of IMSI entries, explicit IMSIs and ranges, replaced by each range."""
+        return self.entries / self.ranges if self.ranges else 1.0
+
+
+def compact_imsis(
+    imsis: Iterable[Union[str, int]], imsi_ranges: Iterable[Mapping[str, Any]] = ()
+) -> List[Dict[str, str]]:
+    """Sorts IMSIs and ranges and coalesces the consecutive or overlapping ones into ranges.
+
+    IMSIs of different widths are never coalesced, so that leading zeros are preserved when
+    the ranges are expanded.
+
+    Args:
+        imsis: Explicit IMSIs.
+        imsi_ranges: IMSI ranges, mappings with `start` and `end` keys.
+
+    Returns:
+        List[Dict[str, str]]: Disjoint ranges covering the same IMSIs, in ascending order.
+    """
+    imsis_by_width: Dict[int, List[int]] = {}
+    for imsi in imsis:
+        imsi = str(imsi)
+        imsis_by_width.setdefault(len(imsi), []).append(int(imsi))
+    intervals = [
+        (width, start, end)
+        for width, values in imsis_by_width.items()
+        for start, end in _runs(sorted(values))
+    ]
+    for imsi_range in imsi_ranges:
+        start = str(imsi_range["start"])
+        intervals.append((len(start), int(start), int(imsi_range["end"])))
+    intervals.sort()
+    compacted: List[List[int]] = []
+    for width, start, end in intervals:
+        if compacted and compacted[-1][0] == width and start <= compacted[-1][2] + 1:
+            compacted[-1][2] = max(compacted[-1][2], end)
+        else:
+            compacted.append([width, start, end])
+    return [
+        {"start": str(start).zfill(width), "end": str(end).zfill(width)}
+        for width, start, end in compacted
+    ]
+
+
+def _runs(values: List[int]) -> Iterator[Tuple[int, int]]:
+    """Yields the runs of consecutive or repeated values of a sorted list as (first, last)."""
+    start = end = values[0]
+    for value in values:
+        if value > end + 1:
+            yield start, end
+            start = value
+        end = value
+    yield start, end
+
+
+def compact_config(config: Mapping[str, Any]) -> Tuple[Mapping[str, Any], ImsiCompaction]:
+    """Returns a shallow copy of the config where device group IMSIs are compacted into ranges.
+
+    Explicit `imsis` lists and `imsi-ranges` are merged into sorted, disjoint `imsi-ranges`,
+    which `render_config` expands back into the explicit list simapp reads.
+
+    Args:
+        config: The config model, as loaded from YAML.
+
+    Returns:
+        Tuple[Mapping, ImsiCompaction]: The compacted config and how much it was compacted.
+    """
+    configuration = config.get("configuration")
+    if not configuration or not configuration.get("device-groups"):
+        return config, ImsiCompaction(entries=0, ranges=0)
+    entries = ranges = 0
+    device_groups = []
+    for device_group in configuration["device-groups"]:
+        imsis = device_group.get("imsis") or []
+        imsi_ranges = device_group.get(IMSI_RANGES_KEY) or []
+        compacted = {}
+        for key, value in device_group.items():
+            if key in ("imsis", IMSI_RANGES_KEY):
+                if IMSI_RANGES_KEY not in compacted:
+                    compacted[IMSI_RANGES_KEY] = compact_imsis(imsis, imsi_ranges)
+                    entries += len(imsis) + len(imsi_ranges)
+                    ranges += len(compacted[IMSI_RANGES_KEY])
+                continue
+            compacted[key] = value
+        device_groups.append(compacted)
+    compaction = ImsiCompaction(entries=entries, ranges=ranges)
+    return {
+        **config,
+        "configuration": {**configuration, "device-groups": device_groups},
+    }, compaction
+
+
+def subscriber_count(config: Mapping[str, Any]) -> int:
+    """Returns the number of subscribers declared by the `ueId-start`/`ueId-end` ranges.
+
+    Args:
+        config: The config model, as loaded from YAML.
+
+    Returns:
+        int: Number of subscribers.
+    """
+    subscribers = (config.get("configuration") or {}).get("subscribers") or []
+    return sum(
+        int(subscriber["ueId-end"]) - int(subscriber["ueId-start"]) + 1
+        for subscriber in subscribers
+    )
+
+
+def render_config(
+    config: Mapping[str, Any], chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[str]:
+    """Renders a config model to simapp YAML, yielding the text in chunks.
+
+    Args:
+        config: The config model, as loaded from YAML.
+        chunk_size: Approximate size, in characters, of the yielded chunks.
+
+    Yields:
+        str: Successive chunks of the rendered `simapp.yaml`.
+    """
+    buffer = _ChunkBuffer()
+    dumper = SafeDumper(buffer, default_flow_style=False, sort_keys=False)
+    for event in _document_events(_expand(config), dumper):
+        dumper.emit(event)
+        if buffer.size >= chunk_size:
+            yield buffer.drain()
+    dumper.dispose()
+    if buffer.size:
+        yield buffer.drain()
+
+
+def _expand(config: Mapping[str, Any]) -> Mapping[str, Any]:
+    """Returns a shallow copy of the config where device group IMSI ranges are lazy lists."""
+    configuration = config.get("configuration")
+    if not configuration or not configuration.get("device-groups"):
+        return config
+    device_groups = [
+        _expand_device_group(device_group) for device_group in configuration["device-groups"]
+    ]
+    return {**config, "configuration": {**configuration, "device-groups": device_groups}}
+
+
+def _expand_device_group(device_group: Mapping[str, Any]) -> Mapping[str, Any]:
+    if IMSI_RANGES_KEY not in device_group:
+        return device_group
+    expanded = {}
+    for key, value in device_group.items():
+        if key in ("imsis", IMSI_RANGES_KEY):
+            if "imsis" not in expanded:
+                expanded["imsis"] = _ImsiSequence(device_group)
+            continue
+        expanded[key] = value
+    return expanded
+
+
+def _document_events(data: Any, dumper: SafeDumper) -> Iterator[Event]:
+    yield StreamStartEvent()
+    yield DocumentStartEvent(explicit=False)
+    yield from _node_events(data, dumper, {})
+    yield DocumentEndEvent(explicit=False)
+    yield StreamEndEvent()
+
+
+def _node_events(
+    data: Any, dumper: SafeDumper, key_events: Dict[Tuple[type, Any], ScalarEvent]
+) -> Iterator[Event]:
+    """Yields the events of a node.
+
+    Mapping keys repeat across list items, e.g. the fields of every subscriber, so their events
+    are built once and kept in `key_events`.
+    """
+    if type(data) is str:
+        yield _str_event(data, dumper)
+    elif isinstance(data, _ImsiSequence):
+        yield from data.events()
+    elif isinstance(data, Mapping):
+        yield MappingStartEvent(anchor=None, tag=None, implicit=True, flow_style=False)
+        for key, value in data.items():
+            cache_key = (type(key), key)
+            key_event = key_events.get(cache_key)
+            if key_event is None:
+                key_event = key_events[cache_key] = _scalar_event(key, dumper)
+            yield key_event
+            yield from _node_events(value, dumper, key_events)
+        yield MappingEndEvent()
+    elif isinstance(data, Iterable) and not isinstance(data, bytes):
+        items = iter(data)
+        first = next(items, _END)
+        yield SequenceStartEvent(anchor=None, tag=None, implicit=True, flow_style=first is _END)
+        if first is not _END:
+            yield from _node_events(first, dumper, key_events)
+            for item in items:
+                yield from _node_events(item, dumper, key_events)
+        yield SequenceEndEvent()
+    else:
+        yield _scalar_event(data, dumper)
+
+
+def _scalar_event(data: Any, dumper: SafeDumper) -> ScalarEvent:
+    node = dumper.represent_data(data)
+    implicit = (
+        node.tag == dumper.resolve(ScalarNode, node.value, (True, False)),
+        node.tag == dumper.resolve(ScalarNode, node.value, (False, True)),
+    )
+    return ScalarEvent(anchor=None, tag=node.tag, implicit=implicit, value=node.value)
+
+
+def _str_event(value: str, dumper: SafeDumper) -> ScalarEvent:
+    """Builds the event of a string without going through the representer.
+
+    A string can always be emitted quoted, and only needs to be when it would otherwise be
+    resolved to another type, e.g. `"20893"`.
+    """
+    implicit = (dumper.resolve(ScalarNode, value, (True, False)) == _STR_TAG, True)
+    return ScalarEvent(anchor=None, tag=_STR_TAG, implicit=implicit, value=value)
+
+
+class _ImsiSequence:
+    """Lazily expanded IMSI list of a device group.
+
+    IMSIs are always strings of digits, so their scalar events are built directly instead of
+    going through the generic representer and resolver, which dominate rendering time for
+    large device groups.
+    """
+
+    def __init__(self, device_group: Mapping[str, Any]):
+        self._device_group = device_group
+
+    def events(self) -> Iterator[Event]:
+        imsis = device_group_imsis(self._device_group)
+        first = next(imsis, _END)
+        yield SequenceStartEvent(anchor=None, tag=None, implicit=True, flow_style=first is _END)
+        if first is not _END:
+            yield _imsi_event(first)
+            for imsi in imsis:
+                yield _imsi_event(imsi)
+        yield SequenceEndEvent()
+
+
+def _imsi_event(imsi: str) -> ScalarEvent:
+    return ScalarEvent(anchor=None, tag=_STR_TAG, implicit=(False, True), value=imsi)
+
+
+class _ChunkBuffer:
+    """Minimal text stream collecting what the YAML emitter writes until it is drained."""
+
+    def __init__(self):
+        self._parts: list = []
+        self.size = 0
+
+    def write(self, data: str) -> None:
+        self._parts.append(data)
+        self.size += len(data)
+
+    def drain(self) -> str:
+        chunk = "".join(self._parts)
+        self._parts = []
+        self.size = 0
+        return chunk
@@ -0,0 +1,326 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Versioned, content-addressed store of the config files applied to simapp.
+
+Every config file applied to the workload is recorded as a revision. Contents are stored once,
+gzip-compressed, in a blob named after the SHA-256 digest of the uncompressed file, so that
+applying the same file again, or rolling back to it, only adds an entry to the index. The
+history is bounded: the oldest revisions are evicted, along with the blobs no other revision
+refers to.
+
+Files are recorded while they are streamed to the workload, so recording never reads them
+back. Restoring a revision decompresses its blob next to the destination and swaps it in with
+an atomic rename: the file is never uploaded, parsed or rendered again.
+
+Layout of the store:
+
+    <root>/index.json          revisions, oldest first
+    <root>/blobs/<digest>.gz   gzip-compressed file contents
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import IO, Iterable, Iterator, List, Optional, Union
+
+from streaming_push import read_chunks
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE_NAME = "index.json"
+BLOBS_DIRECTORY_NAME = "blobs"
+BLOB_SUFFIX = ".gz"
+# Recording happens while configs are pushed: level 1 is twice as fast as 6 for nearly the same
+# ratio on simapp configs
+COMPRESSION_LEVEL = 1
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot can't be recorded or restored."""
+
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+
+@dataclass(frozen=True)
+class Revision:
+    """A recorded version of the config file."""
+
+    revision: int
+    digest: str
+    size: int
+    stored_size: int
+    created: float
+    source: str
+
+
+class SnapshotRecorder:
+    """Records a file into the store while its chunks are consumed.
+
+    Recording is best effort: once writing to the store fails, chunks are still passed through
+    and the error is kept in `error`.
+    """
+
+    def __init__(self, file: Optional[IO[bytes]], error: Optional[OSError] = None):
+        """Constructor for SnapshotRecorder.
+
+        Args:
+            file: Temporary file the compressed content is written to, None if it couldn't be
+                created.
+            error: Why the file couldn't be created.
+        """
+        self._file = file
+        self._hash = hashlib.sha256()
+        self._compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        self.size = 0
+        self.error = error
+
+    def tee(
+        self, chunks: Iterable[Union[str, bytes]], encoding: str = "utf-8"
+    ) -> Iterator[Union[str, bytes]]:
+        """Yields chunks unchanged, recording them on the way.
+
+        Args:
+            chunks: Text or bytes chunks making up the file.
+            encoding: Encoding of text chunks.
+
+        Yields:
+            The chunks.
+        """
+        for chunk in chunks:
+            if not self.error:
+                self._record(chunk.encode(encoding) if isinstance(chunk, str) else chunk)
+            yield chunk
+
+    def _record(self, data: bytes) -> None:
+        self._hash.update(data)
+        self.size += len(data)
+        try:
+            self._file.write(self._compressor.compress(data))  # type: ignore[union-attr]
+        except OSError as e:
+            self.error = e
+
+    def close(self) -> str:
+        """Flushes the compressed content and returns the digest of the recorded file."""
+        self._file.write(self._compressor.flush())
+        self._file.close()
+        return self._hash.hexdigest()
+
+
+class SnapshotStore:
+    """Content-addressed store of config file revisions with a bounded history."""
+
+    def __init__(self, root: Union[str, Path], history: int):
+        """Constructor for SnapshotStore.
+
+        Args:
+            root: Directory of the store, created when the first revision is recorded.
+            history: Maximum number of revisions kept, at least 1.
+        """
+        self.root = Path(root)
+        self.history = max(history, 1)
+
+    @property
+    def _blobs(self) -> Path:
+        return self.root / BLOBS_DIRECTORY_NAME
+
+    def revisions(self) -> List[Revision]:
+        """Returns the revisions of the store, oldest first.
+
+        Raises:
+            SnapshotError: if the index can't be read or is malformed.
+        """
+        try:
+            with open(self.root / INDEX_FILE_NAME) as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            raise SnapshotError(f"Can't read snapshot index: {e}")
+        try:
+            return [Revision(**revision) for revision in index["revisions"]]
+        except (KeyError, TypeError) as e:
+            raise SnapshotError(f"Malformed snapshot index: {e!r}")
+
+    def revision(self, revision: Optional[int] = None) -> Revision:
+        """Returns a revision, by default the one before the latest.
+
+        Raises:
+            SnapshotError: if the revision doesn't exist.
+        """
+        revisions = self.revisions()
+        if revision is None:
+            if len(revisions) < 2:
+                raise SnapshotError("No previous revision to roll back to")
+            return revisions[-2]
+        for candidate in revisions:
+            if candidate.revision == revision:
+                return candidate
+        available = ", ".join(str(candidate.revision) for candidate in revisions) or "none"
+        raise SnapshotError(f"Unknown revision {revision}, available revisions: {available}")
+
+    @contextmanager
+    def recording(self, source: str) -> Iterator[SnapshotRecorder]:
+        """Records the chunks consumed through the recorder as a new revision.
+
+        The revision is only added when the block completes; if it raises, nothing is recorded.
+        Failing to record never interrupts the block: errors are raised once it completes.
+
+        Args:
+            source: Description of where the file comes from, e.g. the action applying it.
+
+        Yields:
+            SnapshotRecorder: Recorder whose `tee` must be given the chunks of the file.
+
+        Raises:
+            SnapshotError: if the file couldn't be recorded, after the block completed.
+        """
+        try:
+            self._blobs.mkdir(parents=True, exist_ok=True)
+            file = tempfile.NamedTemporaryFile(dir=self._blobs, suffix=".tmp", delete=False)
+        except OSError as e:
+            yield SnapshotRecorder(None, error=e)
+            raise SnapshotError(f"Can't record snapshot: {e}")
+        recorder = SnapshotRecorder(file)
+        try:
+            yield recorder
+        except BaseException:
+            _discard(file)
+            raise
+        try:
+            if recorder.error:
+                raise recorder.error
+            digest = recorder.close()
+            blob = self._blob(digest)
+            if blob.exists():
+                os.unlink(file.name)
+            else:
+                os.replace(file.name, blob)
+            self._append(digest, recorder.size, source)
+        except OSError as e:
+            _discard(file)
+            raise SnapshotError(f"Can't record snapshot: {e}")
+
+    def save(self, chunks: Iterable[Union[str, bytes]], source: str) -> Revision:
+        """Records a file as a new revision.
+
+        Args:
+            chunks: Text or bytes chunks making up the file.
+            source: Description of where the file comes from.
+
+        Returns:
+            Revision: The new revision.
+
+        Raises:
+            SnapshotError: if the file couldn't be recorded.
+        """
+        with self.recording(source) as recorder:
+            for _ in recorder.tee(chunks):
+                pass
+        return self.revisions()[-1]
+
+    def restore(self, revision: Revision, destination: Union[str, Path]) -> None:
+        """Atomically replaces a file with the content of a revision.
+
+        Args:
+            revision: Revision to restore.
+            destination: Path of the file to replace.
+
+        Raises:
+            SnapshotError: if the blob of the revision is missing or corrupted.
+        """
+        destination = Path(destination)
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        digest = hashlib.sha256()
+        file = tempfile.NamedTemporaryFile(
+            dir=destination.parent, prefix=f".{destination.name}.", delete=False
+        )
+        try:
+            with file, open(self._blob(revision.digest), "rb") as blob:
+                for chunk in read_chunks(blob):
+                    data = decompressor.decompress(chunk)
+                    digest.update(data)
+                    file.write(data)
+                data = decompressor.flush()
+                digest.update(data)
+                file.write(data)
+            if digest.hexdigest() != revision.digest:
+                raise SnapshotError(f"Blob of revision {revision.revision} is corrupted")
+            os.chmod(file.name, 0o644)
+            os.replace(file.name, destination)
+        except (OSError, zlib.error) as e:
+            os.unlink(file.name)
+            raise SnapshotError(f"Can't restore revision {revision.revision}: {e}")
+        except BaseException:
+            os.unlink(file.name)
+            raise
+
+    def rollback(self, revision: Optional[int], destination: Union[str, Path]) -> Revision:
+        """Restores a revision and records it as the latest revision.
+
+        Args:
+            revision: Revision to restore, by default the one before the latest.
+            destination: Path of the file to replace.
+
+        Returns:
+            Revision: The revision that was restored.
+
+        Raises:
+            SnapshotError: if the revision doesn't exist or can't be restored.
+        """
+        restored = self.revision(revision)
+        self.restore(restored, destination)
+        try:
+            self._append(restored.digest, restored.size, f"rollback to {restored.revision}")
+        except OSError as e:
+            # The file is restored already, only the history misses the rollback
+            logger.warning("Could not record rollback to revision %d: %s", restored.revision, e)
+        return restored
+
+    def _blob(self, digest: str) -> Path:
+        return self._blobs / f"{digest}{BLOB_SUFFIX}"
+
+    def _append(self, digest: str, size: int, source: str) -> None:
+        """Adds a revision to the index, then evicts revisions and blobs beyond the history."""
+        revisions = self.revisions()
+        revisions.append(
+            Revision(
+                revision=revisions[-1].revision + 1 if revisions else 1,
+                digest=digest,
+                size=size,
+                stored_size=self._blob(digest).stat().st_size,
+                created=time.time(),
+                source=source,
+            )
+        )
+        evicted, revisions = revisions[: -self.history], revisions[-self.history :]  # noqa: E203
+        self._write_index(revisions)
+        kept = {revision.digest for revision in revisions}
+        for digest in {revision.digest for revision in evicted} - kept:
+            self._blob(digest).unlink(missing_ok=True)
+
+    def _write_index(self, revisions: List[Revision]) -> None:
+        file = tempfile.NamedTemporaryFile(
+            "w", dir=self.root, prefix=f".{INDEX_FILE_NAME}.", delete=False
+        )
+        with file:
+            json.dump({"revisions": [asdict(revision) for revision in revisions]}, file)
+        os.replace(file.name, self.root / INDEX_FILE_NAME)
+
+
+def _discard(file: IO[bytes]) -> None:
+    """Closes and removes a temporary file, ignoring errors."""
+    try:
+        file.close()
+    except OSError:
+        pass
+    Path(file.name).unlink(missing_ok=True)
@@ -0,0 +1,172 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Streaming upload of files to a workload container.
+
+`Container.push` reads file-like sources in fixed-size chunks, so wrapping a generator of
+chunks in a file-like object lets large files be uploaded without ever being held in memory.
+Uploads can optionally be gzip-compressed on the fly and unpacked by the workload, falling back
+to unpacking them in the charm when the workload can't.
+"""
+
+import io
+import logging
+import zlib
+from typing import IO, AnyStr, Iterable, Iterator, Optional, Union
+
+from ops.model import Container
+from ops.pebble import APIError, ExecError
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+GZIP_SUFFIX = ".gz"
+
+
+class ChunkedReader(io.RawIOBase):
+    """Read-only binary file object backed by an iterable of text or bytes chunks."""
+
+    def __init__(self, chunks: Iterable[Union[str, bytes]], encoding: str = "utf-8"):
+        self._chunks = iter(chunks)
+        self._encoding = encoding
+        self._pending = memoryview(b"")
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        """Returns True, this stream can always be read."""
+        return True
+
+    def readinto(self, buffer) -> int:  # type: ignore[no-untyped-def]
+        """Reads up to len(buffer) bytes into buffer.
+
+        Args:
+            buffer: Writable buffer to fill.
+
+        Returns:
+            int: Number of bytes read, 0 at the end of the stream.
+        """
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            if isinstance(chunk, str):
+                chunk = chunk.encode(self._encoding)
+            self._pending = memoryview(chunk)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        self.bytes_read += size
+        return size
+
+
+def read_chunks(file: IO[AnyStr], chunk_size: int = CHUNK_SIZE) -> Iterator[AnyStr]:
+    """Yields the content of an open file in fixed-size chunks.
+
+    Args:
+        file: An open file object.
+        chunk_size: Size of the yielded chunks.
+
+    Yields:
+        Successive chunks of the file.
+    """
+    while chunk := file.read(chunk_size):
+        yield chunk
+
+
+def gzip_chunks(
+    chunks: Iterable[Union[str, bytes]], encoding: str = "utf-8", level: int = 6
+) -> Iterator[bytes]:
+    """Gzip-compresses an iterable of chunks on the fly.
+
+    Args:
+        chunks: Text or bytes chunks to compress.
+        encoding: Encoding used for text chunks.
+        level: zlib compression level.
+
+    Yields:
+        bytes: Chunks of the gzip stream.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode(encoding)
+        if compressed := compressor.compress(chunk):
+            yield compressed
+    yield compressor.flush()
+
+
+def push_stream(
+    container: Container,
+    path: str,
+    chunks: Iterable[Union[str, bytes]],
+    compress: bool = False,
+    permissions: Optional[int] = None,
+) -> int:
+    """Pushes a file to the container from an iterable of chunks.
+
+    When `compress` is set, the content is gzip-compressed while it is uploaded next to `path`
+    and unpacked in place by running `gunzip` in the workload container. If `gunzip` is missing
+    or fails, the compressed file is streamed back, unpacked by the charm and pushed
+    uncompressed, and the compressed file is removed.
+
+    Args:
+        container: Workload container.
+        path: Destination path in the container.
+        chunks: Text or bytes chunks making up the file.
+        compress: Whether to gzip the upload.
+        permissions: Optional permissions of the pushed file.
+
+    Returns:
+        int: Number of bytes sent to the container.
+    """
+    if compress:
+        source = ChunkedReader(gzip_chunks(chunks))
+        gzip_path = f"{path}{GZIP_SUFFIX}"
+        container.push(path=gzip_path, source=source, permissions=permissions)
+        try:
+            container.exec(["gunzip", "-f", gzip_path]).wait()
+        except (APIError, ExecError) as e:
+            logger.warning(
+                "Could not unpack %s in the workload, pushing it unpacked: %s", gzip_path, e
+            )
+            return source.bytes_read + _push_unpacked(container, gzip_path, path, permissions)
+    else:
+        source = ChunkedReader(chunks)
+        container.push(path=path, source=source, permissions=permissions)
+    logger.info("Pushed %d bytes to %s", source.bytes_read, path)
+    return source.bytes_read
+
+
+def gunzip_chunks(chunks: Iterable[bytes], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Decompresses a gzip stream given in chunks.
+
+    Args:
+        chunks: Chunks of the gzip stream.
+        chunk_size: Maximum size of the decompressed chunks, so that a highly compressed
+            chunk never expands in memory at once.
+
+    Yields:
+        bytes: Chunks of the decompressed content.
+    """
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        while chunk and not decompressor.eof:
+            if decompressed := decompressor.decompress(chunk, chunk_size):
+                yield decompressed
+            chunk = decompressor.unconsumed_tail
+    if remainder := decompressor.flush():
+        yield remainder
+
+
+def _push_unpacked(
+    container: Container, gzip_path: str, path: str, permissions: Optional[int]
+) -> int:
+    """Unpacks a gzip file of the container into `path` through the charm, then removes it."""
+    try:
+        with container.pull(gzip_path, encoding=None) as file:
+            source = ChunkedReader(gunzip_chunks(read_chunks(file)))
+            container.push(path=path, source=source, permissions=permissions)
+    finally:
+        container.remove_path(gzip_path)
+    logger.info("Pushed %d bytes to %s", source.bytes_read, path)
+    return source.bytes_read
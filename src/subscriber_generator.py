@@ -0,0 +1,201 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Synthetic subscriber populations for load testing.
+
+A population is a contiguous IMSI range split into batches: each batch becomes one subscriber
+range of the config, sharing its K, OPc and sequence number, so that the batch size trades
+config size for credential diversity. Credentials are either derived from a seed, which makes
+populations reproducible, or drawn at random.
+
+Subscribers are generated lazily while the config is rendered, and device groups declare their
+IMSIs as ranges, so populations of millions of subscribers are never held in memory.
+"""
+
+import hashlib
+import secrets
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Mapping
+
+from simapp_config import IMSI_RANGES_KEY
+
+DETERMINISTIC = "deterministic"
+RANDOM = "random"
+
+
+class PopulationError(Exception):
+    """Raised when a population can't be generated."""
+
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+
+@dataclass(frozen=True)
+class Population:
+    """Description of a synthetic subscriber population."""
+
+    start_imsi: str
+    count: int
+    batch_size: int = 1000
+    device_groups: int = 1
+    network_slices: int = 1
+    credentials: str = DETERMINISTIC
+    seed: str = "simapp"
+
+    def __post_init__(self):
+        """Validates the population.
+
+        Raises:
+            PopulationError: if the population is invalid.
+        """
+        if not self.start_imsi.isdigit():
+            raise PopulationError(f"Invalid start IMSI `{self.start_imsi}`")
+        if self.count < 1 or self.batch_size < 1:
+            raise PopulationError("Subscriber count and batch size must be positive")
+        if len(str(self.end_imsi)) > len(self.start_imsi):
+            raise PopulationError(f"{self.count} subscribers don't fit after {self.start_imsi}")
+        if not 1 <= self.network_slices <= self.device_groups <= self.count:
+            raise PopulationError(
+                "Expected 1 <= network slices <= device groups <= subscriber count"
+            )
+        if self.credentials not in (DETERMINISTIC, RANDOM):
+            raise PopulationError(f"Unknown credentials mode `{self.credentials}`")
+
+    @property
+    def end_imsi(self) -> int:
+        """Last IMSI of the population."""
+        return int(self.start_imsi) + self.count - 1
+
+    @property
+    def batches(self) -> int:
+        """Number of subscriber ranges of the population."""
+        return -(-self.count // self.batch_size)
+
+
+class Subscribers:
+    """Lazily generated subscriber ranges of a population.
+
+    Random credentials are drawn again on every iteration, so a population should only be
+    rendered once.
+    """
+
+    def __init__(self, population: Population, template: Mapping[str, Any]):
+        """Constructor for Subscribers.
+
+        Args:
+            population: Population to generate.
+            template: Subscriber whose other fields, e.g. `plmnId`, are copied.
+        """
+        self._population = population
+        self._template = template
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Yields one subscriber range per batch."""
+        population = self._population
+        width = len(population.start_imsi)
+        for start in range(
+            int(population.start_imsi), population.end_imsi + 1, population.batch_size
+        ):
+            end = min(start + population.batch_size - 1, population.end_imsi)
+            ue_id_start = str(start).zfill(width)
+            yield {
+                **self._template,
+                **self._credentials(ue_id_start),
+                "ueId-start": ue_id_start,
+                "ueId-end": str(end).zfill(width),
+            }
+
+    def _credentials(self, ue_id_start: str) -> Dict[str, str]:
+        if self._population.credentials == RANDOM:
+            key, opc, sequence_number = (
+                secrets.token_hex(16),
+                secrets.token_hex(16),
+                secrets.token_hex(6),
+            )
+        else:
+            digest = hashlib.sha256(f"{self._population.seed}:{ue_id_start}".encode()).hexdigest()
+            key, opc = digest[:32], digest[32:]
+            sequence_number = hashlib.sha256(digest.encode()).hexdigest()[:12]
+        return {"key": key, "opc": opc, "sequenceNumber": sequence_number}
+
+
+def generate_config(template: Mapping[str, Any], population: Population) -> dict:
+    """Returns a config model provisioning a synthetic population.
+
+    The provisioning endpoint, device group and network slice settings are taken from the first
+    device group and network slice of the template.
+
+    Args:
+        template: Config model used as a template.
+        population: Population to generate.
+
+    Returns:
+        dict: Config model whose subscribers are generated lazily.
+
+    Raises:
+        PopulationError: if the template lacks a subscriber, device group or network slice.
+    """
+    configuration = template.get("configuration") or {}
+    for section in ("subscribers", "device-groups", "network-slices"):
+        if not configuration.get(section):
+            raise PopulationError(f"Template has no `{section}` to generate from")
+    subscriber = {
+        key: value
+        for key, value in configuration["subscribers"][0].items()
+        if key not in ("ueId-start", "ueId-end")
+    }
+    device_groups = _device_groups(configuration["device-groups"][0], population)
+    network_slices = _network_slices(
+        configuration["network-slices"][0], [group["name"] for group in device_groups], population
+    )
+    return {
+        **template,
+        "configuration": {
+            **configuration,
+            "subscribers": Subscribers(population, subscriber),
+            "device-groups": device_groups,
+            "network-slices": network_slices,
+        },
+    }
+
+
+def _device_groups(template: Mapping[str, Any], population: Population) -> List[dict]:
+    """Splits the population into contiguous IMSI ranges, one per device group."""
+    width, first, count = len(population.start_imsi), int(population.start_imsi), population.count
+    device_groups = []
+    for index in range(population.device_groups):
+        start = first + index * count // population.device_groups
+        end = first + (index + 1) * count // population.device_groups - 1
+        device_group = {key: value for key, value in template.items() if key != "imsis"}
+        device_group.update(
+            {
+                "name": f"load-test-group{index + 1}",
+                "ip-domain-name": f"pool{index + 1}",
+                IMSI_RANGES_KEY: [
+                    {"start": str(start).zfill(width), "end": str(end).zfill(width)}
+                ],
+            }
+        )
+        device_groups.append(device_group)
+    return device_groups
+
+
+def _network_slices(
+    template: Mapping[str, Any], device_group_names: List[str], population: Population
+) -> List[dict]:
+    """Creates network slices with consecutive slice differentiators, sharing device groups."""
+    slice_id = template.get("slice-id") or {}
+    first_sd = int(str(slice_id.get("sd", "000000")), 16)
+    step = population.network_slices
+    network_slices = []
+    for index in range(step):
+        network_slices.append(
+            {
+                **template,
+                "name": f"load-test-slice{index + 1}",
+                "slice-id": {**slice_id, "sd": f"{first_sd + index:06x}"},
+                "site-device-group": device_group_names[index::step],
+            }
+        )
+    return network_slices
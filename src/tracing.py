@@ -0,0 +1,270 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Tracing of charm dispatches in the OpenTelemetry (OTLP) JSON format.
+
+A `Tracer` records one trace per dispatch: a root span covering the whole dispatch, a span per
+event handler and a span per outbound call (Pebble, subprocess or Kubernetes), nested under
+the span that was current when the call was made. The current span is tracked with a context
+variable, so that calls made concurrently by asyncio tasks are parented correctly.
+
+Spans are kept in memory and exported once, at the end of the dispatch, as an OTLP
+`ExportTraceServiceRequest` JSON document: appended as a line to a local file, the format
+read by the OpenTelemetry collector's `otlpjsonfile` receiver, or posted to an OTLP/HTTP
+collector endpoint.
+"""
+
+import functools
+import http.client
+import json
+import logging
+import os
+import secrets
+import time
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds
+INTERNAL = 1
+CLIENT = 3
+
+# OTLP status codes
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+# Trace files are rotated once they reach this size, keeping a single previous file
+TRACE_FILE_MAX_BYTES = 10 * 1024 * 1024
+COLLECTOR_TIMEOUT = 2.0
+
+Handler = TypeVar("Handler", bound=Callable[..., None])
+
+
+@dataclass
+class Span:
+    """A timed operation of a trace."""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: str
+    kind: int
+    start_time: int
+    end_time: int = 0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status_code: int = STATUS_UNSET
+    status_message: str = ""
+
+    def set(self, key: str, value: Any) -> None:
+        """Sets an attribute of the span, e.g. the size of a payload once it is sent."""
+        self.attributes[key] = value
+
+    def to_otlp(self) -> dict:
+        """Returns the span in the OTLP JSON format."""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_time),
+            "endTimeUnixNano": str(self.end_time),
+            "attributes": otlp_attributes(self.attributes),
+            "status": {"code": self.status_code},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+class Tracer:
+    """Records the spans of a single trace."""
+
+    def __init__(self, service_name: str, resource: Optional[Mapping[str, Any]] = None):
+        """Constructor for Tracer.
+
+        Args:
+            service_name: `service.name` of the traced service.
+            resource: Other attributes describing the traced service.
+        """
+        self.service_name = service_name
+        self.resource = {"service.name": service_name, **(resource or {})}
+        self.trace_id = secrets.token_hex(16)
+        self.spans: List[Span] = []
+        self._current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+    def start(self, name: str, kind: int = INTERNAL, **attributes: Any) -> Span:
+        """Starts a span as a child of the current span, without making it current.
+
+        Args:
+            name: Name of the span.
+            kind: OTLP span kind.
+            attributes: Attributes of the span.
+
+        Returns:
+            Span: The started span, to be ended with `end`.
+        """
+        parent = self._current.get()
+        return Span(
+            name=name,
+            trace_id=self.trace_id,
+            span_id=secrets.token_hex(8),
+            parent_span_id=parent.span_id if parent else "",
+            kind=kind,
+            start_time=time.time_ns(),
+            attributes=dict(attributes),
+        )
+
+    def end(self, span: Span) -> None:
+        """Ends a span and records it."""
+        span.end_time = time.time_ns()
+        self.spans.append(span)
+
+    @contextmanager
+    def span(self, name: str, kind: int = INTERNAL, **attributes: Any) -> Iterator[Span]:
+        """Records a span around a block, current while the block runs.
+
+        Exceptions raised by the block mark the span as failed and are re-raised.
+
+        Args:
+            name: Name of the span.
+            kind: OTLP span kind.
+            attributes: Attributes of the span.
+
+        Yields:
+            Span: The span, whose attributes can be set while the block runs.
+        """
+        span = self.start(name, kind, **attributes)
+        token = self._current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status_code = STATUS_ERROR
+            span.status_message = repr(e)
+            raise
+        finally:
+            self._current.reset(token)
+            self.end(span)
+
+    def activate(self, span: Span) -> None:
+        """Makes a span, e.g. the root span of a dispatch, the parent of subsequent spans."""
+        self._current.set(span)
+
+    def client_span(self, name: str, **attributes: Any) -> Any:
+        """Returns a context manager recording a span of an outbound call."""
+        return self.span(name, CLIENT, **attributes)
+
+    def to_otlp(self) -> dict:
+        """Returns the recorded spans as an OTLP `ExportTraceServiceRequest` JSON document."""
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": otlp_attributes(self.resource)},
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": self.service_name},
+                            "spans": [span.to_otlp() for span in self.spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+
+def traced_handler(handler: Handler) -> Handler:
+    """Records a span around an event handler of an object with a `tracer` attribute."""
+
+    @functools.wraps(handler)
+    def wrapper(self: Any, event: Any) -> None:
+        with self.tracer.span(handler.__name__, **{"juju.event": type(event).__name__}):
+            handler(self, event)
+
+    return wrapper  # type: ignore[return-value]
+
+
+def otlp_attributes(attributes: Mapping[str, Any]) -> List[dict]:
+    """Returns attributes as OTLP key-value pairs."""
+    pairs = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        pairs.append({"key": key, "value": typed})
+    return pairs
+
+
+def write_trace_file(path: str, document: Mapping[str, Any]) -> None:
+    """Appends an OTLP JSON document as a line of a file, rotating the file when it is full.
+
+    Args:
+        path: Path of the file.
+        document: OTLP JSON document.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    try:
+        if os.path.getsize(path) >= TRACE_FILE_MAX_BYTES:
+            os.replace(path, f"{path}.1")
+    except FileNotFoundError:
+        pass
+    with open(path, "a") as f:
+        f.write(json.dumps(document, separators=(",", ":")) + "\n")
+
+
+def post_trace(endpoint: str, document: Mapping[str, Any]) -> None:
+    """Posts an OTLP JSON document to an OTLP/HTTP collector.
+
+    Args:
+        endpoint: Base URL of the collector's OTLP/HTTP receiver, e.g. `http://tempo:4318`.
+        document: OTLP JSON document.
+
+    Raises:
+        OSError: if the endpoint is invalid, or if the collector can't be reached or rejects
+            the document.
+    """
+    try:
+        request = urllib.request.Request(
+            f"{endpoint.rstrip('/')}/v1/traces",
+            data=json.dumps(document, separators=(",", ":")).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=COLLECTOR_TIMEOUT) as response:
+            response.read()
+    except (ValueError, http.client.HTTPException) as e:
+        raise OSError(f"Can't post trace to {endpoint}: {e!r}") from e
+
+
+def otlp_http_endpoint(receivers: Optional[str]) -> Optional[str]:
+    """Returns the OTLP/HTTP endpoint advertised over a `tracing` relation, if any.
+
+    Args:
+        receivers: `receivers` field of the collector's application data, a JSON list of
+            `{"protocol": {"name": ..., "type": ...}, "url": ...}` objects.
+
+    Returns:
+        str: URL of the `otlp_http` receiver, None if the collector doesn't advertise one or
+            if its URL isn't an absolute `http` or `https` URL, e.g. `tempo:4318`.
+    """
+    try:
+        for receiver in json.loads(receivers or "[]"):
+            if receiver.get("protocol", {}).get("name") == "otlp_http":
+                url = receiver["url"]
+                parts = urllib.parse.urlsplit(url)
+                if parts.scheme in ("http", "https") and parts.netloc:
+                    return url
+                logger.warning("Invalid tracing receiver URL: %s", url)
+                return None
+    except (ValueError, TypeError, AttributeError, KeyError):
+        logger.warning("Invalid tracing receivers: %s", receivers)
+    return None
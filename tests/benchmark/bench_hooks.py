@@ -0,0 +1,245 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Hook latency benchmarks for the simapp charm.
+
+Drives `SIMAPPOperatorCharm` through `ops.testing.Harness` for each event and records, per event
+and per config size, the wall time, memory allocations and the number of Pebble and Kubernetes
+API calls. Results are written as JSON so runs from different commits can be compared.
+
+Usage:
+    tox -e bench -- --sizes default,1000,1000000 --output bench.json
+"""
+
+import argparse
+import functools
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Iterator, List, Optional
+from unittest.mock import AsyncMock, Mock, patch
+
+import yaml
+from ops import pebble, testing
+from ops._private.harness import _TestingPebbleClient
+
+import charm
+from charm import SIMAPPOperatorCharm
+from kubernetes_service_patch import KubernetesServicePatch
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_SIZES = "default,1000,10000,100000,1000000"
+FIRST_IMSI = 208930100000000
+POD_IP = "10.1.2.3"
+
+
+class CallCounter:
+    """Counts calls made through instrumented Pebble and Kubernetes clients."""
+
+    def __init__(self):
+        self.pebble: Counter = Counter()
+        self.kubernetes: Counter = Counter()
+        self._depth = 0
+
+    def reset(self) -> None:
+        self.pebble.clear()
+        self.kubernetes.clear()
+
+    def wrap_pebble(self, name: str, method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            # Only count calls made by the charm, not the ones the fake backend makes to itself
+            if not self._depth:
+                self.pebble[name] += 1
+            self._depth += 1
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._depth -= 1
+
+        return wrapper
+
+    def kubernetes_client(self, client_class: type = Mock) -> Mock:
+        client = client_class()
+
+        def count(name):
+            def side_effect(*args, **kwargs):
+                self.kubernetes[name] += 1
+                return Mock()
+
+            return side_effect
+
+        for name in ("get", "list", "create", "delete", "patch", "replace", "apply"):
+            getattr(client, name).side_effect = count(name)
+        return client
+
+
+@contextmanager
+def instrumented(counter: CallCounter) -> Iterator[None]:
+    """Instruments the Pebble test backend and the lightkube client used by the charm."""
+    with ExitStack() as stack:
+        for name, _ in inspect.getmembers(pebble.Client, inspect.isfunction):
+            method = getattr(_TestingPebbleClient, name, None)
+            if name.startswith("_") or method is None:
+                continue
+            stack.enter_context(
+                patch.object(_TestingPebbleClient, name, counter.wrap_pebble(name, method))
+            )
+        client = counter.kubernetes_client()
+        stack.enter_context(patch("lightkube.Client", lambda: client))
+        async_client = counter.kubernetes_client(AsyncMock)
+        stack.enter_context(patch("lightkube.AsyncClient", lambda **kwargs: async_client))
+        stack.enter_context(patch.object(KubernetesServicePatch, "_namespace", "benchmark"))
+        # The Pebble test backend doesn't run health checks
+        stack.enter_context(patch("ops.model.Container.get_checks", return_value={}))
+        stack.enter_context(patch("charm.gethostbyname", lambda _: POD_IP))
+        yield
+
+
+def write_config(size: Optional[int], directory: str) -> str:
+    """Writes a compact config model provisioning `size` subscribers.
+
+    The shipped default config is used as a template; its device groups and subscribers are
+    replaced by a single IMSI range of the requested size.
+
+    Returns:
+        str: Path to the config model.
+    """
+    default_config_path = os.path.join(ROOT_DIR, charm.DEFAULT_CONFIG_FILE_PATH)
+    if size is None:
+        return default_config_path
+    with open(default_config_path) as f:
+        config = yaml.safe_load(f)
+    start, end = str(FIRST_IMSI), str(FIRST_IMSI + size - 1)
+    configuration = config["configuration"]
+    device_group = configuration["device-groups"][0]
+    device_group.pop("imsis", None)
+    device_group["imsi-ranges"] = [{"start": start, "end": end}]
+    configuration["device-groups"] = [device_group]
+    configuration["network-slices"][0]["site-device-group"] = [device_group["name"]]
+    subscriber = configuration["subscribers"][0]
+    subscriber.update({"ueId-start": start, "ueId-end": end})
+    configuration["subscribers"] = [subscriber]
+    path = os.path.join(directory, f"config-{size}.yaml")
+    with open(path, "w") as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+    return path
+
+
+def measure(event: str, size: str, counter: CallCounter, trigger: Callable[[], None]) -> dict:
+    """Runs `trigger` once and returns its measurements."""
+    counter.reset()
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        trigger()
+        wall_time = time.perf_counter() - start
+        allocated, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "event": event,
+        "config_size": size,
+        "wall_time_seconds": wall_time,
+        "allocated_bytes": allocated,
+        "peak_allocated_bytes": peak,
+        "pebble_calls": sum(counter.pebble.values()),
+        "pebble_calls_by_method": dict(counter.pebble),
+        "kubernetes_calls": sum(counter.kubernetes.values()),
+        "kubernetes_calls_by_method": dict(counter.kubernetes),
+    }
+
+
+def run_size(size: Optional[int], directory: str) -> List[dict]:
+    """Benchmarks every event for a given config size."""
+    label = "default" if size is None else str(size)
+    counter = CallCounter()
+    config_path = write_config(size, directory)
+    with instrumented(counter), patch("charm.DEFAULT_CONFIG_FILE_PATH", config_path):
+        harness = testing.Harness(SIMAPPOperatorCharm)
+        try:
+            harness.set_model_name("benchmark")
+            harness.begin()
+            harness.set_can_connect(container="simapp", val=True)
+            container = harness.model.unit.get_container("simapp")
+            container.make_dir(charm.BASE_CONFIG_PATH, make_parents=True)
+            return [
+                measure("install", label, counter, harness.charm.on.install.emit),
+                measure(
+                    "config-changed",
+                    label,
+                    counter,
+                    lambda: harness.update_config({"use-default-config": True}),
+                ),
+                measure(
+                    "simapp-pebble-ready",
+                    label,
+                    counter,
+                    lambda: harness.container_pebble_ready("simapp"),
+                ),
+                measure(
+                    "configure-network-action",
+                    label,
+                    counter,
+                    lambda: harness.run_action("configure-network"),
+                ),
+            ]
+        finally:
+            harness.cleanup()
+
+
+def git_revision() -> Optional[str]:
+    """Returns the current git commit, if any."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, capture_output=True, check=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_sizes(sizes: str) -> List[Optional[int]]:
+    """Parses a comma-separated list of subscriber counts, `default` being the shipped config."""
+    return [None if size == "default" else int(size) for size in sizes.split(",")]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Runs the benchmarks and writes the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default=DEFAULT_SIZES,
+        help=f"Comma-separated subscriber counts to benchmark (default: {DEFAULT_SIZES})",
+    )
+    parser.add_argument("--output", help="Path to write results to (default: stdout)")
+    args = parser.parse_args(argv)
+
+    os.chdir(ROOT_DIR)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in parse_sizes(args.sizes):
+            results.extend(run_size(size, directory))
+    report = {
+        "git_revision": git_revision(),
+        "python_version": platform.python_version(),
+        "timestamp": time.time(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""End-to-end provisioning throughput benchmark against a local webui stand-in.
+
+For each config size, `simapp.yaml` is rendered through the charm's config path (the default
+config template with `subscriber-ranges` and the webui endpoint set as charm options), parsed
+back and provisioned against `webui_standin.WebuiStandIn` the way simapp does: one request per
+subscriber IMSI, then one per device group and network slice. Throughput, latency percentiles
+and error rates are reported as JSON, so that capacity can be tracked without a live 5G core.
+
+Usage:
+    tox -e bench-provisioning -- --sizes 1000,10000,100000 --workers 8 --latency 0.001
+"""
+
+import argparse
+import http.client
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Iterator, List, Mapping, Optional, Tuple
+
+from webui_standin import (
+    DEVICE_GROUP_PREFIX,
+    NETWORK_SLICE_PREFIX,
+    SUBSCRIBER_PREFIX,
+    WebuiStandIn,
+)
+
+import charm
+from config_template import load_template, render_template
+from simapp_config import expand_imsi_range, load_config, render_config
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_SIZES = "1000,10000,100000"
+FIRST_IMSI = 208930100000001
+
+# (kind, method, path, body)
+Request = Tuple[str, str, str, bytes]
+
+
+def render(size: int, address: Tuple[str, int], directory: str) -> Tuple[str, float]:
+    """Renders a config provisioning `size` subscribers through the charm's config path.
+
+    Returns:
+        Tuple[str, float]: Path to the rendered `simapp.yaml` and the rendering time.
+    """
+    template = load_template(os.path.join(ROOT_DIR, charm.DEFAULT_CONFIG_FILE_PATH))
+    options = {
+        "subscriber-ranges": f"{FIRST_IMSI}-{FIRST_IMSI + size - 1}",
+        "webui-hostname": address[0],
+        "webui-port": address[1],
+    }
+    path = os.path.join(directory, f"simapp-{size}.yaml")
+    start = time.perf_counter()
+    with open(path, "w") as f:
+        for chunk in render_config(render_template(template, options)):
+            f.write(chunk)
+    return path, time.perf_counter() - start
+
+
+def provisioning_requests(config: Mapping[str, Any]) -> Iterator[Request]:
+    """Yields the requests simapp sends to provision a config."""
+    configuration = config["configuration"]
+    for subscriber in configuration.get("subscribers") or []:
+        body = json.dumps(
+            {
+                "plmnID": subscriber["plmnId"],
+                "OPc": subscriber["opc"],
+                "key": subscriber["key"],
+                "sequenceNumber": subscriber["sequenceNumber"],
+            }
+        ).encode()
+        for imsi in expand_imsi_range(str(subscriber["ueId-start"]), str(subscriber["ueId-end"])):
+            yield "subscriber", "POST", f"{SUBSCRIBER_PREFIX}{imsi}", body
+    for device_group in configuration.get("device-groups") or []:
+        body = json.dumps(device_group).encode()
+        yield "device-group", "POST", f"{DEVICE_GROUP_PREFIX}{device_group['name']}", body
+    for network_slice in configuration.get("network-slices") or []:
+        body = json.dumps(network_slice).encode()
+        yield "network-slice", "POST", f"{NETWORK_SLICE_PREFIX}{network_slice['name']}", body
+
+
+class Provisioner:
+    """Sends provisioning requests over one keep-alive connection per worker thread."""
+
+    def __init__(self, address: Tuple[str, int]):
+        self._address = address
+        self._local = threading.local()
+
+    def send(self, request: Request) -> Tuple[str, float, bool]:
+        """Sends a request and returns its kind, latency and whether it succeeded."""
+        kind, method, path, body = request
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(*self._address)
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            succeeded = response.status < 400
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            succeeded = False
+        return kind, time.perf_counter() - start, succeeded
+
+
+def percentiles(latencies: List[float]) -> dict:
+    """Returns the p50, p90 and p99 of latencies, in milliseconds."""
+    if len(latencies) < 2:
+        latencies = latencies * 2 or [0.0, 0.0]
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {f"p{p}_ms": cuts[p - 1] * 1000 for p in (50, 90, 99)}
+
+
+def run_size(size: int, workers: int, standin: WebuiStandIn, directory: str) -> dict:
+    """Renders and provisions a config of `size` subscribers."""
+    path, render_seconds = render(size, standin.address, directory)
+    with open(path, "rb") as f:
+        config = load_config(f)
+    provisioner = Provisioner(standin.address)
+    requests = provisioning_requests(config)
+    lock = threading.Lock()
+    outcomes: List[Tuple[str, float, bool]] = []
+
+    def worker() -> None:
+        while True:
+            with lock:
+                request = next(requests, None)
+            if request is None:
+                return
+            outcomes.append(provisioner.send(request))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    provision_seconds = time.perf_counter() - start
+    latencies = [latency for _, latency, _ in outcomes]
+    errors = sum(1 for _, _, succeeded in outcomes if not succeeded)
+    subscribers = sum(1 for kind, _, succeeded in outcomes if succeeded and kind == "subscriber")
+    return {
+        "config_size": size,
+        "config_bytes": os.path.getsize(path),
+        "render_seconds": render_seconds,
+        "provision_seconds": provision_seconds,
+        "requests": len(latencies),
+        "subscribers_per_second": subscribers / provision_seconds,
+        "error_rate": errors / len(latencies),
+        **percentiles(latencies),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Runs the benchmark and writes the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated subscriber counts")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent provisioning requests")
+    parser.add_argument("--latency", type=float, default=0.0, help="Stand-in seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Stand-in error rate")
+    parser.add_argument("--output", help="Path to write results to (default: stdout)")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in (int(size) for size in args.sizes.split(",")):
+            with WebuiStandIn(latency=args.latency, error_rate=args.error_rate, seed=0) as standin:
+                results.append(run_size(size, args.workers, standin, directory))
+    report = {
+        "workers": args.workers,
+        "standin_latency_seconds": args.latency,
+        "standin_error_rate": args.error_rate,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Cold-start benchmark for the simapp charm.
+
+Every Juju hook runs the charm in a fresh Python process, so the cost of importing the charm
+module and constructing the charm is paid on every dispatch. This benchmark starts a new
+interpreter for each run and measures both, along with the modules loaded along the way.
+Passing `--revision` measures another git revision as well, e.g. to compare before and after a
+change.
+
+Usage:
+    tox -e bench-startup -- --runs 20 --revision HEAD~1
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Runs in a fresh interpreter with the charm's source tree as working directory
+PROBE = """
+import json
+import sys
+import time
+
+start = time.perf_counter()
+import charm
+
+imported = time.perf_counter()
+from unittest.mock import patch
+
+from kubernetes_service_patch import KubernetesServicePatch
+from ops import testing
+
+modules_before_construction = set(sys.modules)
+harness = testing.Harness(charm.SIMAPPOperatorCharm)
+harness.set_model_name("benchmark")
+with patch.object(KubernetesServicePatch, "_namespace", "benchmark"):
+    constructing = time.perf_counter()
+    harness.begin()
+    constructed = time.perf_counter()
+json.dump(
+    {
+        "import_seconds": imported - start,
+        "construct_seconds": constructed - constructing,
+        "modules_loaded": len(sys.modules),
+        "modules_loaded_by_construction": len(set(sys.modules) - modules_before_construction),
+        "lightkube_loaded": any(name.split(".")[0] == "lightkube" for name in sys.modules),
+    },
+    sys.stdout,
+)
+"""
+
+
+def probe(source_dir: str) -> dict:
+    """Measures a cold start of the charm found in `source_dir`."""
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(
+            [source_dir, os.path.join(source_dir, "lib"), os.path.join(source_dir, "src")]
+        ),
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=source_dir,
+        env=env,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def summarize(label: str, runs: List[dict]) -> dict:
+    """Aggregates the probes of a source tree."""
+    return {
+        "source": label,
+        "runs": len(runs),
+        "import_seconds_median": statistics.median(run["import_seconds"] for run in runs),
+        "construct_seconds_median": statistics.median(run["construct_seconds"] for run in runs),
+        "modules_loaded": runs[-1]["modules_loaded"],
+        "modules_loaded_by_construction": runs[-1]["modules_loaded_by_construction"],
+        "lightkube_loaded": runs[-1]["lightkube_loaded"],
+    }
+
+
+@contextmanager
+def checkout(revision: str) -> Iterator[str]:
+    """Checks out a git revision in a temporary worktree."""
+    with tempfile.TemporaryDirectory() as directory:
+        worktree = os.path.join(directory, "worktree")
+        subprocess.run(
+            ["git", "worktree", "add", "--detach", worktree, revision],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            check=True,
+        )
+        try:
+            yield worktree
+        finally:
+            subprocess.run(
+                ["git", "worktree", "remove", "--force", worktree],
+                cwd=ROOT_DIR,
+                capture_output=True,
+                check=True,
+            )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Runs the benchmark and writes the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="Cold starts per source tree")
+    parser.add_argument("--revision", help="Git revision to compare the working tree with")
+    parser.add_argument("--output", help="Path to write results to (default: stdout)")
+    args = parser.parse_args(argv)
+
+    results = []
+    if args.revision:
+        with checkout(args.revision) as worktree:
+            runs = [probe(worktree) for _ in range(args.runs)]
+        results.append(summarize(args.revision, runs))
+    runs = [probe(ROOT_DIR) for _ in range(args.runs)]
+    results.append(summarize("working tree", runs))
+    report = {"python_version": sys.version.split()[0], "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
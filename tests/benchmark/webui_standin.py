@@ -0,0 +1,163 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Local stand-in for the webui subscriber provisioning API.
+
+Accepts the requests simapp sends to `sub-provision-endpt`:
+
+- `POST /api/subscriber/imsi-<IMSI>` for every subscriber,
+- `POST|PUT /config/v1/device-group/<name>` for every device group,
+- `POST|PUT /config/v1/network-slice/<name>` for every network slice,
+
+and records what was provisioned. A fixed latency and a rate of failed requests can be
+injected to see how provisioning behaves against a slow or flaky webui.
+
+Usage:
+    python tests/benchmark/webui_standin.py --port 5000 --latency 0.002
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+SUBSCRIBER_PREFIX = "/api/subscriber/imsi-"
+DEVICE_GROUP_PREFIX = "/config/v1/device-group/"
+NETWORK_SLICE_PREFIX = "/config/v1/network-slice/"
+SUBSCRIBER_REQUIRED_KEYS = ("plmnID", "OPc", "key", "sequenceNumber")
+
+
+class WebuiStandIn:
+    """Threaded HTTP server mimicking the webui provisioning API."""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        """Constructor for WebuiStandIn.
+
+        Args:
+            host: Address to listen on.
+            port: Port to listen on, 0 for any free port.
+            latency: Seconds every request is delayed by.
+            error_rate: Fraction of requests answered with a 500 error.
+            seed: Seed of the error injection.
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests: Counter = Counter()
+        self.subscribers: set = set()
+        self.device_groups: dict = {}
+        self.network_slices: dict = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _handler(self))
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """Host and port the stand-in listens on."""
+        host, port = self._server.server_address[:2]
+        return str(host), int(port)
+
+    def start(self) -> "WebuiStandIn":
+        """Starts serving in a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops serving and releases the port."""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> "WebuiStandIn":
+        """Starts the stand-in."""
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        """Stops the stand-in."""
+        self.stop()
+
+    def handle(self, method: str, path: str, body: bytes) -> int:
+        """Records a provisioning request and returns the HTTP status to answer with."""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests[method] += 1
+            if self.error_rate and self._random.random() < self.error_rate:
+                return 500
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            return 400
+        if method == "POST" and path.startswith(SUBSCRIBER_PREFIX):
+            imsi = path[len(SUBSCRIBER_PREFIX) :]  # noqa: E203
+            if not imsi.isdigit() or any(key not in payload for key in SUBSCRIBER_REQUIRED_KEYS):
+                return 400
+            with self._lock:
+                self.subscribers.add(imsi)
+            return 201
+        for prefix, provisioned in (
+            (DEVICE_GROUP_PREFIX, self.device_groups),
+            (NETWORK_SLICE_PREFIX, self.network_slices),
+        ):
+            if method in ("POST", "PUT") and path.startswith(prefix):
+                with self._lock:
+                    provisioned[path[len(prefix) :]] = payload  # noqa: E203
+                return 200
+        return 404
+
+
+def _handler(standin: WebuiStandIn) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, so that clients can reuse connections like simapp's HTTP client does
+        protocol_version = "HTTP/1.1"
+
+        def _respond(self) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            status = standin.handle(self.command, self.path, self.rfile.read(length))
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        do_POST = do_PUT = _respond  # noqa: N815
+
+        def log_message(self, format: str, *args) -> None:  # noqa: A002
+            pass
+
+    return Handler
+
+
+def main() -> None:
+    """Serves the stand-in until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 500 errors")
+    args = parser.parse_args()
+    with WebuiStandIn(args.host, args.port, args.latency, args.error_rate) as standin:
+        print(f"webui stand-in listening on {standin.address[0]}:{standin.address[1]}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+    print(
+        json.dumps({"requests": dict(standin.requests), "subscribers": len(standin.subscribers)})
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,77 @@
 # Copyright 2022 Guillaume Belanger
 # See LICENSE file for licensing details.
 
+import base64
+import gzip
+import json
+import tempfile
+import time
 import unittest
+from typing import ContextManager, Optional
 from unittest.mock import Mock, patch
 
+import yaml
 from ops import testing
-from ops.model import ActiveStatus, BlockedStatus
+from ops.model import ActiveStatus, BlockedStatus, WaitingStatus
+from ops.pebble import CheckLevel, CheckStatus
+from ops.pebble import ConnectionError as PebbleConnectionError
 
-from charm import SIMAPPOperatorCharm
+from charm import CHECK_PERIOD_SECONDS, CHECK_THRESHOLD, SIMAPPOperatorCharm
+from config_validator import ConfigValidationError, validate_config
+from simapp_config import render_config
 
 
 class TestCharm(unittest.TestCase):
     @patch(
         "charm.KubernetesServicePatch",
-        lambda charm, ports: None,
+        lambda charm, ports, server_side_apply, asynchronous, trace: None,
     )
     def setUp(self):
         self.namespace = "whatever"
         self.harness = testing.Harness(SIMAPPOperatorCharm)
         self.harness.set_model_name(name=self.namespace)
         self.addCleanup(self.harness.cleanup)
+        # The testing Pebble backend doesn't run health checks
+        get_checks_patcher = patch("ops.model.Container.get_checks", return_value={})
+        self.patch_get_checks = get_checks_patcher.start()
+        self.addCleanup(get_checks_patcher.stop)
         self.harness.begin()
 
-    @patch("ops.model.Container.push")
+    def _handle_nc_probe(self, available: bool = True) -> None:
+        """Answers the charm's check for `nc` in the simapp image."""
+        self.harness.handle_exec(
+            "simapp", ["/bin/sh", "-c", "command -v nc"], result=0 if available else 1
+        )
+
+    @staticmethod
+    def _once_checks_ran() -> ContextManager:
+        """Moves the clock forward by the time simapp's health checks take to fail."""
+        return patch(
+            "time.time", return_value=time.time() + CHECK_PERIOD_SECONDS * CHECK_THRESHOLD
+        )
+
+    def _write_config_file(self, config: Optional[dict] = None) -> None:
+        if config is None:
+            with open("src/files/default_config.yaml") as f:
+                config = yaml.safe_load(f)
+        container = self.harness.model.unit.get_container("simapp")
+        container.push(
+            "/simapp/config/simapp.yaml", "".join(render_config(config)), make_dirs=True
+        )
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
     def test_given_use_default_config_when_on_config_changed_then_default_config_is_written(
-        self, patch_push
+        self,
     ):
         self.harness.set_can_connect(container="simapp", val=True)
+        container = self.harness.model.unit.get_container("simapp")
+        container.make_dir("/simapp/config", make_parents=True)
 
         self.harness.update_config({"use-default-config": True})
 
-        patch_push.assert_called_with(
-            path="/simapp/config/simapp.yaml",
-            source='configuration:\n  device-groups:\n  - imsis:\n    - "208930100007487"\n    - "208930100007488"\n    - "208930100007489"\n    - "208930100007490"\n    - "208930100007491"\n    - "208930100007492"\n    - "208930100007493"\n    - "208930100007494"\n    - "208930100007495"\n    - "208930100007496"\n    - "208930100007497"\n    - "208930100007498"\n    - "208930100007499"\n    - "208930100007500"\n    ip-domain-expanded:\n      dnn: internet\n      dns-primary: 8.8.8.8\n      mtu: 1460\n      ue-dnn-qos:\n        bitrate-unit: bps\n        dnn-mbr-downlink: 200000000\n        dnn-mbr-uplink: 20000000\n        traffic-class:\n          arp: 6\n          name: platinum\n          pdb: 300\n          pelr: 6\n          qci: 9\n      ue-ip-pool: 172.250.1.0/16\n    ip-domain-name: pool1\n    name: 5g-gnbsim-user-group1\n    site-info: aiab\n  - imsis:\n    - "208930100007501"\n    - "208930100007502"\n    - "208930100007503"\n    - "208930100007504"\n    - "208930100007505"\n    - "208930100007506"\n    - "208930100007507"\n    - "208930100007508"\n    - "208930100007509"\n    - "208930100007510"\n    ip-domain-expanded:\n      dnn: internet\n      dns-primary: 8.8.8.8\n      mtu: 1460\n      ue-dnn-qos:\n        bitrate-unit: bps\n        dnn-mbr-downlink: 400000000\n        dnn-mbr-uplink: 10000000\n        traffic-class:\n          arp: 6\n          name: platinum\n          pdb: 300\n          pelr: 6\n          qci: 8\n      ue-ip-pool: 172.250.1.0/16\n    ip-domain-name: pool2\n    name: 5g-gnbsim-user-group2\n    site-info: aiab2\n  network-slices:\n  - application-filtering-rules:\n    - action: permit\n      endpoint: 0.0.0.0/0\n      priority: 250\n      rule-name: ALLOW-ALL\n    name: default\n    site-device-group:\n    - 5g-gnbsim-user-group1\n    - 5g-gnbsim-user-group2\n    site-info:\n      gNodeBs:\n      - name: aiab-gnb1\n        tac: 1\n      - name: aiab-gnb2\n        tac: 2\n      plmn:\n        mcc: "208"\n        mnc: "93"\n      site-name: aiab\n      upf:\n        upf-name: upf\n        upf-port: 8805\n    slice-id:\n      sd: "010203"\n      sst: 1\n  provision-network-slice: true\n  sub-provision-endpt:\n    addr: webui\n    port: 5000\n  subscribers:\n  - key: 5122250214c33e723a5dd523fc145fc0\n    op: ""\n    opc: 981d464c7c52eb6e5036234984ad0bcf\n    plmnId: "20893"\n    sequenceNumber: 16f3b3f70fc2\n    ueId-end: "208930100007500"\n    ueId-start: "208930100007487"\n  - key: 5122250214c33e723a5dd523fc145fc0\n    op: ""\n    opc: 981d464c7c52eb6e5036234984ad0bcf\n    plmnId: "20893"\n    sequenceNumber: 16f3b3f70fc2\n    ueId-end: "208930100007599"\n    ueId-start: "208930100007501"\ninfo:\n  description: SIMAPP initial local configuration\n  http-version: 1\n  version: 1.0.0\nlogger:\n  APP:\n    ReportCaller: false\n    debugLevel: info\n',  # noqa: E501
+        self.assertEqual(
+            container.pull("/simapp/config/simapp.yaml").read(),
+            "configuration:\n  device-groups:\n  - imsis:\n    - '208930100007487'\n    - '208930100007488'\n    - '208930100007489'\n    - '208930100007490'\n    - '208930100007491'\n    - '208930100007492'\n    - '208930100007493'\n    - '208930100007494'\n    - '208930100007495'\n    - '208930100007496'\n    - '208930100007497'\n    - '208930100007498'\n    - '208930100007499'\n    - '208930100007500'\n    ip-domain-expanded:\n      dnn: internet\n      dns-primary: 8.8.8.8\n      mtu: 1460\n      ue-dnn-qos:\n        bitrate-unit: bps\n        dnn-mbr-downlink: 200000000\n        dnn-mbr-uplink: 20000000\n        traffic-class:\n          arp: 6\n          name: platinum\n          pdb: 300\n          pelr: 6\n          qci: 9\n      ue-ip-pool: 172.250.1.0/16\n    ip-domain-name: pool1\n    name: 5g-gnbsim-user-group1\n    site-info: aiab\n  - imsis:\n    - '208930100007501'\n    - '208930100007502'\n    - '208930100007503'\n    - '208930100007504'\n    - '208930100007505'\n    - '208930100007506'\n    - '208930100007507'\n    - '208930100007508'\n    - '208930100007509'\n    - '208930100007510'\n    ip-domain-expanded:\n      dnn: internet\n      dns-primary: 8.8.8.8\n      mtu: 1460\n      ue-dnn-qos:\n        bitrate-unit: bps\n        dnn-mbr-downlink: 400000000\n        dnn-mbr-uplink: 10000000\n        traffic-class:\n          arp: 6\n          name: platinum\n          pdb: 300\n          pelr: 6\n          qci: 8\n      ue-ip-pool: 172.250.1.0/16\n    ip-domain-name: pool2\n    name: 5g-gnbsim-user-group2\n    site-info: aiab2\n  network-slices:\n  - application-filtering-rules:\n    - action: permit\n      endpoint: 0.0.0.0/0\n      priority: 250\n      rule-name: ALLOW-ALL\n    name: default\n    site-device-group:\n    - 5g-gnbsim-user-group1\n    - 5g-gnbsim-user-group2\n    site-info:\n      gNodeBs:\n      - name: aiab-gnb1\n        tac: 1\n      - name: aiab-gnb2\n        tac: 2\n      plmn:\n        mcc: '208'\n        mnc: '93'\n      site-name: aiab\n      upf:\n        upf-name: upf\n        upf-port: 8805\n    slice-id:\n      sd: '010203'\n      sst: 1\n  provision-network-slice: true\n  sub-provision-endpt:\n    addr: webui\n    port: 5000\n  subscribers:\n  - key: 5122250214c33e723a5dd523fc145fc0\n    op: ''\n    opc: 981d464c7c52eb6e5036234984ad0bcf\n    plmnId: '20893'\n    sequenceNumber: 16f3b3f70fc2\n    ueId-end: '208930100007500'\n    ueId-start: '208930100007487'\n  - key: 5122250214c33e723a5dd523fc145fc0\n    op: ''\n    opc: 981d464c7c52eb6e5036234984ad0bcf\n    plmnId: '20893'\n    sequenceNumber: 16f3b3f70fc2\n    ueId-end: '208930100007599'\n    ueId-start: '208930100007501'\ninfo:\n  description: SIMAPP initial local configuration\n  http-version: 1\n  version: 1.0.0\nlogger:\n  APP:\n    ReportCaller: false\n    debugLevel: info\n",  # noqa: E501
         )
 
     @patch("ops.model.Container.exists")
@@ -43,7 +82,7 @@ class TestCharm(unittest.TestCase):
         patch_exists.return_value = False
         self.harness.set_can_connect(container="simapp", val=True)
 
-        mock_event = Mock()
+        mock_event = Mock(params={})
         self.harness.charm._on_configure_network_action(event=mock_event)
 
         mock_event.fail.assert_called_with(message="Config file is not written")
@@ -56,24 +95,26 @@ class TestCharm(unittest.TestCase):
         patch_exists.return_value = True
         self.harness.set_can_connect(container="simapp", val=False)
 
-        mock_event = Mock()
+        mock_event = Mock(params={})
         self.harness.charm._on_configure_network_action(event=mock_event)
 
         mock_event.fail.assert_called_with(message="Container is not ready")
 
-    @patch("charm.check_output")
+    @patch("charm.gethostbyname")
     @patch("ops.model.Container.exists")
     def test_given_can_connect_to_workload_and_config_file_is_written_when_configure_network_action_then_pebble_layer_is_created(  # noqa: E501
         self,
         patch_exists,
-        patch_check_output,
+        patch_gethostbyname,
     ):
         pod_ip = "1.2.3.4"
-        patch_check_output.return_value = pod_ip.encode()
+        patch_gethostbyname.return_value = pod_ip
         patch_exists.return_value = True
         self.harness.set_can_connect(container="simapp", val=True)
+        self._handle_nc_probe()
+        self._write_config_file()
 
-        mock_event = Mock()
+        mock_event = Mock(params={})
         self.harness.charm._on_configure_network_action(event=mock_event)
 
         expected_plan = {
@@ -83,8 +124,33 @@ class TestCharm(unittest.TestCase):
                     "override": "replace",
                     "command": "/simapp/bin/simapp",
                     "environment": {"POD_IP": "1.2.3.4"},
-                }
-            }
+                    "backoff-delay": "5s",
+                    "backoff-factor": 2,
+                    "backoff-limit": "2m",
+                },
+                "charm-metrics-exporter": {
+                    "startup": "enabled",
+                    "override": "replace",
+                    "command": "/bin/sh /simapp/bin/charm-metrics-exporter 9090 "
+                    "/simapp/config/charm-metrics.prom",
+                },
+            },
+            "checks": {
+                "config-exporter": {
+                    "override": "replace",
+                    "level": "ready",
+                    "period": "10s",
+                    "threshold": 3,
+                    "tcp": {"port": 8080},
+                },
+                "prometheus-exporter": {
+                    "override": "replace",
+                    "level": "ready",
+                    "period": "10s",
+                    "threshold": 3,
+                    "http": {"url": "http://localhost:9089/metrics"},
+                },
+            },
         }
 
         updated_plan = self.harness.get_container_pebble_plan("simapp").to_dict()
@@ -92,20 +158,98 @@ class TestCharm(unittest.TestCase):
         self.assertEqual(expected_plan, updated_plan)
 
     @patch("ops.model.Container.exec", new=Mock())
-    @patch("charm.check_output")
+    @patch("charm.gethostbyname")
     @patch("ops.model.Container.exists")
-    def test_given_can_connect_to_workload_and_config_file_is_written_when_configure_network_action_then_status_is_active(  # noqa: E501
+    def test_given_can_connect_to_workload_and_config_file_is_written_when_configure_network_action_then_status_is_waiting_for_health_checks(  # noqa: E501
         self,
         patch_exists,
-        patch_check_output,
+        patch_gethostbyname,
     ):
-        patch_check_output.return_value = b"1.2.3.4"
+        patch_gethostbyname.return_value = "1.2.3.4"
         patch_exists.return_value = True
         self.harness.set_can_connect(container="simapp", val=True)
+        self._write_config_file()
 
-        mock_event = Mock()
+        mock_event = Mock(params={})
         self.harness.charm._on_configure_network_action(event=mock_event)
 
+        self.assertEqual(
+            self.harness.model.unit.status,
+            WaitingStatus("Waiting for simapp health checks to run"),
+        )
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_simapp_replanned_when_update_status_before_checks_ran_then_status_is_waiting(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="simapp", val=True)
+        self._write_config_file()
+        self.harness.container_pebble_ready(container_name="simapp")
+
+        self.harness.charm.on.update_status.emit()
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            WaitingStatus("Waiting for simapp health checks to run"),
+        )
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_simapp_replanned_when_update_status_after_checks_ran_then_status_is_active(
+        self,
+    ):
+        self.harness.set_can_connect(container="simapp", val=True)
+        self._write_config_file()
+        self.harness.container_pebble_ready(container_name="simapp")
+
+        with self._once_checks_ran():
+            self.harness.charm.on.update_status.emit()
+
+        self.assertEqual(self.harness.model.unit.status, ActiveStatus())
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_active_unit_when_simapp_restarted_for_new_config_then_status_is_waiting(self):
+        self.harness.set_can_connect(container="simapp", val=True)
+        self._write_config_file()
+        self.harness.container_pebble_ready(container_name="simapp")
+        with self._once_checks_ran():
+            self.harness.charm.on.update_status.emit()
+
+        self.harness.charm._on_configure_network_action(event=Mock(params={}))
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            WaitingStatus("Waiting for simapp health checks to run"),
+        )
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_active_unit_when_check_fails_and_recovers_then_status_follows_check(self):
+        self.harness.set_can_connect(container="simapp", val=True)
+        self._write_config_file()
+        self.harness.container_pebble_ready(container_name="simapp")
+        with self._once_checks_ran():
+            self.harness.charm.on.update_status.emit()
+        container = self.harness.model.unit.get_container("simapp")
+        self.patch_get_checks.return_value = {
+            "config-exporter": Mock(status=CheckStatus.UP),
+            "prometheus-exporter": Mock(status=CheckStatus.DOWN),
+        }
+
+        self.harness.charm.on.simapp_pebble_check_failed.emit(container, "prometheus-exporter")
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            WaitingStatus("Waiting for simapp to be ready: prometheus-exporter down"),
+        )
+        self.patch_get_checks.return_value = {
+            "config-exporter": Mock(status=CheckStatus.UP),
+            "prometheus-exporter": Mock(status=CheckStatus.UP),
+        }
+
+        with self._once_checks_ran():
+            self.harness.charm.on.simapp_pebble_check_recovered.emit(
+                container, "prometheus-exporter"
+            )
+
         self.assertEqual(self.harness.model.unit.status, ActiveStatus())
 
     def test_given_config_file_not_written_when_pebble_ready_then_status_is_blocked(self):
@@ -117,3 +261,895 @@ class TestCharm(unittest.TestCase):
                 "Use `juju scp` to copy the config file to the unit and run the `configure-network` action"  # noqa: E501, W505
             ),
         )
+
+    @patch("ops.model.Container.push")
+    def test_given_default_config_already_pushed_when_on_config_changed_then_config_is_not_pushed_again(  # noqa: E501
+        self, patch_push
+    ):
+        self.harness.set_can_connect(container="simapp", val=True)
+        self.harness.update_config({"use-default-config": True})
+        patch_push.reset_mock()
+        self.harness.charm._container.clear()
+
+        with patch("ops.model.Container.exists", return_value=True):
+            self.harness.charm._write_default_config()
+
+        patch_push.assert_not_called()
+
+    @patch("charm.gethostbyname")
+    @patch("ops.model.Container.exists")
+    def test_given_pebble_layer_already_applied_when_pebble_ready_then_replan_is_not_called(
+        self,
+        patch_exists,
+        patch_gethostbyname,
+    ):
+        patch_gethostbyname.return_value = "1.2.3.4"
+        patch_exists.return_value = True
+        self.harness.set_can_connect(container="simapp", val=True)
+        self.harness.container_pebble_ready(container_name="simapp")
+
+        with patch("ops.model.Container.replan") as patch_replan, self._once_checks_ran():
+            self.harness.container_pebble_ready(container_name="simapp")
+
+        patch_replan.assert_not_called()
+        self.assertEqual(self.harness.model.unit.status, ActiveStatus())
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    @patch("ops.model.Container.exists", new=Mock(return_value=True))
+    def test_given_plan_with_go_formatted_durations_when_pebble_ready_then_replan_is_not_called(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="simapp", val=True)
+        self.harness.container_pebble_ready(container_name="simapp")
+        # Pebble returns durations as Go formats them
+        service = self.harness.charm._pebble_layer.services["simapp"].to_dict()
+        self.harness.model.unit.get_container("simapp").add_layer(
+            "simapp", {"services": {"simapp": {**service, "backoff-limit": "2m0s"}}}, combine=True
+        )
+
+        with patch("ops.model.Container.replan") as patch_replan:
+            self.harness.container_pebble_ready(container_name="simapp")
+
+        patch_replan.assert_not_called()
+
+    @patch("ops.model.Container.restart")
+    @patch("charm.gethostbyname")
+    @patch("ops.model.Container.exists")
+    def test_given_pebble_layer_already_applied_when_configure_network_action_then_service_is_restarted(  # noqa: E501
+        self,
+        patch_exists,
+        patch_gethostbyname,
+        patch_restart,
+    ):
+        patch_gethostbyname.return_value = "1.2.3.4"
+        patch_exists.return_value = True
+        self.harness.set_can_connect(container="simapp", val=True)
+        self.harness.container_pebble_ready(container_name="simapp")
+        self._write_config_file()
+
+        self.harness.charm._on_configure_network_action(event=Mock(params={}))
+
+        patch_restart.assert_called_once_with("simapp")
+
+    @patch("ops.model.Container.restart")
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    @patch("ops.model.Container.exists", new=Mock(return_value=True))
+    def test_given_layer_changed_but_not_simapp_service_when_configure_network_action_then_service_is_restarted(  # noqa: E501
+        self,
+        patch_restart,
+    ):
+        self.harness.set_can_connect(container="simapp", val=True)
+        self.harness.container_pebble_ready(container_name="simapp")
+        self._write_config_file()
+        # e.g. only the checks or the charm metrics exporter changed since the last replan
+        self.harness.charm._stored.layer_digest = "previous"
+
+        with patch("ops.model.Container.replan") as patch_replan:
+            self.harness.charm._on_configure_network_action(event=Mock(params={}))
+
+        patch_replan.assert_called_once()
+        patch_restart.assert_called_once_with("simapp")
+
+    @patch("ops.model.Container.restart")
+    @patch("charm.gethostbyname")
+    @patch("ops.model.Container.exists", new=Mock(return_value=True))
+    def test_given_simapp_service_changed_when_configure_network_action_then_replan_restarts_it(  # noqa: E501
+        self,
+        patch_gethostbyname,
+        patch_restart,
+    ):
+        patch_gethostbyname.return_value = "1.2.3.4"
+        self.harness.set_can_connect(container="simapp", val=True)
+        self.harness.container_pebble_ready(container_name="simapp")
+        self._write_config_file()
+        self.harness.charm.__dict__.pop("_pod_ip")
+        patch_gethostbyname.return_value = "1.2.3.5"
+
+        with patch("ops.model.Container.replan") as patch_replan:
+            self.harness.charm._on_configure_network_action(event=Mock(params={}))
+
+        patch_replan.assert_called_once()
+        patch_restart.assert_not_called()
+
+    @patch("charm.check_output")
+    @patch("charm.gethostbyname")
+    def test_given_pod_hostname_resolves_when_pod_ip_then_unit_get_is_not_called(
+        self,
+        patch_gethostbyname,
+        patch_check_output,
+    ):
+        patch_gethostbyname.return_value = "1.2.3.4"
+
+        self.assertEqual(str(self.harness.charm._pod_ip), "1.2.3.4")
+        self.assertEqual(str(self.harness.charm._pod_ip), "1.2.3.4")
+
+        patch_gethostbyname.assert_called_once()
+        patch_check_output.assert_not_called()
+
+    @patch("charm.check_output")
+    @patch("charm.gethostbyname")
+    def test_given_pod_hostname_resolves_to_loopback_when_pod_ip_then_unit_get_is_used(
+        self,
+        patch_gethostbyname,
+        patch_check_output,
+    ):
+        patch_gethostbyname.return_value = "127.0.1.1"
+        patch_check_output.return_value = b"1.2.3.4"
+
+        self.assertEqual(str(self.harness.charm._pod_ip), "1.2.3.4")
+
+        patch_check_output.assert_called_once_with(["unit-get", "private-address"])
+
+    def _deferred_reconciles(self) -> int:
+        return sum(
+            1
+            for event_path, _, _ in self.harness.framework._storage.notices()
+            if "reconcile" in event_path
+        )
+
+    def test_given_cant_connect_to_workload_when_several_triggers_then_single_reconcile_is_deferred(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="simapp", val=False)
+
+        self.harness.update_config({"use-default-config": True})
+        self.harness.update_config({"use-default-config": False})
+        self.harness.charm.on.config_changed.emit()
+
+        self.assertEqual(self._deferred_reconciles(), 1)
+        self.assertEqual(self.harness.charm.coalesced_reconciles, 2)
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    @patch("ops.model.Container.exists", new=Mock(return_value=True))
+    def test_given_deferred_reconcile_when_workload_reconciled_since_then_deferred_reconcile_is_dropped(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="simapp", val=False)
+        self.harness.charm.on.config_changed.emit()
+        self.harness.set_can_connect(container="simapp", val=True)
+        self.harness.container_pebble_ready(container_name="simapp")
+
+        self.harness.framework.reemit()
+        with self._once_checks_ran():
+            self.harness.charm.on.update_status.emit()
+
+        self.assertEqual(self._deferred_reconciles(), 0)
+        self.assertEqual(self.harness.charm.coalesced_reconciles, 1)
+        self.assertEqual(self.harness.model.unit.status, ActiveStatus())
+
+    def test_given_overlapping_subscriber_ranges_when_configure_network_action_then_status_is_blocked(  # noqa: E501
+        self,
+    ):
+        with open("src/files/default_config.yaml") as f:
+            config = yaml.safe_load(f)
+        config["configuration"]["subscribers"][1]["ueId-start"] = "208930100007500"
+        self.harness.set_can_connect(container="simapp", val=True)
+        self._write_config_file(config)
+
+        mock_event = Mock(params={})
+        self.harness.charm._on_configure_network_action(event=mock_event)
+
+        message = (
+            "Invalid config: Overlapping subscriber ranges: "
+            "208930100007487-208930100007500 and 208930100007500-208930100007599"
+        )
+        mock_event.fail.assert_called_with(message=message)
+        self.assertEqual(self.harness.model.unit.status, BlockedStatus(message))
+        self.assertEqual(self.harness.get_container_pebble_plan("simapp").to_dict(), {})
+
+    @patch("ops.model.Container.push")
+    def test_given_invalid_default_config_when_on_config_changed_then_config_is_not_pushed(
+        self, patch_push
+    ):
+        self.harness.set_can_connect(container="simapp", val=True)
+
+        with patch("charm.validate_config", side_effect=ConfigValidationError("bad config")):
+            self.harness.update_config({"use-default-config": True})
+
+        patch_push.assert_not_called()
+        self.assertEqual(
+            self.harness.model.unit.status, BlockedStatus("Invalid config: bad config")
+        )
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_shard_subscribers_and_peer_unit_when_on_config_changed_then_only_unit_shard_is_written(  # noqa: E501
+        self,
+    ):
+        relation_id = self.harness.add_relation("simapp-peers", "simapp-operator")
+        self.harness.add_relation_unit(relation_id, "simapp-operator/1")
+        self.harness.set_can_connect(container="simapp", val=True)
+        container = self.harness.model.unit.get_container("simapp")
+        container.make_dir("/simapp/config", make_parents=True)
+
+        self.harness.update_config({"use-default-config": True, "shard-subscribers": True})
+
+        config = yaml.safe_load(container.pull("/simapp/config/simapp.yaml").read())
+        validate_config(config)
+        subscribers = config["configuration"]["subscribers"]
+        self.assertEqual(subscribers[0]["ueId-start"], "208930100007487")
+        self.assertEqual(subscribers[-1]["ueId-end"], "208930100007554")
+        # The default network slice references both device groups, which stay together
+        self.assertEqual(
+            [device_group["name"] for device_group in config["configuration"]["device-groups"]],
+            ["5g-gnbsim-user-group1", "5g-gnbsim-user-group2"],
+        )
+        self.assertEqual(len(config["configuration"]["network-slices"]), 1)
+
+    def test_given_leader_when_metrics_endpoint_relation_joined_then_scrape_jobs_are_published(
+        self,
+    ):
+        self.harness.set_leader(True)
+        self.harness.add_network("10.0.0.10")
+
+        relation_id = self.harness.add_relation("metrics-endpoint", "prometheus")
+        self.harness.add_relation_unit(relation_id, "prometheus/0")
+
+        app_data = self.harness.get_relation_data(relation_id, "simapp-operator")
+        unit_data = self.harness.get_relation_data(relation_id, "simapp-operator/0")
+        self.assertEqual(
+            json.loads(app_data["scrape_jobs"]),
+            [
+                {
+                    "job_name": "simapp",
+                    "metrics_path": "/metrics",
+                    "static_configs": [{"targets": ["*:9089"]}],
+                },
+            ],
+        )
+        self.assertEqual(json.loads(app_data["scrape_metadata"])["application"], "simapp-operator")
+        self.assertEqual(unit_data["prometheus_scrape_unit_address"], "10.0.0.10")
+        self.assertEqual(unit_data["prometheus_scrape_unit_name"], "simapp-operator/0")
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_nc_in_image_when_layer_applied_then_charm_metrics_scrape_job_is_published(
+        self,
+    ):
+        self.harness.set_leader(True)
+        self.harness.add_network("10.0.0.10")
+        relation_id = self.harness.add_relation("metrics-endpoint", "prometheus")
+        self.harness.add_relation_unit(relation_id, "prometheus/0")
+        self.harness.set_can_connect(container="simapp", val=True)
+        self.harness.model.unit.get_container("simapp").make_dir(
+            "/simapp/config", make_parents=True
+        )
+        self._handle_nc_probe()
+
+        self.harness.update_config({"use-default-config": True})
+
+        app_data = self.harness.get_relation_data(relation_id, "simapp-operator")
+        self.assertEqual(
+            [job["job_name"] for job in json.loads(app_data["scrape_jobs"])],
+            ["simapp", "simapp-charm"],
+        )
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_nc_missing_from_image_when_layer_applied_then_charm_metrics_exporter_is_not_run(
+        self,
+    ):
+        self.harness.set_can_connect(container="simapp", val=True)
+        container = self.harness.model.unit.get_container("simapp")
+        container.make_dir("/simapp/config", make_parents=True)
+        self._handle_nc_probe(available=False)
+
+        with self.assertLogs("charm", level="WARNING"):
+            self.harness.update_config({"use-default-config": True})
+
+        plan = self.harness.get_container_pebble_plan("simapp")
+        self.assertEqual(list(plan.services), ["simapp"])
+        self.assertFalse(container.exists("/simapp/bin/charm-metrics-exporter"))
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_layer_applied_when_update_status_then_charm_metrics_are_published(self):
+        self.harness.set_can_connect(container="simapp", val=True)
+        container = self.harness.model.unit.get_container("simapp")
+        container.make_dir("/simapp/config", make_parents=True)
+        self.harness.update_config({"use-default-config": True})
+        self.harness.framework.commit()
+        container.remove_path("/simapp/config/charm-metrics.prom")
+
+        self.harness.charm.on.update_status.emit()
+        self.harness.framework.commit()
+
+        metrics = container.pull("/simapp/config/charm-metrics.prom").read()
+        self.assertIn('simapp_charm_hook_duration_seconds_count{hook="unknown"}', metrics)
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_layer_applied_when_on_config_changed_then_charm_metrics_exporter_is_pushed(
+        self,
+    ):
+        self.harness.set_can_connect(container="simapp", val=True)
+        container = self.harness.model.unit.get_container("simapp")
+        container.make_dir("/simapp/config", make_parents=True)
+        self._handle_nc_probe()
+
+        self.harness.update_config({"use-default-config": True})
+
+        with open("src/files/charm_metrics_exporter.sh") as f:
+            self.assertEqual(container.pull("/simapp/bin/charm-metrics-exporter").read(), f.read())
+        plan = self.harness.get_container_pebble_plan("simapp")
+        self.assertIn("charm-metrics-exporter", plan.services)
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_config_pushed_when_dispatch_commits_then_charm_metrics_are_published(self):
+        self.harness.set_can_connect(container="simapp", val=True)
+        container = self.harness.model.unit.get_container("simapp")
+        container.make_dir("/simapp/config", make_parents=True)
+        self.harness.update_config({"use-default-config": True})
+
+        self.harness.framework.commit()
+
+        metrics = container.pull("/simapp/config/charm-metrics.prom").read()
+        self.assertIn("simapp_charm_config_pushes_total 1\n", metrics)
+        self.assertIn("simapp_charm_replans_total 1\n", metrics)
+        self.assertIn("simapp_charm_config_subscribers 113\n", metrics)
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_pebble_gone_when_dispatch_commits_then_metrics_failure_is_logged_and_state_kept(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="simapp", val=True)
+        container = self.harness.model.unit.get_container("simapp")
+        container.make_dir("/simapp/config", make_parents=True)
+        self.harness.update_config({"use-default-config": True})
+        layer_digest = self.harness.charm._stored.layer_digest
+
+        with patch(
+            "ops.model.Container.push", side_effect=PebbleConnectionError("Pebble went away")
+        ), self.assertLogs("charm", level="WARNING"):
+            self.harness.framework.commit()
+
+        self.assertTrue(layer_digest)
+        self.assertEqual(self.harness.charm._stored.layer_digest, layer_digest)
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_default_config_already_applied_when_subscriber_changes_then_only_delta_is_written(  # noqa: E501
+        self,
+    ):
+        with open("src/files/default_config.yaml") as f:
+            config = yaml.safe_load(f)
+        self.harness.set_can_connect(container="simapp", val=True)
+        container = self.harness.model.unit.get_container("simapp")
+        container.make_dir("/simapp/config", make_parents=True)
+        with tempfile.NamedTemporaryFile("w", suffix=".yaml") as config_file:
+            yaml.safe_dump(config, config_file)
+            config_file.flush()
+            with patch("charm.DEFAULT_CONFIG_FILE_PATH", config_file.name):
+                self.harness.update_config({"use-default-config": True})
+                config["configuration"]["subscribers"][0]["sequenceNumber"] = "000000000001"
+                config_file.seek(0)
+                config_file.truncate()
+                yaml.safe_dump(config, config_file)
+                config_file.flush()
+
+                self.harness.charm.on.config_changed.emit()
+
+        written_config = yaml.safe_load(container.pull("/simapp/config/simapp.yaml").read())
+        self.assertEqual(
+            written_config["configuration"]["subscribers"],
+            [config["configuration"]["subscribers"][0]],
+        )
+        self.assertEqual(written_config["configuration"]["device-groups"], [])
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_ready_check_down_when_update_status_then_status_is_waiting(self):
+        self.harness.set_can_connect(container="simapp", val=True)
+        self._write_config_file()
+        self.harness.container_pebble_ready(container_name="simapp")
+        with self._once_checks_ran():
+            self.harness.charm.on.update_status.emit()
+        self.assertEqual(self.harness.model.unit.status, ActiveStatus())
+        self.patch_get_checks.return_value = {
+            "config-exporter": Mock(status=CheckStatus.UP),
+            "prometheus-exporter": Mock(status=CheckStatus.DOWN),
+        }
+
+        self.harness.charm.on.update_status.emit()
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            WaitingStatus("Waiting for simapp to be ready: prometheus-exporter down"),
+        )
+        self.patch_get_checks.assert_called_with(level=CheckLevel.READY)
+
+    @patch("ops.model.Container.replan")
+    @patch("charm.gethostbyname")
+    def test_given_plan_differs_from_layer_when_pebble_ready_then_layer_is_replanned(
+        self, patch_gethostbyname, patch_replan
+    ):
+        patch_gethostbyname.return_value = "1.2.3.4"
+        self.harness.set_can_connect(container="simapp", val=True)
+        self._write_config_file()
+        self.harness.container_pebble_ready(container_name="simapp")
+        container = self.harness.model.unit.get_container("simapp")
+        container.add_layer(
+            "user-override",
+            {"services": {"simapp": {"override": "merge", "command": "/bin/other"}}},
+            combine=True,
+        )
+        patch_replan.reset_mock()
+
+        self.harness.container_pebble_ready(container_name="simapp")
+
+        patch_replan.assert_called_once()
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_gzip_payload_when_configure_network_action_then_config_is_pushed_and_applied(
+        self,
+    ):
+        self.harness.set_can_connect(container="simapp", val=True)
+        container = self.harness.model.unit.get_container("simapp")
+        container.make_dir("/simapp/config", make_parents=True)
+        with open("src/files/default_config.yaml") as f:
+            content = "".join(render_config(yaml.safe_load(f)))
+        payload = base64.b64encode(gzip.compress(content.encode())).decode()
+
+        output = self.harness.run_action("configure-network", {"payload": payload})
+
+        self.assertEqual(container.pull("/simapp/config/simapp.yaml").read(), content)
+        self.assertEqual(output.results["subscribers"], 113)
+        self.assertEqual(output.results["config-bytes"], len(content))
+        self.assertEqual(output.results["pushed-bytes"], len(content))
+        self.assertEqual(output.results["imsi-ranges"], 2)
+        self.assertEqual(output.results["imsi-compaction-ratio"], 12.0)
+        self.assertIn("simapp", self.harness.get_container_pebble_plan("simapp").services)
+
+    def test_given_invalid_payload_when_configure_network_action_then_config_is_not_pushed(
+        self,
+    ):
+        self.harness.set_can_connect(container="simapp", val=True)
+        self._write_config_file()
+        container = self.harness.model.unit.get_container("simapp")
+        previous_content = container.pull("/simapp/config/simapp.yaml").read()
+        payload = base64.b64encode(gzip.compress(b"configuration: {}\n")).decode()
+
+        with self.assertRaises(testing.ActionFailed) as e:
+            self.harness.run_action("configure-network", {"payload": payload})
+
+        self.assertEqual(
+            e.exception.message, "Invalid config: Missing `sub-provision-endpt` section"
+        )
+        self.assertEqual(container.pull("/simapp/config/simapp.yaml").read(), previous_content)
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_file_in_storage_when_configure_network_action_with_path_then_config_is_pushed(
+        self,
+    ):
+        self.harness.set_can_connect(container="simapp", val=True)
+        self.harness.add_storage("simapp-volume", attach=True)
+        container = self.harness.model.unit.get_container("simapp")
+        storage = self.harness.model.storages["simapp-volume"][0]
+        with open("src/files/default_config.yaml") as f:
+            content = "".join(render_config(yaml.safe_load(f)))
+        (storage.location / "uploads").mkdir(parents=True)
+        (storage.location / "uploads" / "simapp.yaml.gz").write_bytes(
+            gzip.compress(content.encode())
+        )
+
+        output = self.harness.run_action("configure-network", {"path": "uploads/simapp.yaml.gz"})
+
+        self.assertEqual(container.pull("/simapp/config/simapp.yaml").read(), content)
+        self.assertEqual(output.results["subscribers"], 113)
+
+    def test_given_path_outside_of_storage_when_configure_network_action_then_action_fails(self):
+        self.harness.set_can_connect(container="simapp", val=True)
+        self.harness.add_storage("simapp-volume", attach=True)
+
+        with self.assertRaises(testing.ActionFailed) as e:
+            self.harness.run_action("configure-network", {"path": "../../etc/passwd"})
+
+        self.assertEqual(
+            e.exception.message,
+            "Invalid payload: `../../etc/passwd` is outside of the `simapp-volume` storage",
+        )
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_two_applied_configs_when_rollback_action_then_previous_config_is_restored(
+        self,
+    ):
+        self.harness.set_can_connect(container="simapp", val=True)
+        self.harness.add_storage("simapp-volume", attach=True)
+        storage = self.harness.model.storages["simapp-volume"][0]
+        with open("src/files/default_config.yaml") as f:
+            config = yaml.safe_load(f)
+        first = "".join(render_config(config))
+        config["info"]["version"] = "2.0.0"
+        for content in (first, "".join(render_config(config))):
+            payload = base64.b64encode(gzip.compress(content.encode())).decode()
+            self.harness.run_action("configure-network", {"payload": payload})
+
+        with patch("ops.model.Container.restart") as patch_restart:
+            output = self.harness.run_action("rollback")
+
+        self.assertEqual((storage.location / "simapp.yaml").read_text(), first)
+        self.assertEqual(output.results["restored-revision"], 1)
+        self.assertEqual(output.results["revision"], 3)
+        self.assertEqual(output.results["config-bytes"], len(first))
+        patch_restart.assert_called_once_with("simapp")
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_smaller_config_applied_when_rollback_action_then_config_size_is_recorded_again(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="simapp", val=True)
+        self.harness.add_storage("simapp-volume", attach=True)
+        container = self.harness.model.unit.get_container("simapp")
+        with open("src/files/default_config.yaml") as f:
+            config = yaml.safe_load(f)
+        first = "".join(render_config(config))
+        config["configuration"]["subscribers"] = config["configuration"]["subscribers"][:1]
+        for content in (first, "".join(render_config(config))):
+            payload = base64.b64encode(gzip.compress(content.encode())).decode()
+            self.harness.run_action("configure-network", {"payload": payload})
+
+        self.harness.run_action("rollback")
+        self.harness.framework.commit()
+
+        metrics = container.pull("/simapp/config/charm-metrics.prom").read()
+        self.assertIn("simapp_charm_config_subscribers 113\n", metrics)
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_malformed_snapshot_index_when_rollback_action_then_action_fails(self):
+        self.harness.set_can_connect(container="simapp", val=True)
+        self.harness.add_storage("simapp-volume", attach=True)
+        storage = self.harness.model.storages["simapp-volume"][0]
+        (storage.location / "snapshots").mkdir()
+        (storage.location / "snapshots" / "index.json").write_text('{"revisions": [{}]}')
+
+        with self.assertRaises(testing.ActionFailed) as e:
+            self.harness.run_action("rollback", {"revision": 1})
+
+        self.assertTrue(e.exception.message.startswith("Malformed snapshot index"))
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_snapshot_store_unwritable_when_configure_network_action_then_config_is_pushed(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="simapp", val=True)
+        self.harness.add_storage("simapp-volume", attach=True)
+        storage = self.harness.model.storages["simapp-volume"][0]
+        (storage.location / "snapshots").write_text("not a directory")
+        container = self.harness.model.unit.get_container("simapp")
+        with open("src/files/default_config.yaml") as f:
+            content = "".join(render_config(yaml.safe_load(f)))
+        payload = base64.b64encode(gzip.compress(content.encode())).decode()
+
+        with self.assertLogs("charm", level="WARNING"):
+            self.harness.run_action("configure-network", {"payload": payload})
+
+        self.assertEqual(container.pull("/simapp/config/simapp.yaml").read(), content)
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_snapshots_disabled_when_delta_pushed_then_config_is_rendered_once(self):
+        self.harness.set_can_connect(container="simapp", val=True)
+        container = self.harness.model.unit.get_container("simapp")
+        container.make_dir("/simapp/config", make_parents=True)
+        self.harness.update_config({"use-default-config": True})
+
+        with patch("charm.render_config", wraps=render_config) as patch_render_config:
+            self.harness.update_config({"gnodebs": "gnb9:9"})
+
+        patch_render_config.assert_called_once()
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_delta_pushed_when_on_config_changed_then_full_config_is_recorded(self):
+        self.harness.set_can_connect(container="simapp", val=True)
+        self.harness.add_storage("simapp-volume", attach=True)
+        storage = self.harness.model.storages["simapp-volume"][0]
+        self.harness.update_config({"use-default-config": True})
+
+        self.harness.update_config({"gnodebs": "gnb9:9"})
+
+        container = self.harness.model.unit.get_container("simapp")
+        delta = yaml.safe_load(container.pull("/simapp/config/simapp.yaml"))
+        self.assertEqual(delta["configuration"]["subscribers"], [])
+        snapshot_store = self.harness.charm._snapshot_store
+        revision = snapshot_store.revisions()[-1]
+        snapshot_store.restore(revision, storage.location / "restored.yaml")
+        restored = yaml.safe_load((storage.location / "restored.yaml").read_text())
+        self.assertEqual(len(restored["configuration"]["subscribers"]), 2)
+        self.assertEqual(revision.source, "default-config")
+
+    def test_given_no_previous_revision_when_rollback_action_then_action_fails(self):
+        self.harness.set_can_connect(container="simapp", val=True)
+        self.harness.add_storage("simapp-volume", attach=True)
+
+        with self.assertRaises(testing.ActionFailed) as e:
+            self.harness.run_action("rollback")
+
+        self.assertEqual(e.exception.message, "No previous revision to roll back to")
+
+    def test_given_no_storage_when_rollback_action_then_action_fails(self):
+        self.harness.set_can_connect(container="simapp", val=True)
+
+        with self.assertRaises(testing.ActionFailed) as e:
+            self.harness.run_action("rollback", {"revision": 1})
+
+        self.assertEqual(
+            e.exception.message,
+            "Snapshots need the `simapp-volume` storage and `snapshot-history`",
+        )
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_template_options_when_on_config_changed_then_rendered_config_uses_them(self):
+        self.harness.set_can_connect(container="simapp", val=True)
+        container = self.harness.model.unit.get_container("simapp")
+        container.make_dir("/simapp/config", make_parents=True)
+
+        self.harness.update_config(
+            {"use-default-config": True, "mcc": "001", "mnc": "01", "webui-hostname": "webui.x"}
+        )
+
+        config = yaml.safe_load(container.pull("/simapp/config/simapp.yaml"))
+        configuration = config["configuration"]
+        self.assertEqual(
+            configuration["network-slices"][0]["site-info"]["plmn"], {"mcc": "001", "mnc": "01"}
+        )
+        self.assertEqual(configuration["sub-provision-endpt"]["addr"], "webui.x")
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_template_options_unchanged_when_on_config_changed_then_template_is_not_rendered(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="simapp", val=True)
+        container = self.harness.model.unit.get_container("simapp")
+        container.make_dir("/simapp/config", make_parents=True)
+        self.harness.update_config({"use-default-config": True, "mcc": "001"})
+
+        with patch("charm.render_template") as patch_render_template:
+            self.harness.update_config({"compress-config-push": False})
+
+        patch_render_template.assert_not_called()
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_network_slice_changed_when_on_config_changed_then_pushed_delta_is_valid(self):
+        self.harness.set_can_connect(container="simapp", val=True)
+        container = self.harness.model.unit.get_container("simapp")
+        container.make_dir("/simapp/config", make_parents=True)
+        self.harness.update_config({"use-default-config": True})
+
+        self.harness.update_config({"mcc": "001"})
+
+        config = yaml.safe_load(container.pull("/simapp/config/simapp.yaml"))
+        validate_config(config)
+        self.assertEqual(len(config["configuration"]["device-groups"]), 2)
+        self.assertEqual(
+            config["configuration"]["network-slices"][0]["site-info"]["plmn"]["mcc"], "001"
+        )
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_count_when_generate_subscribers_action_then_population_is_pushed_and_applied(
+        self,
+    ):
+        self.harness.set_can_connect(container="simapp", val=True)
+        container = self.harness.model.unit.get_container("simapp")
+        container.make_dir("/simapp/config", make_parents=True)
+
+        output = self.harness.run_action(
+            "generate-subscribers",
+            {"count": 2500, "start-imsi": "001010000000001", "device-groups": 2},
+        )
+
+        config = yaml.safe_load(container.pull("/simapp/config/simapp.yaml"))
+        configuration = config["configuration"]
+        self.assertEqual(len(configuration["subscribers"]), 3)
+        self.assertEqual(
+            sum(len(group["imsis"]) for group in configuration["device-groups"]), 2500
+        )
+        self.assertEqual(output.results["subscribers"], 2500)
+        self.assertEqual(output.results["subscriber-ranges"], 3)
+        self.assertIn("simapp", self.harness.get_container_pebble_plan("simapp").services)
+
+    def test_given_invalid_population_when_generate_subscribers_action_then_action_fails(self):
+        self.harness.set_can_connect(container="simapp", val=True)
+
+        with self.assertRaises(testing.ActionFailed) as e:
+            self.harness.run_action("generate-subscribers", {"count": 10, "network-slices": 2})
+
+        self.assertEqual(
+            e.exception.message,
+            "Invalid population: "
+            "Expected 1 <= network slices <= device groups <= subscriber count",
+        )
+
+    @patch("charm.KubernetesResourcePatch.apply")
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_leader_when_config_size_changes_then_resources_are_patched_once_per_change(
+        self, patch_apply
+    ):
+        patch_apply.return_value = True
+        self.harness.set_leader(True)
+        self.harness.set_can_connect(container="simapp", val=True)
+        container = self.harness.model.unit.get_container("simapp")
+        container.make_dir("/simapp/config", make_parents=True)
+
+        self.harness.update_config({"use-default-config": True})
+        self.harness.container_pebble_ready("simapp")
+        self.harness.update_config({"subscriber-ranges": "208930100000001-208930100100000"})
+
+        self.assertEqual(
+            [call.args[0] for call in patch_apply.call_args_list],
+            [
+                {
+                    "requests": {"cpu": "101m", "memory": "129Mi"},
+                    "limits": {"cpu": "404m", "memory": "258Mi"},
+                },
+                {
+                    "requests": {"cpu": "200m", "memory": "324Mi"},
+                    "limits": {"cpu": "800m", "memory": "648Mi"},
+                },
+            ],
+        )
+
+    @patch("charm.KubernetesResourcePatch.apply")
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_resource_options_when_config_changed_then_options_override_sizing_model(
+        self, patch_apply
+    ):
+        patch_apply.return_value = True
+        self.harness.set_leader(True)
+        self.harness.set_can_connect(container="simapp", val=True)
+        container = self.harness.model.unit.get_container("simapp")
+        container.make_dir("/simapp/config", make_parents=True)
+
+        self.harness.update_config({"use-default-config": True, "memory-limit": "1Gi"})
+
+        self.assertEqual(patch_apply.call_args.args[0]["limits"]["memory"], "1Gi")
+
+    @patch("charm.KubernetesResourcePatch.apply")
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_peer_applied_larger_config_when_leader_patches_resources_then_largest_config_is_used(  # noqa: E501
+        self, patch_apply
+    ):
+        patch_apply.return_value = True
+        self.harness.set_leader(True)
+        relation_id = self.harness.add_relation("simapp-peers", "simapp-operator")
+        self.harness.add_relation_unit(relation_id, "simapp-operator/1")
+        self.harness.set_can_connect(container="simapp", val=True)
+        container = self.harness.model.unit.get_container("simapp")
+        container.make_dir("/simapp/config", make_parents=True)
+        self.harness.update_config({"use-default-config": True})
+
+        self.harness.update_relation_data(
+            relation_id,
+            "simapp-operator/1",
+            {"config-counts": json.dumps({"device-groups": 2, "subscribers": 100000})},
+        )
+
+        self.assertEqual(
+            patch_apply.call_args.args[0],
+            {
+                "requests": {"cpu": "200m", "memory": "324Mi"},
+                "limits": {"cpu": "800m", "memory": "648Mi"},
+            },
+        )
+        unit_data = self.harness.get_relation_data(relation_id, "simapp-operator/0")
+        self.assertEqual(
+            json.loads(unit_data["config-counts"]), {"device-groups": 2, "subscribers": 113}
+        )
+
+    @patch("charm.KubernetesResourcePatch.apply")
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_resources_patched_when_upgrade_charm_then_resources_are_patched_again(
+        self, patch_apply
+    ):
+        patch_apply.return_value = True
+        self.harness.set_leader(True)
+        self.harness.set_can_connect(container="simapp", val=True)
+        container = self.harness.model.unit.get_container("simapp")
+        container.make_dir("/simapp/config", make_parents=True)
+        self.harness.update_config({"use-default-config": True})
+        patch_apply.reset_mock()
+
+        self.harness.charm.on.upgrade_charm.emit()
+
+        patch_apply.assert_called_once()
+
+    @patch("charm.KubernetesResourcePatch.apply")
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_use_default_config_when_configure_network_action_then_config_file_is_not_used_for_sizing(  # noqa: E501
+        self, patch_apply
+    ):
+        patch_apply.return_value = True
+        self.harness.set_leader(True)
+        self.harness.set_can_connect(container="simapp", val=True)
+        container = self.harness.model.unit.get_container("simapp")
+        container.make_dir("/simapp/config", make_parents=True)
+        self.harness.update_config(
+            {"use-default-config": True, "subscriber-ranges": "208930100000001-208930100100000"}
+        )
+        with open("src/files/default_config.yaml") as f:
+            config = yaml.safe_load(f)
+        config["configuration"]["subscribers"] = config["configuration"]["subscribers"][:1]
+        config["configuration"]["subscribers"][0]["ueId-end"] = "208930100007487"
+        self._write_config_file(config)
+        patch_apply.reset_mock()
+
+        output = self.harness.run_action("configure-network")
+
+        self.assertEqual(output.results, {"subscribers": 100000})
+        patch_apply.assert_not_called()
+
+    @patch("charm.gethostbyname", new=Mock(return_value="1.2.3.4"))
+    def test_given_tracing_file_when_dispatch_is_committed_then_trace_is_appended_to_file(self):
+        self.harness.set_can_connect(container="simapp", val=True)
+        self._write_config_file()
+        with tempfile.TemporaryDirectory() as directory:
+            trace_file = f"{directory}/traces.jsonl"
+            self.harness.update_config({"tracing-file": trace_file})
+            self.harness.run_action("configure-network")
+
+            self.harness.framework.commit()
+
+            with open(trace_file) as f:
+                document = json.loads(f.read())
+        spans = document["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        names = [span["name"] for span in spans]
+        self.assertIn("_on_configure_network_action", names)
+        self.assertIn("pebble.restart", names)
+        self.assertEqual(names[-1], "dispatch unknown")
+        root = spans[-1]["spanId"]
+        handler = spans[names.index("_on_configure_network_action")]
+        self.assertEqual(handler["parentSpanId"], root)
+        pull = spans[names.index("pebble.pull")]
+        self.assertEqual(pull["parentSpanId"], handler["spanId"])
+
+    def test_given_invalid_receiver_port_when_dispatch_is_committed_then_export_failure_is_logged(  # noqa: E501
+        self,
+    ):
+        relation_id = self.harness.add_relation("tracing", "tempo")
+        self.harness.add_relation_unit(relation_id, "tempo/0")
+        receivers = [
+            {"protocol": {"name": "otlp_http", "type": "http"}, "url": "http://tempo:port"}
+        ]
+        self.harness.update_relation_data(
+            relation_id, "tempo", {"receivers": json.dumps(receivers)}
+        )
+
+        with self.assertLogs("charm", level="WARNING") as logs:
+            self.harness.framework.commit()
+
+        self.assertIn("Could not export trace to http://tempo:port", logs.output[0])
+
+    @patch("charm.post_trace")
+    def test_given_tracing_relation_when_dispatch_is_committed_then_trace_is_posted(
+        self, patch_post_trace
+    ):
+        self.harness.set_leader(True)
+        relation_id = self.harness.add_relation("tracing", "tempo")
+        self.harness.add_relation_unit(relation_id, "tempo/0")
+        receivers = [
+            {"protocol": {"name": "otlp_http", "type": "http"}, "url": "http://tempo:4318"}
+        ]
+        self.harness.update_relation_data(
+            relation_id, "tempo", {"receivers": json.dumps(receivers)}
+        )
+
+        self.harness.framework.commit()
+
+        self.assertEqual(
+            self.harness.get_relation_data(relation_id, "simapp-operator")["receivers"],
+            '["otlp_http"]',
+        )
+        endpoint, document = patch_post_trace.call_args.args
+        self.assertEqual(endpoint, "http://tempo:4318")
+        self.assertIn("resourceSpans", document)
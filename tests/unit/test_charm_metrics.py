@@ -0,0 +1,36 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import unittest
+
+from charm_metrics import CharmMetrics
+
+
+class TestCharmMetrics(unittest.TestCase):
+    def test_given_samples_when_render_then_prometheus_exposition_is_returned(self):
+        metrics = CharmMetrics({})
+        metrics.inc("simapp_charm_replans_total")
+        metrics.inc("simapp_charm_replans_total")
+        metrics.observe("simapp_charm_hook_duration_seconds", 0.5, hook="config-changed")
+        metrics.set("simapp_charm_config_subscribers", 113)
+
+        self.assertEqual(
+            metrics.render(),
+            "# HELP simapp_charm_hook_duration_seconds Duration of charm dispatches.\n"
+            "# TYPE simapp_charm_hook_duration_seconds summary\n"
+            'simapp_charm_hook_duration_seconds_count{hook="config-changed"} 1\n'
+            'simapp_charm_hook_duration_seconds_sum{hook="config-changed"} 0.5\n'
+            "# HELP simapp_charm_replans_total Number of Pebble replans.\n"
+            "# TYPE simapp_charm_replans_total counter\n"
+            "simapp_charm_replans_total 2\n"
+            "# HELP simapp_charm_config_subscribers Number of subscribers in the applied config.\n"
+            "# TYPE simapp_charm_config_subscribers gauge\n"
+            "simapp_charm_config_subscribers 113\n",
+        )
+
+    def test_given_existing_samples_when_inc_then_samples_are_updated_in_place(self):
+        samples = {"simapp_charm_config_pushes_total": 3}
+
+        CharmMetrics(samples).inc("simapp_charm_config_pushes_total")
+
+        self.assertEqual(samples, {"simapp_charm_config_pushes_total": 4})
@@ -0,0 +1,74 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import copy
+import unittest
+
+import yaml
+
+from config_delta import config_snapshot, delta_config, diff_snapshots
+from config_validator import validate_config
+
+with open("src/files/default_config.yaml") as f:
+    DEFAULT_CONFIG = yaml.safe_load(f)
+
+
+class TestConfigDelta(unittest.TestCase):
+    def setUp(self):
+        self.previous_snapshot = config_snapshot(DEFAULT_CONFIG)
+        self.config = copy.deepcopy(DEFAULT_CONFIG)
+        self.configuration = self.config["configuration"]
+
+    def test_given_no_previous_snapshot_when_diff_snapshots_then_full_resync_is_required(self):
+        delta = diff_snapshots(None, config_snapshot(self.config))
+
+        self.assertTrue(delta.full_resync)
+        self.assertEqual(delta_config(self.config, delta), self.config)
+
+    def test_given_identical_configs_when_diff_snapshots_then_delta_is_empty(self):
+        delta = diff_snapshots(self.previous_snapshot, config_snapshot(self.config))
+
+        self.assertTrue(delta.is_empty)
+
+    def test_given_provision_endpoint_changed_when_diff_snapshots_then_full_resync_is_required(
+        self,
+    ):
+        self.configuration["sub-provision-endpt"]["addr"] = "webui.other"
+
+        delta = diff_snapshots(self.previous_snapshot, config_snapshot(self.config))
+
+        self.assertTrue(delta.full_resync)
+
+    def test_given_subscriber_changed_and_device_group_removed_when_delta_config_then_only_changed_subscriber_is_kept(  # noqa: E501
+        self,
+    ):
+        self.configuration["subscribers"][1]["opc"] = "00000000000000000000000000000000"
+        removed_device_group = self.configuration["device-groups"].pop()
+
+        delta = diff_snapshots(self.previous_snapshot, config_snapshot(self.config))
+        configuration = delta_config(self.config, delta)["configuration"]
+
+        self.assertFalse(delta.full_resync)
+        self.assertEqual(
+            delta.sections["subscribers"].modified, {"208930100007501-208930100007599"}
+        )
+        self.assertEqual(delta.sections["device-groups"].removed, {removed_device_group["name"]})
+        self.assertEqual(configuration["subscribers"], [self.configuration["subscribers"][1]])
+        self.assertEqual(configuration["device-groups"], [])
+        self.assertEqual(configuration["network-slices"], [])
+        self.assertEqual(
+            configuration["sub-provision-endpt"], self.configuration["sub-provision-endpt"]
+        )  # noqa: E501
+
+    def test_given_network_slice_changed_when_delta_config_then_its_device_groups_are_kept(self):
+        self.configuration["network-slices"][0]["site-info"]["plmn"]["mcc"] = "001"
+
+        delta = diff_snapshots(self.previous_snapshot, config_snapshot(self.config))
+        delta_configuration = delta_config(self.config, delta)
+
+        self.assertEqual(delta.sections["device-groups"].modified, set())
+        self.assertEqual(
+            delta_configuration["configuration"]["device-groups"],
+            self.configuration["device-groups"],
+        )
+        validate_config(delta_configuration)
@@ -0,0 +1,68 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import base64
+import gzip
+import unittest
+from unittest.mock import patch
+
+import zstandard
+
+from config_payload import PayloadError, base64_chunks, decompress_chunks
+
+CONTENT = b"configuration:\n  subscribers: []\n" * 1000
+
+
+class TestConfigPayload(unittest.TestCase):
+    def test_given_wrapped_base64_payload_when_base64_chunks_then_payload_is_decoded_in_chunks(
+        self,
+    ):
+        encoded = base64.encodebytes(CONTENT).decode()
+
+        chunks = list(base64_chunks(encoded, chunk_size=1024))
+
+        self.assertEqual(b"".join(chunks), CONTENT)
+        self.assertTrue(all(len(chunk) <= 1026 for chunk in chunks))
+        self.assertGreater(len(chunks), 1)
+
+    def test_given_invalid_base64_when_base64_chunks_then_error_is_raised(self):
+        with self.assertRaises(PayloadError) as e:
+            list(base64_chunks("not*base64"))
+
+        self.assertEqual(e.exception.message, "Payload is not valid base64")
+
+    def test_given_gzip_stream_when_decompress_chunks_then_chunks_are_bounded(self):
+        compressed = gzip.compress(CONTENT)
+        chunks = [compressed[i : i + 7] for i in range(0, len(compressed), 7)]  # noqa: E203
+
+        decompressed = list(decompress_chunks(chunks, chunk_size=512))
+
+        self.assertEqual(b"".join(decompressed), CONTENT)
+        self.assertTrue(all(len(chunk) <= 512 for chunk in decompressed))
+
+    def test_given_uncompressed_stream_when_decompress_chunks_then_stream_is_passed_through(self):
+        self.assertEqual(b"".join(decompress_chunks([b"a", b"bcd", b"ef"])), b"abcdef")
+
+    def test_given_truncated_gzip_stream_when_decompress_chunks_then_error_is_raised(self):
+        with self.assertRaises(PayloadError) as e:
+            list(decompress_chunks([gzip.compress(CONTENT)[:-20]]))
+
+        self.assertEqual(e.exception.message, "Payload is truncated")
+
+    def test_given_zstd_stream_when_decompress_chunks_then_chunks_are_bounded(self):
+        compressed = zstandard.ZstdCompressor().compress(CONTENT)
+        chunks = [compressed[i : i + 7] for i in range(0, len(compressed), 7)]  # noqa: E203
+
+        decompressed = list(decompress_chunks(chunks, chunk_size=512))
+
+        self.assertEqual(b"".join(decompressed), CONTENT)
+        self.assertTrue(all(len(chunk) <= 512 for chunk in decompressed))
+
+    def test_given_zstd_stream_and_zstandard_missing_when_decompress_chunks_then_error_is_raised(
+        self,
+    ):
+        with patch.dict("sys.modules", {"zstandard": None}):
+            with self.assertRaises(PayloadError) as e:
+                list(decompress_chunks([b"\x28\xb5\x2f\xfd" + b"\x00" * 8]))
+
+        self.assertEqual(e.exception.message, "zstd payloads require the `zstandard` package")
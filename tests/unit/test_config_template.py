@@ -0,0 +1,139 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import tempfile
+import unittest
+
+from config_template import load_template, options_digest, render_template, template_options
+from config_validator import ConfigValidationError, validate_config
+
+DEFAULT_CONFIG_FILE_PATH = "src/files/default_config.yaml"
+
+
+class TestConfigTemplate(unittest.TestCase):
+    def setUp(self):
+        self.template = load_template(DEFAULT_CONFIG_FILE_PATH)
+
+    def test_given_no_options_when_render_template_then_template_is_rendered_unchanged(self):
+        self.assertEqual(render_template(self.template, {}), self.template.model)
+
+    def test_given_network_options_when_render_template_then_options_override_template(self):
+        options = {
+            "mcc": "001",
+            "mnc": "01",
+            "gnodebs": "gnb1:10, gnb2:20",
+            "sst": 2,
+            "sd": "abcdef",
+            "upf-hostname": "upf.example",
+            "upf-port": 9999,
+            "webui-hostname": "webui.example",
+            "webui-port": 5001,
+        }
+
+        config = render_template(self.template, options)
+
+        configuration = config["configuration"]
+        network_slice = configuration["network-slices"][0]
+        self.assertEqual(network_slice["site-info"]["plmn"], {"mcc": "001", "mnc": "01"})
+        self.assertEqual(
+            network_slice["site-info"]["gNodeBs"],
+            [{"name": "gnb1", "tac": 10}, {"name": "gnb2", "tac": 20}],
+        )
+        self.assertEqual(
+            network_slice["site-info"]["upf"], {"upf-name": "upf.example", "upf-port": 9999}
+        )
+        self.assertEqual(network_slice["slice-id"], {"sst": 2, "sd": "abcdef"})
+        self.assertEqual(
+            configuration["sub-provision-endpt"], {"addr": "webui.example", "port": 5001}
+        )
+        self.assertEqual(
+            {subscriber["plmnId"] for subscriber in configuration["subscribers"]}, {"00101"}
+        )
+        validate_config(config)
+
+    def test_given_options_when_render_template_then_template_is_not_modified(self):
+        model_before = repr(self.template.model)
+
+        render_template(self.template, {"mcc": "001", "subscriber-ranges": "1-2"})
+
+        self.assertEqual(repr(self.template.model), model_before)
+
+    def test_given_subscriber_ranges_when_render_template_then_ranges_are_given_to_device_groups(
+        self,
+    ):
+        ranges = [
+            "001010000000001-001010000000010",
+            "001010000000011-001010000000020",
+            "001010000000021-001010000000030",
+        ]
+        options = {"subscriber-ranges": ",".join(ranges)}
+
+        config = render_template(self.template, options)
+
+        configuration = config["configuration"]
+        self.assertEqual(
+            [
+                (subscriber["ueId-start"], subscriber["ueId-end"])
+                for subscriber in configuration["subscribers"]
+            ],
+            [
+                ("001010000000001", "001010000000010"),
+                ("001010000000011", "001010000000020"),
+                ("001010000000021", "001010000000030"),
+            ],
+        )
+        self.assertEqual(
+            [device_group["imsi-ranges"] for device_group in configuration["device-groups"]],
+            [
+                [{"start": "001010000000001", "end": "001010000000010"}],
+                [
+                    {"start": "001010000000011", "end": "001010000000020"},
+                    {"start": "001010000000021", "end": "001010000000030"},
+                ],
+            ],
+        )
+        validate_config(config)
+
+    def test_given_invalid_gnodeb_when_render_template_then_error_is_raised(self):
+        with self.assertRaises(ConfigValidationError) as e:
+            render_template(self.template, {"gnodebs": "gnb1:1,gnb2"})
+
+        self.assertEqual(e.exception.message, "Invalid gNodeB `gnb2`, expected name:tac")
+
+    def test_given_invalid_subscriber_range_when_render_template_then_error_is_raised(self):
+        with self.assertRaises(ConfigValidationError) as e:
+            render_template(self.template, {"subscriber-ranges": "20-10"})
+
+        self.assertEqual(
+            e.exception.message, "Invalid subscriber range `20-10`, expected start-end"
+        )
+
+    def test_given_unset_options_when_template_options_then_only_set_options_are_returned(self):
+        options = template_options(
+            {"mcc": "001", "mnc": "", "sst": None, "use-default-config": True}
+        )
+
+        self.assertEqual(options, {"mcc": "001"})
+
+    def test_given_same_template_when_load_template_then_compiled_template_is_reused(self):
+        self.assertIs(load_template(DEFAULT_CONFIG_FILE_PATH), self.template)
+
+    def test_given_template_file_changes_when_load_template_then_template_is_compiled_again(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".yaml") as template_file:
+            template_file.write("configuration: {}\n")
+            template_file.flush()
+            first = load_template(template_file.name)
+            template_file.write("info: {}\n")
+            template_file.flush()
+
+            second = load_template(template_file.name)
+
+        self.assertEqual(second.model, {"configuration": {}, "info": {}})
+        self.assertNotEqual(first.digest, second.digest)
+
+    def test_given_different_options_when_options_digest_then_digests_differ(self):
+        digest = options_digest(self.template, {"mcc": "001"}, "0/1")
+
+        self.assertEqual(digest, options_digest(self.template, {"mcc": "001"}, "0/1"))
+        self.assertNotEqual(digest, options_digest(self.template, {"mcc": "002"}, "0/1"))
+        self.assertNotEqual(digest, options_digest(self.template, {"mcc": "001"}, "0/2"))
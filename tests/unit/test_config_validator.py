@@ -0,0 +1,73 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import copy
+import unittest
+
+import yaml
+
+from config_validator import ConfigValidationError, validate_config
+
+with open("src/files/default_config.yaml") as f:
+    DEFAULT_CONFIG = yaml.safe_load(f)
+
+
+class TestConfigValidator(unittest.TestCase):
+    def setUp(self):
+        self.config = copy.deepcopy(DEFAULT_CONFIG)
+        self.configuration = self.config["configuration"]
+
+    def assert_invalid(self, message: str) -> None:
+        with self.assertRaises(ConfigValidationError) as e:
+            validate_config(self.config)
+        self.assertEqual(e.exception.message, message)
+
+    def test_given_default_config_when_validate_config_then_no_error_is_raised(self):
+        validate_config(self.config)
+
+    def test_given_missing_configuration_when_validate_config_then_error_is_raised(self):
+        self.config = {"info": {}}
+
+        self.assert_invalid("Missing `configuration` section")
+
+    def test_given_subscriber_missing_key_when_validate_config_then_error_is_raised(self):
+        del self.configuration["subscribers"][0]["opc"]
+
+        self.assert_invalid("Subscriber is missing `opc`")
+
+    def test_given_overlapping_subscriber_ranges_when_validate_config_then_error_is_raised(self):
+        self.configuration["subscribers"][1]["ueId-start"] = "208930100007490"
+
+        self.assert_invalid(
+            "Overlapping subscriber ranges: 208930100007487-208930100007500 and "
+            "208930100007490-208930100007599"
+        )
+
+    def test_given_imsi_in_range_of_other_device_group_when_validate_config_then_error_is_raised(
+        self,
+    ):
+        self.configuration["device-groups"][1]["imsis"] = ["208930100007495"]
+
+        self.assert_invalid(
+            "IMSI 208930100007495 is in device groups `5g-gnbsim-user-group1` and "
+            "`5g-gnbsim-user-group2`"
+        )
+
+    def test_given_slice_references_unknown_device_group_when_validate_config_then_error_is_raised(  # noqa: E501
+        self,
+    ):
+        self.configuration["network-slices"][0]["site-device-group"].append("missing")
+
+        self.assert_invalid("Network slice `default` references unknown device group `missing`")
+
+    def test_given_duplicate_in_large_explicit_imsi_list_when_validate_config_then_error_is_raised(  # noqa: E501
+        self,
+    ):
+        imsis = [str(imsi) for imsi in range(1010000000000, 1010000200000)]
+        self.configuration["device-groups"] = [
+            {"name": "group1", "imsis": imsis},
+            {"name": "group2", "imsis": [imsis[-1]]},
+        ]
+        self.configuration["network-slices"][0]["site-device-group"] = ["group1", "group2"]
+
+        self.assert_invalid("IMSI 1010000199999 is in device groups `group1` and `group2`")
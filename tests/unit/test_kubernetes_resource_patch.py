@@ -0,0 +1,133 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import unittest
+from unittest.mock import Mock, patch
+
+from lightkube import ApiError
+from lightkube.models.apps_v1 import StatefulSetSpec
+from lightkube.models.core_v1 import Container, PodSpec, PodTemplateSpec, ResourceRequirements
+from lightkube.models.meta_v1 import LabelSelector
+from lightkube.resources.apps_v1 import StatefulSet
+from lightkube.types import PatchType
+from ops.charm import CharmBase
+from ops.testing import Harness
+
+from kubernetes_resource_patch import KubernetesResourcePatch, resources_for
+
+
+class _TestCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.resource_patcher = KubernetesResourcePatch(self, "simapp")
+
+
+class TestResourcesFor(unittest.TestCase):
+    def test_given_small_config_when_resources_for_then_base_resources_are_returned(self):
+        self.assertEqual(
+            resources_for(subscribers=113, device_groups=2),
+            {
+                "requests": {"cpu": "101m", "memory": "129Mi"},
+                "limits": {"cpu": "404m", "memory": "258Mi"},
+            },
+        )
+
+    def test_given_million_subscribers_when_resources_for_then_resources_scale(self):
+        self.assertEqual(
+            resources_for(subscribers=1000000, device_groups=10),
+            {
+                "requests": {"cpu": "1100m", "memory": "2082Mi"},
+                "limits": {"cpu": "4400m", "memory": "4164Mi"},
+            },
+        )
+
+    def test_given_overrides_when_resources_for_then_overrides_take_precedence(self):
+        resources = resources_for(
+            subscribers=113,
+            device_groups=2,
+            overrides={"memory-limit": "1Gi", "cpu-request": "500m", "cpu-limit": None},
+        )
+
+        self.assertEqual(
+            resources,
+            {
+                "requests": {"cpu": "500m", "memory": "129Mi"},
+                "limits": {"cpu": "404m", "memory": "1Gi"},
+            },
+        )
+
+
+def _statefulset(resources: ResourceRequirements) -> StatefulSet:
+    return StatefulSet(
+        spec=StatefulSetSpec(
+            selector=LabelSelector(),
+            serviceName="simapp-endpoints",
+            template=PodTemplateSpec(
+                spec=PodSpec(
+                    containers=[
+                        Container(name="charm"),
+                        Container(name="simapp", resources=resources),
+                    ]
+                )
+            ),
+        )
+    )
+
+
+class TestKubernetesResourcePatch(unittest.TestCase):
+    def setUp(self):
+        self.harness = Harness(_TestCharm, meta="name: simapp")
+        self.harness.set_model_name("whatever")
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+        self.resources = resources_for(subscribers=0, device_groups=0)
+
+    @patch("lightkube.Client")
+    def test_given_resources_when_apply_then_container_of_statefulset_is_patched(
+        self, patch_client
+    ):
+        patch_client.return_value.get.return_value = _statefulset(ResourceRequirements())
+
+        applied = self.harness.charm.resource_patcher.apply(self.resources)
+
+        self.assertTrue(applied)
+        patch_client.return_value.patch.assert_called_once_with(
+            StatefulSet,
+            "simapp",
+            {
+                "spec": {
+                    "template": {
+                        "spec": {"containers": [{"name": "simapp", "resources": self.resources}]}
+                    }
+                }
+            },
+            namespace="whatever",
+            patch_type=PatchType.STRATEGIC,
+        )
+
+    @patch("lightkube.Client")
+    def test_given_same_resources_in_live_statefulset_when_apply_then_statefulset_is_not_patched(  # noqa: E501
+        self, patch_client
+    ):
+        patch_client.return_value.get.return_value = _statefulset(
+            ResourceRequirements(
+                requests={"cpu": "0.1", "memory": "128Mi"},
+                limits={"cpu": "400m", "memory": "0.25Gi"},
+            )
+        )
+
+        applied = self.harness.charm.resource_patcher.apply(self.resources)
+
+        self.assertTrue(applied)
+        patch_client.return_value.get.assert_called_once_with(
+            StatefulSet, "simapp", namespace="whatever"
+        )
+        patch_client.return_value.patch.assert_not_called()
+
+    @patch("lightkube.Client")
+    def test_given_api_error_when_apply_then_patch_is_not_applied(self, patch_client):
+        response = Mock()
+        response.json.return_value = {"code": 403, "message": "forbidden"}
+        patch_client.return_value.patch.side_effect = ApiError(response=response)
+
+        self.assertFalse(self.harness.charm.resource_patcher.apply(self.resources))
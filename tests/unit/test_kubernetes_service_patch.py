@@ -0,0 +1,389 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from unittest.mock import Mock, mock_open, patch
+from urllib.parse import parse_qs, urlparse
+
+from lightkube import ApiError
+from lightkube.models.core_v1 import ServicePort
+from lightkube.resources.core_v1 import Service
+from ops.charm import CharmBase
+from ops.testing import Harness
+
+from kubernetes_service_patch import KubernetesServicePatch
+
+NAMESPACE_FILE_PATH = "/var/run/secrets/kubernetes.io/serviceaccount/namespace"
+NAMESPACE = "whatever"
+SERVICES_PATH = f"/api/v1/namespaces/{NAMESPACE}/services"
+KUBECONFIG = """
+apiVersion: v1
+kind: Config
+clusters: [{{name: fake, cluster: {{server: "http://{host}:{port}"}}}}]
+contexts: [{{name: fake, context: {{cluster: fake, user: fake, namespace: {namespace}}}}}]
+current-context: fake
+users: [{{name: fake, user: {{}}}}]
+"""
+
+
+class _TestCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.service_patcher = KubernetesServicePatch(
+            self,
+            [ServicePort(name="config-exporter", port=8080)],
+            service_name=self.config.get("service-name"),
+            server_side_apply=True,
+        )
+
+
+class _MappingPortsCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.service_patcher = KubernetesServicePatch(
+            self, [{"name": "config-exporter", "port": 8080}], server_side_apply=True
+        )
+
+
+class _AsyncTestCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.service_patcher = KubernetesServicePatch(
+            self,
+            [{"name": "config-exporter", "port": 8080}],
+            service_name=self.config.get("service-name"),
+            server_side_apply=self.config.get("server-side-apply", False),
+            asynchronous=True,
+            timeout=float(self.config.get("timeout", 5)),
+        )
+
+
+class FakeKubernetesApi:
+    """Local HTTP server serving the Service endpoints of the Kubernetes API."""
+
+    def __init__(self, latency: float = 0.0, failures: int = 0):
+        """Constructor for FakeKubernetesApi.
+
+        Args:
+            latency: Seconds every request is delayed by.
+            failures: Number of first requests answered with a 503 error.
+        """
+        self.latency = latency
+        self.failures = failures
+        self.services: dict = {}
+        self.requests: list = []
+        self._changed = threading.Condition()
+        self._server = _QuietHTTPServer(("127.0.0.1", 0), _api_handler(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self) -> "FakeKubernetesApi":
+        """Starts serving and points lightkube's configuration at the server."""
+        self._thread.start()
+        host, port = self._server.server_address[:2]
+        kubeconfig = tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False)
+        with kubeconfig:
+            kubeconfig.write(KUBECONFIG.format(host=host, port=port, namespace=NAMESPACE))
+        self._kubeconfig = kubeconfig.name
+        self._env = patch.dict(os.environ, {"KUBECONFIG": kubeconfig.name})
+        self._env.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Stops serving."""
+        self._env.stop()
+        os.unlink(self._kubeconfig)
+        self._server.shutdown()
+        self._server.server_close()
+
+    def add_service(self, name: str, port: int) -> None:
+        """Adds a service exposing a single port."""
+        with self._changed:
+            self.services[name] = _service(name, [{"name": "placeholder", "port": port}])
+            self._changed.notify_all()
+
+    def ports(self, name: str) -> list:
+        """Returns the ports of a service."""
+        return [port["port"] for port in self.services[name]["spec"]["ports"]]
+
+    def handle(self, method: str, path: str, body: Optional[dict]):
+        """Returns the status and body to answer a request with, or the service watched."""
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlparse(path)
+        query = parse_qs(url.query)
+        with self._changed:
+            self.requests.append((method, url.path))
+            if self.failures:
+                self.failures -= 1
+                return 503, _status(503)
+            name = url.path[len(SERVICES_PATH) + 1 :]  # noqa: E203
+            if method == "GET" and "watch" in query:
+                return "watch", query["fieldSelector"][0].partition("=")[2]
+            if method == "POST":
+                name = body["metadata"]["name"]
+                if name in self.services:
+                    return 409, _status(409)
+                self.services[name] = body
+                self._changed.notify_all()
+                return 201, body
+            return self._handle_service(method, name, body, "fieldManager" in query)
+
+    def _handle_service(self, method: str, name: str, body: Optional[dict], apply: bool):
+        if method == "PATCH" and apply:
+            spec = self.services.setdefault(name, body).setdefault("spec", {})
+            spec["ports"] = body["spec"]["ports"]
+            return 200, self.services[name]
+        if name not in self.services:
+            return 404, _status(404)
+        if method == "GET":
+            return 200, self.services[name]
+        if method == "DELETE":
+            del self.services[name]
+            return 200, _status(200)
+        if method == "PATCH":
+            self.services[name]["spec"]["ports"] = body["spec"]["ports"]
+            return 200, self.services[name]
+        return 405, _status(405)
+
+    def wait_for(self, name: str, timeout: float) -> Optional[dict]:
+        """Waits for a service to exist and returns it."""
+        with self._changed:
+            self._changed.wait_for(lambda: name in self.services, timeout)
+            return self.services.get(name)
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address) -> None:
+        # Clients giving up on slow requests close their connections mid-response
+        pass
+
+
+def _service(name: str, ports: list) -> dict:
+    return {
+        "apiVersion": "v1",
+        "kind": "Service",
+        "metadata": {"name": name, "namespace": NAMESPACE, "uid": "1", "resourceVersion": "1"},
+        "spec": {"ports": ports},
+    }
+
+
+def _status(code: int) -> dict:
+    return {"kind": "Status", "apiVersion": "v1", "code": code, "message": f"status {code}"}
+
+
+def _api_handler(api: FakeKubernetesApi) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        def _respond(self) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length)) if length else None
+            status, payload = api.handle(self.command, self.path, body)
+            if status == "watch":
+                service = api.wait_for(payload, timeout=5)
+                self.send_response(200)
+                self.send_header("Connection", "close")
+                self.end_headers()
+                if service:
+                    event = {"type": "ADDED", "object": service}
+                    self.wfile.write(json.dumps(event).encode() + b"\n")
+                return
+            content = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        do_GET = do_POST = do_PATCH = do_DELETE = _respond  # noqa: N815
+
+        def log_message(self, format: str, *args) -> None:  # noqa: A002
+            pass
+
+    return Handler
+
+
+def _api_error(code: int) -> ApiError:
+    response = Mock()
+    response.json.return_value = {"code": code, "message": "error"}
+    return ApiError(response=response)
+
+
+class TestKubernetesServicePatch(unittest.TestCase):
+    def _begin(self, service_name=None):
+        config = "options:\n  service-name:\n    type: string\n"
+        harness = Harness(_TestCharm, meta="name: simapp", config=config)
+        if service_name:
+            harness.update_config({"service-name": service_name})
+        self.addCleanup(harness.cleanup)
+        harness.begin()
+        return harness
+
+    @patch("lightkube.Client")
+    @patch("builtins.open", new_callable=mock_open, read_data="whatever")
+    def test_given_server_side_apply_when_patch_then_service_is_applied_in_single_request(
+        self, patch_open, patch_client
+    ):
+        harness = self._begin()
+        client = patch_client.return_value
+
+        harness.charm.service_patcher._patch(None)
+
+        client.apply.assert_called_once_with(
+            harness.charm.service_patcher.service, field_manager="simapp", force=True
+        )
+        client.get.assert_not_called()
+        client.patch.assert_not_called()
+        client.delete.assert_not_called()
+
+    @patch("lightkube.Client")
+    @patch("builtins.open", new_callable=mock_open, read_data="whatever")
+    def test_given_several_calls_when_patch_then_client_and_namespace_are_created_once(
+        self, patch_open, patch_client
+    ):
+        harness = self._begin()
+
+        harness.charm.service_patcher._patch(None)
+        harness.charm.service_patcher._patch(None)
+
+        patch_client.assert_called_once()
+        patch_open.assert_called_once_with(NAMESPACE_FILE_PATH, "r")
+
+    @patch("lightkube.Client")
+    @patch("builtins.open", new_callable=mock_open, read_data="whatever")
+    def test_given_custom_service_name_when_patch_then_juju_service_is_deleted(
+        self, patch_open, patch_client
+    ):
+        harness = self._begin(service_name="simapp-custom")
+        client = patch_client.return_value
+        client.delete.side_effect = _api_error(404)
+
+        harness.charm.service_patcher._patch(None)
+
+        client.apply.assert_called_once()
+        client.delete.assert_called_once_with(Service, "simapp", namespace="whatever")
+
+    @patch("lightkube.Client")
+    @patch("builtins.open", new_callable=mock_open, read_data="whatever")
+    def test_given_event_other_than_install_when_charm_is_constructed_then_service_is_not_built(
+        self, patch_open, patch_client
+    ):
+        harness = self._begin()
+
+        harness.charm.on.config_changed.emit()
+
+        patch_client.assert_not_called()
+        patch_open.assert_not_called()
+        self.assertNotIn("service", vars(harness.charm.service_patcher))
+
+    @patch("builtins.open", new_callable=mock_open, read_data="whatever")
+    def test_given_ports_as_mappings_when_service_then_ports_are_service_ports(self, patch_open):
+        harness = Harness(_MappingPortsCharm, meta="name: simapp")
+        self.addCleanup(harness.cleanup)
+        harness.begin()
+
+        self.assertEqual(
+            harness.charm.service_patcher.service.spec.ports,
+            [ServicePort(name="config-exporter", port=8080)],
+        )
+
+
+@patch.object(KubernetesServicePatch, "_namespace", NAMESPACE)
+class TestKubernetesServicePatchAsynchronous(unittest.TestCase):
+    def _begin(self, **config):
+        options = {"service-name": "string", "server-side-apply": "boolean", "timeout": "float"}
+        meta_config = "options:\n" + "".join(
+            f"  {option}:\n    type: {kind}\n" for option, kind in options.items()
+        )
+        harness = Harness(_AsyncTestCharm, meta="name: simapp", config=meta_config)
+        harness.update_config(config)
+        self.addCleanup(harness.cleanup)
+        harness.begin()
+        return harness
+
+    def test_given_server_side_apply_when_patch_then_service_is_applied(self):
+        with FakeKubernetesApi() as api:
+            api.add_service("simapp", 65535)
+            harness = self._begin(**{"server-side-apply": True})
+
+            harness.charm.service_patcher._patch(None)
+
+        self.assertEqual(api.ports("simapp"), [8080])
+        self.assertEqual(api.requests, [("PATCH", f"{SERVICES_PATH}/simapp")])
+
+    def test_given_custom_service_name_when_patch_then_service_is_recreated_and_patched(self):
+        with FakeKubernetesApi() as api:
+            api.add_service("simapp", 65535)
+            harness = self._begin(**{"service-name": "simapp-custom"})
+
+            harness.charm.service_patcher._patch(None)
+
+        self.assertNotIn("simapp", api.services)
+        self.assertEqual(api.ports("simapp-custom"), [8080])
+        self.assertIn(("GET", SERVICES_PATH), api.requests)
+
+    def test_given_service_already_patched_when_patch_then_service_is_not_patched_again(self):
+        with FakeKubernetesApi() as api:
+            api.add_service("simapp", 8080)
+            harness = self._begin()
+
+            harness.charm.service_patcher._patch(None)
+
+        self.assertEqual(api.requests, [("GET", f"{SERVICES_PATH}/simapp")])
+
+    def test_given_transient_errors_when_patch_then_requests_are_retried(self):
+        with FakeKubernetesApi(failures=2) as api:
+            api.add_service("simapp", 65535)
+            harness = self._begin()
+
+            with patch("kubernetes_service_patch.RETRY_BACKOFF", 0):
+                harness.charm.service_patcher._patch(None)
+
+        self.assertEqual(api.ports("simapp"), [8080])
+
+    def test_given_slow_api_server_when_patch_then_patch_gives_up_after_timeout(self):
+        with FakeKubernetesApi(latency=0.5) as api:
+            api.add_service("simapp", 65535)
+            harness = self._begin(timeout=0.1)
+
+            start = time.monotonic()
+            with patch("kubernetes_service_patch.RETRY_BACKOFF", 0):
+                with self.assertLogs(level="ERROR"):
+                    harness.charm.service_patcher._patch(None)
+
+            self.assertLess(time.monotonic() - start, 0.5 * 4)
+        self.assertEqual(api.ports("simapp"), [65535])
+
+    def test_given_trace_when_patch_then_every_request_is_traced(self):
+        traced = []
+
+        @contextmanager
+        def trace(name, **attributes):
+            traced.append((name, attributes["k8s.service.name"]))
+            yield
+
+        with FakeKubernetesApi() as api:
+            api.add_service("simapp", 65535)
+            harness = self._begin(**{"service-name": "simapp-custom"})
+            harness.charm.service_patcher._trace = trace
+
+            harness.charm.service_patcher._patch(None)
+
+        self.assertCountEqual(
+            traced,
+            [
+                ("kubernetes.get", "simapp-custom"),
+                ("kubernetes.get", "simapp"),
+                ("kubernetes.delete", "simapp"),
+                ("kubernetes.create", "simapp-custom"),
+                ("kubernetes.watch", "simapp-custom"),
+                ("kubernetes.patch", "simapp-custom"),
+            ],
+        )
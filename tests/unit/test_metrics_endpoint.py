@@ -0,0 +1,96 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import json
+import unittest
+
+from ops.charm import CharmBase
+from ops.testing import Harness
+
+from metrics_endpoint import MetricsEndpointProvider
+
+METADATA = """
+name: provider
+containers:
+  workload: {}
+provides:
+  metrics-endpoint:
+    interface: prometheus_scrape
+"""
+
+
+class _ProviderCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.metrics_endpoint = MetricsEndpointProvider(
+            self,
+            jobs=[{"job_name": "workload", "static_configs": [{"targets": ["*:9100"]}]}],
+            refresh_event=self.on.workload_pebble_ready,
+        )
+
+
+class TestMetricsEndpointProvider(unittest.TestCase):
+    def setUp(self):
+        self.harness = Harness(_ProviderCharm, meta=METADATA)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.set_model_name("whatever")
+        self.harness.add_network("10.0.0.10")
+        self.harness.begin()
+
+    def _relate(self) -> int:
+        relation_id = self.harness.add_relation("metrics-endpoint", "prometheus")
+        self.harness.add_relation_unit(relation_id, "prometheus/0")
+        return relation_id
+
+    def test_given_leader_when_relation_joined_then_scrape_jobs_and_metadata_are_published(self):
+        self.harness.set_leader(True)
+
+        relation_id = self._relate()
+
+        app_data = self.harness.get_relation_data(relation_id, "provider")
+        self.assertEqual(
+            json.loads(app_data["scrape_jobs"]),
+            [
+                {
+                    "job_name": "workload",
+                    "metrics_path": "/metrics",
+                    "static_configs": [{"targets": ["*:9100"]}],
+                }
+            ],
+        )
+        self.assertEqual(
+            json.loads(app_data["scrape_metadata"]),
+            {
+                "model": "whatever",
+                "model_uuid": self.harness.model.uuid,
+                "application": "provider",
+                "unit": "provider/0",
+                "charm_name": "provider",
+            },
+        )
+
+    def test_given_not_leader_when_relation_joined_then_only_unit_address_is_published(self):
+        relation_id = self._relate()
+
+        self.assertEqual(self.harness.get_relation_data(relation_id, "provider"), {})
+        self.assertEqual(
+            self.harness.get_relation_data(relation_id, "provider/0"),
+            {
+                "prometheus_scrape_unit_address": "10.0.0.10",
+                "prometheus_scrape_unit_name": "provider/0",
+            },
+        )
+
+    def test_given_unsupported_keys_when_update_scrape_job_spec_then_they_are_dropped(self):
+        self.harness.set_leader(True)
+        relation_id = self._relate()
+
+        self.harness.charm.metrics_endpoint.update_scrape_job_spec(
+            [{"static_configs": [{"targets": ["*:9200"]}], "honor_labels": True}]
+        )
+
+        app_data = self.harness.get_relation_data(relation_id, "provider")
+        self.assertEqual(
+            json.loads(app_data["scrape_jobs"]),
+            [{"metrics_path": "/metrics", "static_configs": [{"targets": ["*:9200"]}]}],
+        )
@@ -0,0 +1,107 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import unittest
+from unittest.mock import patch
+
+from ops.charm import CharmBase
+from ops.pebble import Layer
+from ops.testing import Harness
+
+from pebble_cache import PebbleQueryCache
+
+METADATA = """
+name: cache-tester
+containers:
+  workload:
+    resource: workload-image
+resources:
+  workload-image:
+    type: oci-image
+"""
+CONFIG_PATH = "/etc/workload/config.yaml"
+LAYER = Layer({"services": {"workload": {"override": "replace", "command": "/bin/workload"}}})
+
+
+class _TestCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.pebble = PebbleQueryCache(
+            self, self.unit.get_container("workload"), refresh_events=[self.on.config_changed]
+        )
+        self.connected = []
+        self.framework.observe(self.on.config_changed, self._on_config_changed)
+
+    def _on_config_changed(self, _):
+        self.connected.append(self.pebble.can_connect())
+
+
+class TestPebbleQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.harness = Harness(_TestCharm, meta=METADATA)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.set_can_connect("workload", True)
+        self.harness.begin()
+        self.pebble = self.harness.charm.pebble
+
+    def test_given_repeated_queries_when_query_then_pebble_is_queried_once(self):
+        with patch("ops.model.Container.exists", return_value=True) as patch_exists:
+            self.assertTrue(self.pebble.exists(CONFIG_PATH))
+            self.assertTrue(self.pebble.exists(CONFIG_PATH))
+
+        patch_exists.assert_called_once_with(CONFIG_PATH)
+        self.assertEqual(self.pebble.hits["exists"], 1)
+        self.assertEqual(self.pebble.misses["exists"], 1)
+
+    def test_given_file_pushed_through_cache_when_query_then_file_is_queried_again(self):
+        self.assertFalse(self.pebble.exists(CONFIG_PATH))
+
+        self.pebble.push(CONFIG_PATH, "a: b\n", make_dirs=True)
+
+        self.assertTrue(self.pebble.exists(CONFIG_PATH))
+        self.assertEqual(self.pebble.hits["exists"], 0)
+
+    def test_given_file_pushed_through_cache_when_query_parent_then_parent_is_queried_again(self):
+        self.assertFalse(self.pebble.exists("/etc/workload"))
+
+        self.pebble.push(CONFIG_PATH, "a: b\n", make_dirs=True)
+
+        self.assertTrue(self.pebble.exists("/etc/workload"))
+
+    def test_given_directory_removed_through_cache_when_query_child_then_child_is_queried_again(
+        self,
+    ):
+        self.pebble.push(CONFIG_PATH, "a: b\n", make_dirs=True)
+        self.assertTrue(self.pebble.exists(CONFIG_PATH))
+
+        self.pebble.remove_path("/etc/workload", recursive=True)
+
+        self.assertFalse(self.pebble.exists(CONFIG_PATH))
+
+    def test_given_command_run_through_cache_when_query_file_then_file_is_queried_again(self):
+        self.pebble.exists(CONFIG_PATH)
+        self.pebble.can_connect()
+
+        with patch("ops.model.Container.exec"):
+            self.pebble.exec(["touch", CONFIG_PATH])
+        self.pebble.exists(CONFIG_PATH)
+        self.pebble.can_connect()
+
+        self.assertEqual(self.pebble.misses["exists"], 2)
+        self.assertEqual(self.pebble.hits["can_connect"], 1)
+
+    def test_given_layer_added_through_cache_when_get_plan_then_plan_is_queried_again(self):
+        self.assertEqual(self.pebble.get_plan().services, {})
+
+        self.pebble.add_layer("workload", LAYER, combine=True)
+
+        self.assertIn("workload", self.pebble.get_plan().services)
+
+    def test_given_refresh_event_when_emitted_then_cache_is_cleared_before_charm_handles_it(self):
+        self.harness.charm.on.config_changed.emit()
+        self.harness.set_can_connect("workload", False)
+
+        self.harness.charm.on.config_changed.emit()
+
+        self.assertEqual(self.harness.charm.connected, [True, False])
+        self.assertEqual(self.pebble.hits["can_connect"], 0)
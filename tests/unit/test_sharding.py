@@ -0,0 +1,121 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import unittest
+
+import yaml
+
+from config_validator import validate_config
+from sharding import shard_config, unit_shard
+
+
+def _subscriber(start: str, end: str) -> dict:
+    return {
+        "key": "k",
+        "opc": "o",
+        "plmnId": "00101",
+        "sequenceNumber": "1",
+        "ueId-start": start,
+        "ueId-end": end,
+    }
+
+
+def _device_group(name: str, start: str, end: str) -> dict:
+    return {"name": name, "imsi-ranges": [{"start": start, "end": end}]}
+
+
+CONFIG = {
+    "configuration": {
+        "device-groups": [
+            _device_group("group-b", "001010000000010", "001010000000015"),
+            _device_group("group-a", "001010000000000", "001010000000003"),
+            _device_group("group-c", "001010000000016", "001010000000019"),
+        ],
+        "network-slices": [
+            {"name": "slice-1", "site-device-group": ["group-b", "group-c"]},
+            {"name": "slice-2", "site-device-group": ["group-a"]},
+        ],
+        "sub-provision-endpt": {"addr": "webui", "port": 5000},
+        "subscribers": [
+            _subscriber("001010000000030", "001010000000039"),
+            _subscriber("001010000000010", "001010000000019"),
+            _subscriber("001010000000000", "001010000000003"),
+        ],
+    },
+    "info": {"version": "1.0.0"},
+}
+
+
+class TestSharding(unittest.TestCase):
+    def test_given_peer_units_when_unit_shard_then_index_follows_unit_numbers(self):
+        shard = unit_shard("simapp/10", ["simapp/2", "simapp/0"])
+
+        self.assertEqual(shard, (2, 3))
+
+    def test_given_single_shard_when_shard_config_then_config_is_unchanged(self):
+        self.assertEqual(shard_config(CONFIG, 0, 1), CONFIG)
+
+    def test_given_two_shards_when_shard_config_then_slices_are_kept_with_their_device_groups(
+        self,
+    ):
+        first = shard_config(CONFIG, 0, 2)["configuration"]
+        second = shard_config(CONFIG, 1, 2)["configuration"]
+
+        self.assertEqual(
+            [device_group["name"] for device_group in first["device-groups"]],
+            ["group-b", "group-c"],
+        )
+        self.assertEqual(
+            [network_slice["name"] for network_slice in first["network-slices"]], ["slice-1"]
+        )
+        self.assertEqual(
+            [device_group["name"] for device_group in second["device-groups"]], ["group-a"]
+        )
+        self.assertEqual(
+            [network_slice["name"] for network_slice in second["network-slices"]], ["slice-2"]
+        )
+
+    def test_given_two_shards_when_shard_config_then_subscribers_follow_their_device_groups(
+        self,
+    ):
+        first = shard_config(CONFIG, 0, 2)["configuration"]["subscribers"]
+        second = shard_config(CONFIG, 1, 2)["configuration"]["subscribers"]
+
+        self.assertEqual(
+            first,
+            [
+                _subscriber("001010000000010", "001010000000019"),
+                _subscriber("001010000000030", "001010000000034"),
+            ],
+        )
+        self.assertEqual(
+            second,
+            [
+                _subscriber("001010000000000", "001010000000003"),
+                _subscriber("001010000000035", "001010000000039"),
+            ],
+        )
+
+    def test_given_three_shards_when_shard_config_then_every_subscriber_is_in_one_shard(self):
+        shards = [shard_config(CONFIG, index, 3)["configuration"] for index in range(3)]
+
+        imsis = sorted(
+            imsi
+            for shard in shards
+            for subscriber in shard["subscribers"]
+            for imsi in range(int(subscriber["ueId-start"]), int(subscriber["ueId-end"]) + 1)
+        )
+        self.assertEqual(
+            imsis,
+            list(range(1010000000000, 1010000000004))
+            + list(range(1010000000010, 1010000000020))
+            + list(range(1010000000030, 1010000000040)),
+        )
+
+    def test_given_default_config_when_shard_config_then_every_shard_is_valid(self):
+        with open("src/files/default_config.yaml") as f:
+            config = yaml.safe_load(f)
+
+        for count in (2, 3):
+            for index in range(count):
+                validate_config(shard_config(config, index, count))
@@ -0,0 +1,140 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import unittest
+
+import yaml
+
+from simapp_config import (
+    compact_config,
+    compact_imsis,
+    device_group_imsis,
+    expand_imsi_range,
+    render_config,
+)
+
+
+class TestSimappConfig(unittest.TestCase):
+    def test_given_range_with_leading_zeros_when_expand_imsi_range_then_width_is_preserved(self):
+        imsis = list(expand_imsi_range("001010000000009", "001010000000011"))
+
+        self.assertEqual(imsis, ["001010000000009", "001010000000010", "001010000000011"])
+
+    def test_given_explicit_imsis_and_ranges_when_device_group_imsis_then_all_imsis_are_yielded(
+        self,
+    ):
+        device_group = {
+            "imsis": ["208930100000001"],
+            "imsi-ranges": [{"start": "208930100000010", "end": "208930100000011"}],
+        }
+
+        imsis = list(device_group_imsis(device_group))
+
+        self.assertEqual(imsis, ["208930100000001", "208930100000010", "208930100000011"])
+
+    def test_given_device_group_with_imsi_ranges_when_render_config_then_imsis_are_expanded(self):
+        config = {
+            "configuration": {
+                "device-groups": [
+                    {
+                        "imsi-ranges": [{"start": "208930100007487", "end": "208930100007489"}],
+                        "name": "group1",
+                    }
+                ],
+                "provision-network-slice": True,
+            },
+        }
+
+        rendered = yaml.safe_load("".join(render_config(config)))
+
+        self.assertEqual(
+            rendered,
+            {
+                "configuration": {
+                    "device-groups": [
+                        {
+                            "imsis": ["208930100007487", "208930100007488", "208930100007489"],
+                            "name": "group1",
+                        }
+                    ],
+                    "provision-network-slice": True,
+                },
+            },
+        )
+
+    def test_given_list_starting_with_null_when_render_config_then_every_item_is_rendered(self):
+        config = {"a": [None, 1, 2], "b": []}
+
+        rendered = "".join(render_config(config))
+
+        self.assertEqual(rendered, yaml.safe_dump(config, sort_keys=False))
+
+    def test_given_large_imsi_range_when_render_config_then_output_is_yielded_in_bounded_chunks(
+        self,
+    ):
+        chunk_size = 4096
+        config = {
+            "configuration": {
+                "device-groups": [
+                    {
+                        "imsi-ranges": [{"start": "208930100000000", "end": "208930100099999"}],
+                        "name": "group1",
+                    }
+                ],
+            },
+        }
+
+        chunks = list(render_config(config, chunk_size=chunk_size))
+
+        self.assertGreater(len(chunks), 100)
+        self.assertTrue(all(len(chunk) < 32 * 1024 for chunk in chunks))
+
+    def test_given_unsorted_imsis_and_ranges_when_compact_imsis_then_they_are_coalesced(self):
+        imsis = ["208930100000003", "208930100000001", "208930100000002", "208930100000009"]
+        imsi_ranges = [{"start": "208930100000004", "end": "208930100000005"}]
+
+        compacted = compact_imsis(imsis, imsi_ranges)
+
+        self.assertEqual(
+            compacted,
+            [
+                {"start": "208930100000001", "end": "208930100000005"},
+                {"start": "208930100000009", "end": "208930100000009"},
+            ],
+        )
+
+    def test_given_imsis_of_different_widths_when_compact_imsis_then_they_are_not_coalesced(self):
+        compacted = compact_imsis(["01010000000010", "001010000000009"])
+
+        self.assertEqual(
+            compacted,
+            [
+                {"start": "01010000000010", "end": "01010000000010"},
+                {"start": "001010000000009", "end": "001010000000009"},
+            ],
+        )
+
+    def test_given_explicit_imsis_when_compact_config_then_rendered_imsis_are_sorted(self):
+        config = {
+            "configuration": {
+                "device-groups": [
+                    {
+                        "name": "group1",
+                        "imsis": [str(208930100000000 + imsi) for imsi in (2, 0, 1, 5, 3, 4)],
+                        "site-info": "aiab",
+                    }
+                ],
+            },
+        }
+
+        compacted, compaction = compact_config(config)
+
+        device_group = compacted["configuration"]["device-groups"][0]
+        self.assertEqual(list(device_group), ["name", "imsi-ranges", "site-info"])
+        self.assertEqual((compaction.entries, compaction.ranges, compaction.ratio), (6, 1, 6.0))
+        rendered = yaml.safe_load("".join(render_config(compacted)))
+        self.assertEqual(
+            rendered["configuration"]["device-groups"][0]["imsis"],
+            [str(208930100000000 + imsi) for imsi in range(6)],
+        )
+        self.assertEqual(len(config["configuration"]["device-groups"][0]["imsis"]), 6)
@@ -0,0 +1,120 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import Mock
+
+from snapshot_store import SnapshotError, SnapshotStore
+
+
+class TestSnapshotStore(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.store = SnapshotStore(self.root / "snapshots", history=3)
+        self.destination = self.root / "simapp.yaml"
+
+    def _blobs(self) -> list:
+        return sorted(os.listdir(self.root / "snapshots" / "blobs"))
+
+    def test_given_chunks_streamed_through_recorder_when_recording_then_revision_is_added(self):
+        with self.store.recording("configure-network") as recorder:
+            consumed = list(recorder.tee(["a: ", b"b\n"]))
+
+        self.assertEqual(consumed, ["a: ", b"b\n"])
+        revision = self.store.revision(1)
+        self.assertEqual(revision.size, 5)
+        self.assertEqual(revision.source, "configure-network")
+        self.assertEqual(self._blobs(), [f"{revision.digest}.gz"])
+
+    def test_given_same_content_saved_twice_when_save_then_blob_is_stored_once(self):
+        first = self.store.save(["a: b\n"], source="default-config")
+        second = self.store.save(["a: b\n"], source="default-config")
+
+        self.assertEqual((first.revision, second.revision), (1, 2))
+        self.assertEqual(first.digest, second.digest)
+        self.assertEqual(len(self._blobs()), 1)
+
+    def test_given_full_history_when_save_then_oldest_revision_and_its_blob_are_evicted(self):
+        for index in range(4):
+            self.store.save([f"index: {index}\n"], source="generate-subscribers")
+
+        self.assertEqual([revision.revision for revision in self.store.revisions()], [2, 3, 4])
+        self.assertEqual(len(self._blobs()), 3)
+
+    def test_given_block_raises_when_recording_then_nothing_is_recorded(self):
+        with self.assertRaises(ValueError):
+            with self.store.recording("configure-network") as recorder:
+                for _ in recorder.tee(["a: b\n"]):
+                    raise ValueError("push failed")
+
+        self.assertEqual(self.store.revisions(), [])
+        self.assertEqual(self._blobs(), [])
+
+    def test_given_previous_revision_when_rollback_then_file_is_restored_and_recorded(self):
+        self.store.save(["a: b\n"], source="configure-network")
+        self.store.save(["a: c\n"], source="configure-network")
+        self.destination.write_text("a: c\n")
+
+        restored = self.store.rollback(None, self.destination)
+
+        self.assertEqual(restored.revision, 1)
+        self.assertEqual(self.destination.read_text(), "a: b\n")
+        latest = self.store.revisions()[-1]
+        self.assertEqual((latest.revision, latest.digest), (3, restored.digest))
+        self.assertEqual(latest.source, "rollback to 1")
+        self.assertEqual(sorted(os.listdir(self.root)), ["simapp.yaml", "snapshots"])
+
+    def test_given_unknown_revision_when_rollback_then_error_lists_available_revisions(self):
+        self.store.save(["a: b\n"], source="configure-network")
+
+        with self.assertRaises(SnapshotError) as e:
+            self.store.rollback(7, self.destination)
+
+        self.assertEqual(e.exception.message, "Unknown revision 7, available revisions: 1")
+
+    def test_given_malformed_index_when_revisions_then_snapshot_error_is_raised(self):
+        (self.root / "snapshots").mkdir()
+        for index in ("{}", "[]", '{"revisions": [{"revision": 1}]}'):
+            (self.root / "snapshots" / "index.json").write_text(index)
+
+            with self.assertRaises(SnapshotError) as e:
+                self.store.revisions()
+
+            self.assertTrue(e.exception.message.startswith("Malformed snapshot index"))
+
+    def test_given_corrupted_blob_when_restore_then_destination_is_left_untouched(self):
+        revision = self.store.save(["a: b\n"], source="configure-network")
+        (self.root / "snapshots" / "blobs" / f"{revision.digest}.gz").write_bytes(b"garbage")
+        self.destination.write_text("a: c\n")
+
+        with self.assertRaises(SnapshotError):
+            self.store.restore(revision, self.destination)
+
+        self.assertEqual(self.destination.read_text(), "a: c\n")
+        self.assertEqual(sorted(os.listdir(self.root)), ["simapp.yaml", "snapshots"])
+
+    def test_given_store_cant_be_created_when_recording_then_chunks_are_passed_through(self):
+        (self.root / "snapshots").write_text("not a directory")
+
+        with self.assertRaises(SnapshotError):
+            with self.store.recording("configure-network") as recorder:
+                consumed = list(recorder.tee(["a: ", b"b\n"]))
+
+        self.assertEqual(consumed, ["a: ", b"b\n"])
+
+    def test_given_write_fails_when_recording_then_chunks_are_passed_through_and_blob_removed(
+        self,
+    ):
+        with self.assertRaises(SnapshotError):
+            with self.store.recording("configure-network") as recorder:
+                recorder._file.write = Mock(side_effect=OSError(28, "No space left on device"))
+                consumed = list(recorder.tee(["a: ", b"b\n"]))
+
+        self.assertEqual(consumed, ["a: ", b"b\n"])
+        self.assertEqual(self.store.revisions(), [])
+        self.assertEqual(self._blobs(), [])
@@ -0,0 +1,112 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import gzip
+import io
+import tracemalloc
+import unittest
+from unittest.mock import Mock
+
+from ops.pebble import ExecError
+
+from simapp_config import render_config
+from streaming_push import ChunkedReader, gunzip_chunks, push_stream, read_chunks
+
+
+class FakeContainer:
+    """Container stand-in consuming pushed sources the way Pebble does, in 8KiB reads."""
+
+    def __init__(self, keep_content: bool = True):
+        self.keep_content = keep_content
+        self.files: dict = {}
+        self.exec = Mock()
+
+    def push(self, path, source, permissions=None):
+        content = io.BytesIO()
+        while chunk := source.read(8192):
+            if self.keep_content:
+                content.write(chunk)
+        self.files[path] = content.getvalue()
+
+    def pull(self, path, encoding="utf-8"):
+        return io.BytesIO(self.files[path])
+
+    def remove_path(self, path):
+        del self.files[path]
+
+
+class TestStreamingPush(unittest.TestCase):
+    def test_given_text_and_bytes_chunks_when_read_then_concatenated_bytes_are_returned(self):
+        reader = ChunkedReader(["abc", b"def", "", "ghi"])
+
+        self.assertEqual(reader.read(), b"abcdefghi")
+        self.assertEqual(reader.bytes_read, 9)
+
+    def test_given_open_file_when_read_chunks_then_file_is_yielded_in_fixed_size_chunks(self):
+        chunks = list(read_chunks(io.StringIO("a" * 10), chunk_size=4))
+
+        self.assertEqual(chunks, ["aaaa", "aaaa", "aa"])
+
+    def test_given_chunks_when_push_stream_then_file_is_pushed(self):
+        container = FakeContainer()
+
+        pushed_bytes = push_stream(container, "/simapp/config/simapp.yaml", ["a: ", "1\n"])
+
+        self.assertEqual(container.files, {"/simapp/config/simapp.yaml": b"a: 1\n"})
+        self.assertEqual(pushed_bytes, 5)
+
+    def test_given_compress_when_push_stream_then_gzip_file_is_pushed_and_unpacked(self):
+        container = FakeContainer()
+
+        push_stream(container, "/simapp/config/simapp.yaml", ["a: 1\n"] * 1000, compress=True)
+
+        self.assertEqual(
+            gzip.decompress(container.files["/simapp/config/simapp.yaml.gz"]),
+            b"a: 1\n" * 1000,
+        )
+        container.exec.assert_called_once_with(["gunzip", "-f", "/simapp/config/simapp.yaml.gz"])
+
+    def test_given_gunzip_fails_when_push_stream_then_file_is_unpacked_by_charm_and_pushed(self):
+        container = FakeContainer()
+        container.exec.return_value.wait.side_effect = ExecError(["gunzip"], 127, None, None)
+
+        pushed_bytes = push_stream(
+            container, "/simapp/config/simapp.yaml", ["a: 1\n"] * 1000, compress=True
+        )
+
+        self.assertEqual(container.files, {"/simapp/config/simapp.yaml": b"a: 1\n" * 1000})
+        self.assertGreater(pushed_bytes, 5000)
+
+    def test_given_highly_compressed_chunk_when_gunzip_chunks_then_output_chunks_are_bounded(self):
+        compressed = gzip.compress(b"\0" * 1024 * 1024)
+
+        chunks = list(gunzip_chunks([compressed], chunk_size=4096))
+
+        self.assertEqual(b"".join(chunks), b"\0" * 1024 * 1024)
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), 4096)
+
+    def test_given_large_synthetic_config_when_push_stream_then_peak_memory_stays_bounded(self):
+        memory_ceiling = 1024 * 1024
+        config = {
+            "configuration": {
+                "device-groups": [
+                    {
+                        "imsi-ranges": [{"start": "208930100000000", "end": "208930100249999"}],
+                        "name": "group1",
+                    }
+                ],
+            },
+        }
+        container = FakeContainer(keep_content=False)
+
+        tracemalloc.start()
+        try:
+            pushed_bytes = push_stream(
+                container, "/simapp/config/simapp.yaml", render_config(config)
+            )
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertGreater(pushed_bytes, 5 * memory_ceiling)
+        self.assertLess(peak, memory_ceiling)
@@ -0,0 +1,117 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import tracemalloc
+import unittest
+
+import yaml
+
+from config_validator import validate_config
+from simapp_config import render_config
+from subscriber_generator import RANDOM, Population, PopulationError, generate_config
+
+with open("src/files/default_config.yaml") as f:
+    DEFAULT_CONFIG = yaml.safe_load(f)
+
+
+class TestSubscriberGenerator(unittest.TestCase):
+    def test_given_population_when_generate_config_then_subscribers_are_split_in_batches(self):
+        population = Population(start_imsi="001010000000001", count=2500, batch_size=1000)
+
+        config = generate_config(DEFAULT_CONFIG, population)
+
+        subscribers = list(config["configuration"]["subscribers"])
+        self.assertEqual(
+            [(subscriber["ueId-start"], subscriber["ueId-end"]) for subscriber in subscribers],
+            [
+                ("001010000000001", "001010000001000"),
+                ("001010000001001", "001010000002000"),
+                ("001010000002001", "001010000002500"),
+            ],
+        )
+        self.assertEqual(population.batches, 3)
+        self.assertEqual(subscribers[0]["plmnId"], "20893")
+
+    def test_given_same_seed_when_generate_config_then_credentials_are_reproducible(self):
+        population = Population(start_imsi="001010000000001", count=10, batch_size=1)
+
+        first = list(generate_config(DEFAULT_CONFIG, population)["configuration"]["subscribers"])
+        second = list(generate_config(DEFAULT_CONFIG, population)["configuration"]["subscribers"])
+
+        self.assertEqual(first, second)
+        self.assertEqual(len({subscriber["key"] for subscriber in first}), 10)
+        self.assertEqual(len(first[0]["key"]), 32)
+        self.assertEqual(len(first[0]["opc"]), 32)
+        self.assertEqual(len(first[0]["sequenceNumber"]), 12)
+
+    def test_given_random_credentials_when_generate_config_then_credentials_differ(self):
+        population = Population(
+            start_imsi="001010000000001", count=2, batch_size=1, credentials=RANDOM
+        )
+
+        subscribers = list(
+            generate_config(DEFAULT_CONFIG, population)["configuration"]["subscribers"]
+        )
+
+        self.assertNotEqual(subscribers[0]["key"], subscribers[1]["key"])
+
+    def test_given_device_groups_and_slices_when_generate_config_then_config_is_valid(self):
+        population = Population(
+            start_imsi="001010000000001", count=1000, device_groups=4, network_slices=2
+        )
+
+        config = generate_config(DEFAULT_CONFIG, population)
+
+        configuration = config["configuration"]
+        self.assertEqual(
+            [group["imsi-ranges"] for group in configuration["device-groups"]],
+            [
+                [{"start": "001010000000001", "end": "001010000000250"}],
+                [{"start": "001010000000251", "end": "001010000000500"}],
+                [{"start": "001010000000501", "end": "001010000000750"}],
+                [{"start": "001010000000751", "end": "001010000001000"}],
+            ],
+        )
+        self.assertEqual(
+            [
+                (network_slice["slice-id"]["sd"], network_slice["site-device-group"])
+                for network_slice in configuration["network-slices"]
+            ],
+            [
+                ("010203", ["load-test-group1", "load-test-group3"]),
+                ("010204", ["load-test-group2", "load-test-group4"]),
+            ],
+        )
+        validate_config(
+            {
+                **config,
+                "configuration": {
+                    **configuration,
+                    "subscribers": list(configuration["subscribers"]),
+                },
+            }
+        )
+
+    def test_given_population_overflowing_imsi_width_when_population_then_error_is_raised(self):
+        with self.assertRaises(PopulationError) as e:
+            Population(start_imsi="999", count=2)
+
+        self.assertEqual(e.exception.message, "2 subscribers don't fit after 999")
+
+    def test_given_more_slices_than_device_groups_when_population_then_error_is_raised(self):
+        with self.assertRaises(PopulationError):
+            Population(start_imsi="001010000000001", count=10, network_slices=2)
+
+    def test_given_large_population_when_rendered_then_memory_stays_bounded(self):
+        population = Population(start_imsi="001010000000001", count=100000, batch_size=100)
+        config = generate_config(DEFAULT_CONFIG, population)
+
+        tracemalloc.start()
+        try:
+            for _ in render_config(config):
+                pass
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertLess(peak, 1024 * 1024)
@@ -0,0 +1,189 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import patch
+
+from tracing import (
+    CLIENT,
+    STATUS_ERROR,
+    Tracer,
+    otlp_http_endpoint,
+    post_trace,
+    write_trace_file,
+)
+
+
+class TestTracer(unittest.TestCase):
+    def test_given_nested_spans_when_ended_then_children_are_parented_to_enclosing_span(self):
+        tracer = Tracer("test")
+
+        with tracer.span("handler") as handler:
+            with tracer.client_span("pebble.push", path="/a") as push:
+                push.set("pebble.push.bytes", 12)
+
+        self.assertEqual([span.name for span in tracer.spans], ["pebble.push", "handler"])
+        self.assertEqual(push.parent_span_id, handler.span_id)
+        self.assertEqual(handler.parent_span_id, "")
+        self.assertEqual(push.kind, CLIENT)
+        self.assertEqual(push.attributes, {"path": "/a", "pebble.push.bytes": 12})
+        self.assertLessEqual(handler.start_time, push.start_time)
+        self.assertLessEqual(push.end_time, handler.end_time)
+
+    def test_given_activated_root_span_when_span_recorded_then_span_is_child_of_root(self):
+        tracer = Tracer("test")
+        root = tracer.start("dispatch")
+        tracer.activate(root)
+
+        with tracer.span("handler") as handler:
+            pass
+
+        self.assertEqual(handler.parent_span_id, root.span_id)
+
+    def test_given_block_raises_when_span_then_span_is_failed_and_error_is_raised(self):
+        tracer = Tracer("test")
+
+        with self.assertRaises(ValueError):
+            with tracer.span("handler"):
+                raise ValueError("boom")
+
+        self.assertEqual(tracer.spans[0].status_code, STATUS_ERROR)
+        self.assertEqual(tracer.spans[0].status_message, "ValueError('boom')")
+
+    def test_given_concurrent_tasks_when_spans_recorded_then_each_is_child_of_its_task_span(self):
+        tracer = Tracer("test")
+
+        async def request(name: str) -> None:
+            with tracer.client_span(name):
+                await asyncio.sleep(0)
+                with tracer.span(f"{name}.retry"):
+                    await asyncio.sleep(0)
+
+        async def patch_service() -> None:
+            with tracer.span("patch"):
+                await asyncio.gather(request("apply"), request("delete"))
+
+        asyncio.run(patch_service())
+
+        spans = {span.name: span for span in tracer.spans}
+        self.assertEqual(spans["apply"].parent_span_id, spans["patch"].span_id)
+        self.assertEqual(spans["delete"].parent_span_id, spans["patch"].span_id)
+        self.assertEqual(spans["apply.retry"].parent_span_id, spans["apply"].span_id)
+        self.assertEqual(spans["delete.retry"].parent_span_id, spans["delete"].span_id)
+
+    def test_given_spans_when_to_otlp_then_document_follows_otlp_json_encoding(self):
+        tracer = Tracer("simapp-charm", {"juju.unit": "simapp/0"})
+        with tracer.span("handler", size=3, ratio=0.5, cached=True):
+            pass
+
+        document = tracer.to_otlp()
+
+        resource_spans = document["resourceSpans"][0]
+        self.assertEqual(
+            resource_spans["resource"]["attributes"],
+            [
+                {"key": "service.name", "value": {"stringValue": "simapp-charm"}},
+                {"key": "juju.unit", "value": {"stringValue": "simapp/0"}},
+            ],
+        )
+        span = resource_spans["scopeSpans"][0]["spans"][0]
+        self.assertEqual(len(span["traceId"]), 32)
+        self.assertEqual(len(span["spanId"]), 16)
+        self.assertNotIn("parentSpanId", span)
+        self.assertIsInstance(span["startTimeUnixNano"], str)
+        self.assertEqual(
+            span["attributes"],
+            [
+                {"key": "size", "value": {"intValue": "3"}},
+                {"key": "ratio", "value": {"doubleValue": 0.5}},
+                {"key": "cached", "value": {"boolValue": True}},
+            ],
+        )
+
+
+class TestTraceExport(unittest.TestCase):
+    def test_given_trace_file_when_write_trace_file_then_documents_are_appended_as_lines(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "traces", "traces.jsonl")
+
+            write_trace_file(path, {"resourceSpans": []})
+            write_trace_file(path, {"resourceSpans": [{}]})
+
+            with open(path) as f:
+                lines = f.read().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines], [{"resourceSpans": []}, {"resourceSpans": [{}]}]
+        )
+
+    def test_given_full_trace_file_when_write_trace_file_then_file_is_rotated(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "traces.jsonl")
+
+            with patch("tracing.TRACE_FILE_MAX_BYTES", 10):
+                write_trace_file(path, {"resourceSpans": []})
+                write_trace_file(path, {"resourceSpans": [{}]})
+
+            with open(path) as f, open(f"{path}.1") as rotated:
+                self.assertEqual(json.loads(f.read()), {"resourceSpans": [{}]})
+                self.assertEqual(json.loads(rotated.read()), {"resourceSpans": []})
+
+    def test_given_collector_when_post_trace_then_document_is_posted_to_traces_path(self):
+        received = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):  # noqa: N802
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                received.append((self.path, self.headers["Content-Type"], json.loads(body)))
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):  # noqa: A002
+                pass
+
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=server.handle_request)
+        thread.start()
+        try:
+            post_trace(f"http://127.0.0.1:{server.server_address[1]}/", {"resourceSpans": []})
+        finally:
+            thread.join()
+            server.server_close()
+
+        self.assertEqual(received, [("/v1/traces", "application/json", {"resourceSpans": []})])
+
+    def test_given_invalid_endpoint_when_post_trace_then_os_error_is_raised(self):
+        for endpoint in ("tempo:4318", "http://tempo:port"):
+            with self.assertRaises(OSError):
+                post_trace(endpoint, {"resourceSpans": []})
+
+    def test_given_receivers_when_otlp_http_endpoint_then_otlp_http_url_is_returned(self):
+        receivers = json.dumps(
+            [
+                {"protocol": {"name": "otlp_grpc", "type": "grpc"}, "url": "tempo:4317"},
+                {"protocol": {"name": "otlp_http", "type": "http"}, "url": "http://tempo:4318"},
+            ]
+        )
+
+        self.assertEqual(otlp_http_endpoint(receivers), "http://tempo:4318")
+
+    def test_given_no_or_invalid_receivers_when_otlp_http_endpoint_then_none_is_returned(self):
+        self.assertIsNone(otlp_http_endpoint(None))
+        self.assertIsNone(otlp_http_endpoint('[{"protocol": "otlp_http"}]'))
+        self.assertIsNone(otlp_http_endpoint("not json"))
+
+    def test_given_receiver_url_without_scheme_when_otlp_http_endpoint_then_none_is_returned(
+        self,
+    ):
+        receivers = json.dumps(
+            [{"protocol": {"name": "otlp_http", "type": "http"}, "url": "tempo:4318"}]
+        )
+
+        with self.assertLogs("tracing", level="WARNING"):
+            self.assertIsNone(otlp_http_endpoint(receivers))